@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+# Benchmarks reproducibles de la cola, el listado, las subidas y el procesamiento.
+# Uso (desde app/api):  python benchmark.py --suites queue,listing,upload,transcode --output results.json
+# Todo se ejecuta sobre un directorio temporal con una copia de config.json; nunca toca los datos reales.
+
+CONFIG_FILE = Path(__file__).parent / "config" / "config.json"
+
+
+def build_config(work_dir: Path, overrides: dict = None) -> dict:
+    "Copy of config.json with every path inside `work_dir`."
+
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    files = {"queue": "queue", "queue_db": "queue", "index": "index"}
+    for key, value in config["path"].items():
+        config["path"][key] = str(work_dir / files[key] / Path(value).name) if key in files else str(work_dir / key)
+    for section, values in (overrides or {}).items():
+        config.setdefault(section, {}).update(values)
+    return config
+
+
+def generate_video(path: Path, duration: float, size: str = "1280x720", rate: int = 30) -> Path:
+    "Render a synthetic H.264/AAC test video with ffmpeg's lavfi sources."
+
+    subprocess.run([
+        "ffmpeg", "-y", "-nostdin", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest",
+        str(path)
+    ], check=True)
+    return path
+
+
+def rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else None
+
+
+# --------------- [Suites] ---------------
+
+def bench_queue(work_dir: Path, sizes: list, backends: list, samples: int, json_max: int) -> list:
+    """
+    QueueManager ops/sec (add, get, update, claim) with the queue pre-filled to each size.
+
+    The queue is seeded with one batch insert. The JSON backend rewrites the whole file on
+    every write, so it is skipped above `json_max` tasks.
+    """
+
+    from core.manager import QueueManager
+
+    results = []
+    for backend in backends:
+        for size in sizes:
+            if backend == "json" and size > json_max:
+                print(f"queue json {size}: skipped (above --queue-json-max {json_max})", file=sys.stderr)
+                continue
+            case_dir = work_dir / f"queue-{backend}-{size}"
+            config = build_config(case_dir, {"processing": {"queue_backend": backend}})
+            Path(config["path"]["queue"]).parent.mkdir(parents=True, exist_ok=True)
+            manager = QueueManager(Path(config["path"]["queue"]), config)
+
+            start = time.perf_counter()
+            entries = [{"filename": f"video_{index:06d}.mp4"} for index in range(size)]
+            task_ids = []
+            # Un lote por cliente, como cuatro importaciones masivas
+            for client in range(4):
+                task_ids += [task["task_id"] for task in manager.add_tasks(entries[client::4], client=f"client{client}")]
+            seed_seconds = time.perf_counter() - start
+
+            adds = min(samples, size)
+            start = time.perf_counter()
+            for index in range(adds):
+                manager.add_task(f"extra_{index:06d}.mp4", client=f"client{index % 4}")
+            add_seconds = time.perf_counter() - start
+
+            picks = random.Random(0).sample(task_ids, min(samples, size))
+            start = time.perf_counter()
+            for task_id in picks:
+                manager.get_task(task_id)
+            get_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for task_id in picks:
+                manager.update_task_progress(task_id, {"percent": 50.0})
+            update_seconds = time.perf_counter() - start
+
+            claims = min(samples, size)
+            start = time.perf_counter()
+            for _ in range(claims):
+                manager.claim_task("benchmark", 60)
+            claim_seconds = time.perf_counter() - start
+
+            results.append({
+                "backend": backend,
+                "tasks": size,
+                "seed_per_second": rate(size, seed_seconds),
+                "add_per_second": rate(adds, add_seconds),
+                "get_per_second": rate(len(picks), get_seconds),
+                "update_per_second": rate(len(picks), update_seconds),
+                "claim_per_second": rate(claims, claim_seconds),
+            })
+            print(f"queue {backend} {size}: {results[-1]}", file=sys.stderr)
+            shutil.rmtree(case_dir, ignore_errors=True)
+    return results
+
+
+def bench_listing(work_dir: Path, counts: list, limit: int, repeat: int) -> list:
+    "FileLibrary page latency with N files, cold (empty metadata cache) and warm."
+
+    from core.library import FileLibrary
+    from core.metadata import MetadataCache
+    from core.validate import FileValidator
+    from utils import format_size
+
+    info = {"video_streams": [{"codec": "h264", "resolution": "1280x720", "fps": "30 fps"}], "audio_streams": [], "duration": 10.0}
+
+    async def page(library: FileLibrary, sort: str) -> float:
+        start = time.perf_counter()
+        await library.list_files(sort=sort, order="asc", limit=limit)
+        return time.perf_counter() - start
+
+    results = []
+    for count in counts:
+        case_dir = work_dir / f"listing-{count}"
+        config = build_config(case_dir)
+        uploads = Path(config["path"]["uploads"])
+        uploads.mkdir(parents=True)
+        for index in range(count):
+            with open(uploads / f"video_{index:06d}.mp4", "wb") as f:
+                f.truncate(index + 1)
+
+        # Sonda instantánea: se mide el listado y la caché, no ffprobe
+        cache = MetadataCache(Path(config["path"]["index"]), probe=lambda path: info, probe_concurrency=8)
+        library = FileLibrary(uploads, FileValidator(config["path"]), cache, probe_timeout=5, format_size=format_size)
+
+        cold = asyncio.run(page(library, "name"))
+        result = {"files": count, "limit": limit, "cold_ms": round(cold * 1000, 2)}
+        for sort in FileLibrary.SORT_KEYS:
+            timings = sorted(asyncio.run(page(library, sort)) for _ in range(repeat))
+            result[f"warm_{sort}_ms"] = round(timings[len(timings) // 2] * 1000, 2)
+        results.append(result)
+        print(f"listing {count}: {result}", file=sys.stderr)
+        shutil.rmtree(case_dir, ignore_errors=True)
+    return results
+
+
+def bench_upload(work_dir: Path, size_mb: int, repeat: int) -> list:
+    "Upload MB/s through the FastAPI app with an in-process ASGI client (multipart, raw and chunked)."
+
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("The upload benchmark needs httpx (pip install httpx)")
+
+    config = build_config(work_dir / "upload")
+    Path(config["path"]["queue"]).parent.mkdir(parents=True, exist_ok=True)
+    config_file = work_dir / "upload" / "config.json"
+    config_file.write_text(json.dumps(config))
+    os.environ["VAULT_CONFIG"] = str(config_file)
+    import main
+
+    payload = os.urandom(size_mb * 1024 * 1024)
+    chunk_size = 8 * 1024 * 1024
+    chunk_count = max(1, -(-len(payload) // chunk_size))
+
+    async def run() -> list:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def multipart(name):
+                response = await client.post("/api/uploads/", files={"file_uploads": (name, payload)})
+                response.raise_for_status()
+
+            async def raw(name):
+                response = await client.put(f"/api/uploads/raw/{name}", content=payload)
+                response.raise_for_status()
+
+            async def chunked(name):
+                upload_id = uuid.uuid4().hex
+                for index in range(chunk_count):
+                    data = {
+                        "dzuuid": upload_id, "dzchunkindex": index, "dztotalfilesize": len(payload),
+                        "dztotalchunkcount": chunk_count, "dzchunkbyteoffset": index * chunk_size,
+                    }
+                    chunk = payload[index * chunk_size:(index + 1) * chunk_size]
+                    response = await client.post("/api/uploads/chunk", data=data, files={"file_uploads": (name, chunk)})
+                    response.raise_for_status()
+                response = await client.post(f"/api/uploads/chunk/{upload_id}/finalize")
+                response.raise_for_status()
+
+            results = []
+            for kind, upload in (("multipart", multipart), ("raw", raw), ("chunked", chunked)):
+                timings = []
+                for attempt in range(repeat):
+                    start = time.perf_counter()
+                    # .bin: sin sondeo de metadatos en segundo plano
+                    await upload(f"{kind}_{attempt}.bin")
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                results.append({"kind": kind, "size_mb": size_mb, "best_mb_per_second": round(size_mb / best, 1), "mean_seconds": round(sum(timings) / len(timings), 3)})
+                print(f"upload {kind}: {results[-1]}", file=sys.stderr)
+            return results
+
+    return asyncio.run(run())
+
+
+def bench_transcode(work_dir: Path, worker_counts: list, videos: int, duration: float, profile: str) -> list:
+    "End-to-end throughput of the processor daemon for each worker count."
+
+    from core.manager import QueueManager
+    from core.daemon import ProcessorDaemon
+    from core.process import VideoProcessor
+    from core.validate import FileValidator
+    from core.logging import VideoLogger
+    from core.metadata import MetadataCache
+    from core.profile import TranscodeProfile
+    from utils import get_video_info
+
+    if not shutil.which("ffmpeg"):
+        print("transcode: ffmpeg not found, skipped", file=sys.stderr)
+        return []
+
+    source = generate_video(work_dir / "source.mp4", duration)
+    results = []
+    for workers in worker_counts:
+        case_dir = work_dir / f"transcode-{workers}"
+        config = build_config(case_dir, {"transcode": {"profile": profile}})
+        for key in ("uploads", "processed", "hls"):
+            Path(config["path"][key]).mkdir(parents=True)
+        Path(config["path"]["queue"]).parent.mkdir(parents=True, exist_ok=True)
+        for index in range(videos):
+            os.link(source, Path(config["path"]["uploads"]) / f"video_{index:03d}.mp4")
+
+        manager = QueueManager(Path(config["path"]["queue"]), config)
+        logger = VideoLogger(case_dir / "logs")
+        # Sin índice de contenido: las copias idénticas se reutilizarían en vez de codificarse
+        processor = VideoProcessor(
+            input_dir=Path(config["path"]["uploads"]),
+            output_dir=Path(config["path"]["processed"]),
+            queue_manager=manager,
+            file_validator=FileValidator(config["path"]),
+            logger=logger,
+            metadata_cache=MetadataCache(Path(config["path"]["index"]), probe=get_video_info),
+            profile=TranscodeProfile.from_config(config),
+            segmented=config["transcode"].get("segmented"),
+            hls={**config["transcode"].get("hls", {}), "directory": config["path"]["hls"]}
+        )
+        daemon = ProcessorDaemon(manager, processor, FileValidator(config["path"]), logger, check_interval=0.2, max_workers=workers)
+
+        task_ids = [manager.add_task(f"video_{index:03d}.mp4") for index in range(videos)]
+        start = time.perf_counter()
+        daemon.start()
+        while any(manager.find_task_status(task_id) in ("pending", "processing") for task_id in task_ids):
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+        daemon.stop()
+        logger.close()
+
+        completed = sum(manager.find_task_status(task_id) == "completed" for task_id in task_ids)
+        modes = sorted({manager.get_task(task_id).get("mode") for task_id in task_ids} - {None})
+        results.append({
+            "workers": workers,
+            "threads_per_worker": daemon.tuner.threads(),
+            "videos": videos,
+            "completed": completed,
+            "modes": modes,
+            "seconds": round(elapsed, 2),
+            "videos_per_minute": round(completed / elapsed * 60, 2),
+            "realtime_factor": round(completed * duration / elapsed, 2),
+        })
+        print(f"transcode {workers} workers: {results[-1]}", file=sys.stderr)
+        shutil.rmtree(case_dir, ignore_errors=True)
+    return results
+
+
+# --------------- [Entry point] ---------------
+
+def integers(value: str) -> list:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    "Run the selected suites and write the results as JSON."
+
+    parser = argparse.ArgumentParser(description="Vault benchmarks")
+    parser.add_argument("--suites", default="queue,listing,upload,transcode")
+    parser.add_argument("--output", type=Path, default=None, help="Results file (default: benchmark-<timestamp>.json)")
+    parser.add_argument("--queue-sizes", type=integers, default=[10_000, 100_000])
+    parser.add_argument("--queue-backends", default="sqlite,json")
+    parser.add_argument("--queue-json-max", type=int, default=10_000, help="Largest queue size run on the JSON backend")
+    parser.add_argument("--queue-samples", type=int, default=1000, help="get/update/claim operations per case")
+    parser.add_argument("--listing-files", type=integers, default=[1_000, 10_000, 50_000])
+    parser.add_argument("--listing-limit", type=int, default=100)
+    parser.add_argument("--upload-mb", type=int, default=256)
+    parser.add_argument("--transcode-workers", type=integers, default=[1, 2, 4])
+    parser.add_argument("--transcode-videos", type=int, default=8)
+    parser.add_argument("--transcode-duration", type=float, default=20)
+    parser.add_argument("--transcode-profile", default="always_encode", help="Profile from config.json; always_encode forces a real encode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary work directory")
+    args = parser.parse_args()
+
+    random.seed(0)
+    suites = [suite for suite in args.suites.split(",") if suite]
+    work_dir = Path(tempfile.mkdtemp(prefix="vault-benchmark-"))
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": shutil.which("ffmpeg") and subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0],
+        },
+        "arguments": {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()},
+        "results": {},
+    }
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent)
+        report["commit"] = commit.stdout.strip() or None
+    except OSError:
+        report["commit"] = None
+
+    try:
+        for suite in suites:
+            if suite == "queue":
+                report["results"]["queue"] = bench_queue(work_dir, args.queue_sizes, args.queue_backends.split(","), args.queue_samples, args.queue_json_max)
+            elif suite == "listing":
+                report["results"]["listing"] = bench_listing(work_dir, args.listing_files, args.listing_limit, args.repeat)
+            elif suite == "upload":
+                report["results"]["upload"] = bench_upload(work_dir, args.upload_mb, args.repeat)
+            elif suite == "transcode":
+                report["results"]["transcode"] = bench_transcode(
+                    work_dir, args.transcode_workers, args.transcode_videos, args.transcode_duration, args.transcode_profile
+                )
+            else:
+                raise SystemExit(f"Unknown suite: {suite}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    output = args.output or Path(f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.write_text(json.dumps(report, indent=4))
+    print(f"Results written to {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
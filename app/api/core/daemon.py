@@ -1,72 +1,257 @@
+import os
 import time
+import uuid
+import socket
 import threading
+from pathlib import Path
 from .manager import QueueManager
+from .notify import QueueNotifier
 from .logging import VideoLogger
 from .process import VideoProcessor
 from .validate import FileValidator
+from .space import SpaceLedger
+from .tuning import ConcurrencyTuner
+from .metrics import TASK_WAIT_SECONDS, TASK_RUN_SECONDS, ENCODE_CONCURRENCY, ENCODE_THROUGHPUT
+from datetime import datetime
 
 class ProcessorDaemon:
     """Daemon that manages the video processing queue."""
-    
-    def __init__(self, queue_manager: QueueManager, video_processor: VideoProcessor, file_validator: FileValidator, logger: VideoLogger, check_interval: int = 1):
+
+    def __init__(self, queue_manager: QueueManager, video_processor: VideoProcessor, file_validator: FileValidator, logger: VideoLogger, check_interval: int = 1, max_workers: int = 1, notifier: QueueNotifier = None, lease_seconds: float = 60, max_attempts: int = 3, retry_backoff: float = 30, space_ledger: SpaceLedger = None, space_retry: float = 60, tuner: ConcurrencyTuner = None, status_dir: Path = None):
         """
         Initialize the processor daemon.
-        
+
         Args:
             queue_manager: Instance of QueueManager for task handling
             video_processor: Instance of VideoProcessor for video processing
             logger: Instance of VideoLogger for logging
-            check_interval: How often to check the queue (in seconds)
+            check_interval: How often to rescan the queue when no wakeup arrives (in seconds)
+            max_workers: Number of videos processed concurrently (initially, when `tuner` adapts it)
+            notifier: Instance of QueueNotifier that wakes the workers when tasks are added
+            lease_seconds: How long a claimed task stays ours without a heartbeat
+            max_attempts: Attempts per task before a transient failure becomes final
+            retry_backoff: Delay before the first retry, doubled on every further attempt (in seconds)
+            space_ledger: Instance of SpaceLedger; each task reserves its estimated output size before it starts
+            space_retry: How long a task that does not fit on disk waits in the queue before trying again (in seconds)
+            tuner: Instance of ConcurrencyTuner that sets the concurrency, threads and CPUs of the jobs;
+                by default a fixed pool of `max_workers` sharing the CPUs evenly
+            status_dir: Where the tuner status is published for the API
         """
         self.queue_manager = queue_manager
         self.video_processor = video_processor
         self.file_validator = file_validator
         self.logger = logger
         self.check_interval = check_interval
+        self.notifier = notifier
+        self.wakeup = threading.Event()
+        self.tuner = tuner or ConcurrencyTuner(workers=max(1, max_workers))
+        self.status_dir = status_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.space_ledger = space_ledger
+        self.space_retry = space_retry
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leases = set()
+        self._leases_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._resized = threading.Condition()
         self.is_running = False
-        self.thread = None
-        
+        self.threads = []
+
     def start(self):
-        """Start the daemon process in a separate thread."""
-        self.logger.log_info("Starting processor daemon")
+        """Recover from a previous crash, then start the worker pool, one thread per possible concurrent job, the heartbeat and the tuner."""
+        self.logger.log_info(
+            f"Starting processor daemon {self.worker_id} with {self.tuner.concurrency} workers ({self.tuner.threads()} threads each)"
+            + (f", adaptive up to {self.tuner.max_workers}" if self.tuner.adaptive else "")
+        )
+        self._recover()
         self.is_running = True
-        self.thread = threading.Thread(target=self._process_queue)
-        self.thread.daemon = True  # El thread se cerrará cuando el programa principal termine
-        self.thread.start()
-        
+        self._stopping.clear()
+        self.threads = []
+        if self.notifier:
+            self.notifier.listen(self.wakeup)
+        # Un thread por cada hueco posible; los que superan la concurrencia actual esperan
+        for index in range(self.tuner.max_workers):
+            thread = threading.Thread(target=self._process_queue, args=(index,), name=f"processor-{index}")
+            thread.daemon = True  # El thread se cerrará cuando el programa principal termine
+            thread.start()
+            self.threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="processor-heartbeat", daemon=True)
+        heartbeat.start()
+        self.threads.append(heartbeat)
+        tuner = threading.Thread(target=self._tune, name="processor-tuner", daemon=True)
+        tuner.start()
+        self.threads.append(tuner)
+
     def stop(self):
-        """Stop the daemon process."""
+        """Stop the daemon, interrupting running encodes."""
         self.logger.log_info("Stopping processor daemon")
         self.is_running = False
-        if self.thread:
-            self.thread.join()  # Esperar a que el thread termine
-        
-    def _process_queue(self):
-        """Main processing loop that checks and processes the queue."""
+        self._stopping.set()
+        self.wakeup.set()
+        with self._resized:
+            self._resized.notify_all()
+        self.video_processor.cancel_all()
+        for thread in self.threads:
+            thread.join()  # Esperar a que los threads terminen
+        self.threads = []
+        if self.status_dir:
+            self.tuner.unpublish(self.status_dir)
+        if self.notifier:
+            self.notifier.close()
 
-        while self.is_running:
+    def _recover(self):
+        """Requeue tasks left behind by dead workers and delete their temp files."""
+        try:
+            reclaimed = self.queue_manager.reclaim_expired(self.max_attempts)
+            if reclaimed:
+                self.logger.log_info(f"Reclaimed {len(reclaimed)} tasks with expired leases: {', '.join(reclaimed)}")
+            # Tras el reclaim, lo que sigue en processing tiene un lease vivo de otro worker
+            active = {task["id"] for task in self.queue_manager.list_tasks("processing")}
+            removed = self.video_processor.remove_stale_files(active)
+            if removed:
+                self.logger.log_info(f"Removed {removed} stale temp files")
+        except Exception as e:
+            self.logger.log_error(f"Error recovering the queue: {str(e)}")
+
+    def _heartbeat(self):
+        """Renew the leases of running tasks and reclaim tasks whose worker died."""
+
+        while not self._stopping.wait(self.lease_seconds / 3):
             try:
-                queue_data = self.queue_manager._load()
-                
-                # Procesar tareas pendientes (ya ordenadas por prioridad)
-                for task in queue_data["pending"]:
-                    # Actualizar estado a procesando antes de validar
-                    self.queue_manager.update_task_status(task["id"], "processing")
-                    
-                    # Procesar el video
-                    success = self.video_processor.process_video(
-                        task["filename"],
-                        task["id"]
+                with self._leases_lock:
+                    task_ids = list(self.leases)
+                for task_id in task_ids:
+                    if not self.queue_manager.renew_lease(task_id, self.worker_id, self.lease_seconds):
+                        # Otro worker lo ha reclamado: no seguir escribiendo en su lugar
+                        self.logger.log_error(f"Lost the lease of task {task_id}, cancelling it")
+                        self.video_processor.cancel(task_id)
+                reclaimed = self.queue_manager.reclaim_expired(self.max_attempts)
+                if reclaimed:
+                    self.logger.log_info(f"Reclaimed {len(reclaimed)} tasks with expired leases: {', '.join(reclaimed)}")
+            except Exception as e:
+                self.logger.log_error(f"Error in heartbeat: {str(e)}")
+
+    def _tune(self):
+        """Feed encode throughput and running jobs to the tuner, resizing the pool when it decides to."""
+
+        while not self._stopping.wait(self.tuner.sample_seconds):
+            try:
+                with self._leases_lock:
+                    running = len(self.leases)
+                previous = self.tuner.concurrency
+                concurrency = self.tuner.sample(self.video_processor.encoded_seconds(), running)
+                if concurrency != previous:
+                    measure = self.tuner.history[-1]
+                    self.logger.log_info(
+                        f"Concurrency {previous} -> {concurrency} ({measure['decision']}: "
+                        f"{measure['throughput']}x realtime, load {measure['load']}, iowait {measure['iowait']})"
                     )
-                    
-                    # Actualizar estado final
-                    if success:
-                        self.queue_manager.update_task_status(task["id"], "completed")
-                    else:
-                        self.queue_manager.update_task_status(task["id"], "error")
-                
-                time.sleep(self.check_interval)
-                
+                    with self._resized:
+                        self._resized.notify_all()
+                    self.wakeup.set()
+                ENCODE_CONCURRENCY.set(concurrency)
+                if self.tuner.history:
+                    ENCODE_THROUGHPUT.set(self.tuner.history[-1]["throughput"])
+                if self.status_dir:
+                    self.tuner.publish(self.status_dir)
+            except Exception as e:
+                self.logger.log_error(f"Error in tuner: {str(e)}")
+
+    def _finish(self, task: dict, success: bool, error: str) -> str:
+        """Record the outcome of a task, retrying transient failures with exponential backoff. Returns the outcome."""
+
+        task_id = task["id"]
+        attempts = task.get("attempts", 1)
+        if success:
+            self.queue_manager.finish_task(task_id, self.worker_id, "completed")
+            return "completed"
+        elif not self.is_running:
+            # Interrumpido por stop(): devolver a la cola sin gastar un intento
+            self.queue_manager.defer_task(task, self.worker_id, "interrupted", 0)
+            return "interrupted"
+        elif attempts < self.max_attempts and self.video_processor.is_transient(error):
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            self.logger.log_info(f"Retrying task {task_id} in {delay:g}s (attempt {attempts} of {self.max_attempts} failed)")
+            self.queue_manager.finish_task(task_id, self.worker_id, "pending", error=error, retry_after=delay)
+            return "retry"
+        else:
+            self.queue_manager.finish_task(task_id, self.worker_id, "error", error=error)
+            return "error"
+
+    def _admit(self, task: dict, threads: int) -> int:
+        """
+        Reserve the disk space a task will need on every filesystem it writes to. Returns the
+        bytes reserved on the output filesystem, or None after putting the task back in the
+        queue because it does not fit yet.
+        """
+
+        filename = task["filename"]
+        try:
+            parts = self.video_processor.space_parts(filename, task["id"], threads)
+        except FileNotFoundError:
+            return 0  # process_video lo marcará como error
+        fits, message = self.space_ledger.reserve_parts(task["id"], parts)
+        if fits:
+            device = os.stat(self.video_processor.processed).st_dev
+            return sum(size for directory, size, _ in parts if os.stat(directory).st_dev == device)
+        # Esperar en la cola a que terminen otros trabajos en vez de fallar a mitad de la codificación
+        self.logger.log_info(f"Task {task['id']} waits for disk space: {message}")
+        self.queue_manager.defer_task(task, self.worker_id, message, self.space_retry)
+        return None
+
+    def _process_queue(self, index: int):
+        """Worker loop: claim a pending task under a lease, process it and record the result."""
+
+        while self.is_running:
+            try:
+                if index >= self.tuner.concurrency:
+                    # Hueco fuera de la concurrencia actual: esperar a que el tuner la suba
+                    with self._resized:
+                        self._resized.wait_for(lambda: not self.is_running or index < self.tuner.concurrency, self.check_interval)
+                    continue
+                task = self.queue_manager.claim_task(self.worker_id, self.lease_seconds)
+                if task is None:
+                    # Dormir hasta que llegue una tarea; el timeout es solo un rescan de seguridad
+                    self.wakeup.wait(self.check_interval)
+                    self.wakeup.clear()
+                    continue
+                if not self.is_running:
+                    self.queue_manager.defer_task(task, self.worker_id, "interrupted", 0)
+                    break
+
+                slot = self.tuner.slot(index)
+                required_space = None
+                if self.space_ledger:
+                    required_space = self._admit(task, slot.threads)
+                    if required_space is None:
+                        continue
+                if task.get("waiting"):
+                    self.queue_manager.update_task(task["id"], {"waiting": None})
+
+                TASK_WAIT_SECONDS.observe((datetime.now() - datetime.fromisoformat(task["created_at"])).total_seconds())
+                started = time.monotonic()
+                with self._leases_lock:
+                    self.leases.add(task["id"])
+                with self.logger.task_context(task["id"]):
+                    try:
+                        success, error = self.video_processor.process_video(
+                            task["filename"],
+                            task["id"],
+                            threads=slot.threads,
+                            required_space=required_space,
+                            slot=slot
+                        )
+                    finally:
+                        with self._leases_lock:
+                            self.leases.discard(task["id"])
+                        if self.space_ledger:
+                            self.space_ledger.release(task["id"])
+
+                    outcome = self._finish(task, success, error)
+                TASK_RUN_SECONDS.observe(time.monotonic() - started, outcome=outcome)
+
             except Exception as e:
                 self.logger.log_error(f"Error in processing loop: {str(e)}")
-                time.sleep(self.check_interval) 
\ No newline at end of file
+                time.sleep(self.check_interval)
@@ -0,0 +1,41 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+class Database:
+    "SQLite database in WAL mode with one connection per thread."
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        "Return this thread's connection, opening it on first use."
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        "Run statements in a write transaction, taking the database lock up front."
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def execute_script(self, conn: sqlite3.Connection, script: str) -> None:
+        "Run each statement of a schema script inside the current transaction."
+        for statement in script.split(";"):
+            if statement.strip():
+                conn.execute(statement)
@@ -0,0 +1,193 @@
+import os
+import uuid
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from .database import Database
+
+class TreeHasher:
+    "Streaming BLAKE2b tree hash: fixed-size leaves hashed independently, then the leaf digests hashed together."
+
+    LEAF_SIZE = 8 * 1024 * 1024
+    DIGEST_SIZE = 32
+
+    def __init__(self):
+        self.leaves = []
+        self._leaf = hashlib.blake2b(digest_size=self.DIGEST_SIZE)
+        self._filled = 0
+
+    def update(self, data: bytes) -> None:
+        "Hash the next bytes of the stream."
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.LEAF_SIZE - self._filled)
+            self._leaf.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == self.LEAF_SIZE:
+                self.leaves.append(self._leaf.digest())
+                self._leaf = hashlib.blake2b(digest_size=self.DIGEST_SIZE)
+                self._filled = 0
+
+    def leaf_digests(self) -> list:
+        "Digests of every leaf seen so far, including a trailing partial leaf."
+        if self._filled or not self.leaves:
+            return self.leaves + [self._leaf.copy().digest()]
+        return list(self.leaves)
+
+    def hexdigest(self) -> str:
+        "Content hash of the whole stream."
+        return self.root(self.leaf_digests())
+
+    @classmethod
+    def root(cls, leaves: list) -> str:
+        "Combine leaf digests, in file order, into the content hash."
+        digest = hashlib.blake2b(digest_size=cls.DIGEST_SIZE, person=b"vault-tree")
+        for leaf in leaves:
+            digest.update(leaf)
+        return digest.hexdigest()
+
+
+class ContentIndex:
+    "Content-hash index of uploads and of the outputs produced from them."
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            path TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_blobs_hash ON content_blobs (hash);
+        CREATE TABLE IF NOT EXISTS content_outputs (
+            hash TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            output TEXT NOT NULL,
+            hls TEXT,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (hash, variant)
+        )
+    """
+
+    READ_BUFFER = TreeHasher.LEAF_SIZE
+
+    def __init__(self, index_file: Path):
+        "Initialize the index in the library database."
+        self.db = Database(index_file)
+        with self.db.transaction() as conn:
+            self.db.execute_script(conn, self.SCHEMA)
+
+    # --------------- [Private Methods] ---------------
+
+    @staticmethod
+    def _matches(row, stat: os.stat_result) -> bool:
+        "Whether an indexed entry still describes the file on disk."
+        return row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns
+
+    @staticmethod
+    def _link(source: Path, destination: Path) -> None:
+        "Atomically make `destination` a hardlink to `source`, replacing whatever was there."
+        tmp = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.link")
+        os.link(source, tmp)
+        os.replace(tmp, destination)
+
+    # --------------- [Upload methods] ---------------
+
+    def hash_file(self, file_path: Path) -> str:
+        "Hash a file from disk; only needed for files whose hash was not computed while uploading."
+        hasher = TreeHasher()
+        with open(file_path, 'rb') as f:
+            while data := f.read(self.READ_BUFFER):
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def lookup(self, file_path: Path) -> str:
+        "Indexed content hash of a file, or None if unknown or modified since."
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        row = self.db.connection().execute(
+            "SELECT hash, size, mtime_ns FROM content_blobs WHERE path = ?", (str(file_path),)
+        ).fetchone()
+        return row["hash"] if row and self._matches(row, stat) else None
+
+    def register(self, file_path: Path, content_hash: str) -> None:
+        "Record the content hash of a file."
+        stat = os.stat(file_path)
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content_blobs (path, hash, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                (str(file_path), content_hash, stat.st_size, stat.st_mtime_ns),
+            )
+
+    def find(self, content_hash: str, exclude: Path = None) -> Path:
+        "An indexed file with this content that is still intact on disk, or None."
+        rows = self.db.connection().execute(
+            "SELECT path, size, mtime_ns FROM content_blobs WHERE hash = ?", (content_hash,)
+        ).fetchall()
+        for row in rows:
+            path = Path(row["path"])
+            if exclude and path == Path(exclude):
+                continue
+            try:
+                if self._matches(row, os.stat(path)):
+                    return path
+            except FileNotFoundError:
+                continue
+        return None
+
+    def deduplicate(self, file_path: Path, content_hash: str) -> Path:
+        """
+        Index a new file and, if identical content is already stored, replace it with a hardlink.
+
+        Returns:
+            The existing file it now shares storage with, or None if the content is new
+        """
+        file_path = Path(file_path)
+        original = self.find(content_hash, exclude=file_path)
+        if original and not os.path.samefile(original, file_path):
+            try:
+                self._link(original, file_path)
+            except OSError:
+                # Otro sistema de ficheros o límite de enlaces: conservar la copia
+                original = None
+        self.register(file_path, content_hash)
+        return original
+
+    def forget(self, file_path: Path) -> None:
+        "Drop a deleted file from the index."
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM content_blobs WHERE path = ?", (str(file_path),))
+
+    # --------------- [Output methods] ---------------
+
+    def find_output(self, content_hash: str, variant: str) -> tuple[Path, Path]:
+        "(output file, HLS directory or None) produced earlier from this content with the same settings, or None."
+        row = self.db.connection().execute(
+            "SELECT output, hls FROM content_outputs WHERE hash = ? AND variant = ?", (content_hash, variant)
+        ).fetchone()
+        if row is None or not Path(row["output"]).is_file():
+            return None
+        hls = Path(row["hls"]) if row["hls"] else None
+        if hls and not (hls / "index.m3u8").is_file():
+            return None
+        return Path(row["output"]), hls
+
+    def record_output(self, content_hash: str, variant: str, output_file: Path, hls_dir: Path = None) -> None:
+        "Remember the output produced from a content hash."
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content_outputs (hash, variant, output, hls, created_at) VALUES (?, ?, ?, ?, ?)",
+                (content_hash, variant, str(output_file), str(hls_dir) if hls_dir else None, datetime.now().isoformat()),
+            )
+
+    def link_output(self, source: tuple[Path, Path], output_file: Path, hls_dir: Path = None) -> None:
+        "Hardlink a previous output (and its HLS segments) under a new name instead of encoding again."
+        source_file, source_hls = source
+        self._link(source_file, output_file)
+        if hls_dir and source_hls:
+            hls_dir.mkdir(parents=True, exist_ok=True)
+            for entry in source_hls.iterdir():
+                if entry.is_file() and not entry.name.startswith("."):
+                    self._link(entry, hls_dir / entry.name)
@@ -0,0 +1,74 @@
+import os
+import fcntl
+import threading
+from pathlib import Path
+from typing import Callable
+
+class LeaderElection:
+    "Elects one process out of many (e.g. uvicorn workers) through an exclusive flock on a shared file."
+
+    def __init__(self, lock_file: Path, on_elected: Callable[[], None], on_resign: Callable[[], None], retry_interval: float = 5):
+        """
+        Initialize the election.
+
+        Args:
+            lock_file: File every candidate locks; the kernel releases the lock if the leader dies
+            on_elected: Called once this process becomes the leader
+            on_resign: Called on stop() if this process was the leader
+            retry_interval: How often a standby process retries to take over (in seconds)
+        """
+        self.lock_file = Path(lock_file)
+        self.on_elected = on_elected
+        self.on_resign = on_resign
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._fd = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # --------------- [Private Methods] ---------------
+
+    def _try_acquire(self) -> bool:
+        "Take the lock without blocking."
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Dejar constancia de quién es el líder, solo informativo
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{os.getpid()}\n".encode(), 0)
+        self._fd = fd
+        return True
+
+    def _campaign(self) -> None:
+        "Retry until elected or stopped."
+        while not self._stopping.is_set():
+            if self._try_acquire():
+                self.is_leader = True
+                self.on_elected()
+                return
+            self._stopping.wait(self.retry_interval)
+
+    # --------------- [Election methods] ---------------
+
+    def start(self) -> None:
+        "Try to become the leader now, and keep trying in the background while another process holds it."
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._campaign, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        "Stop campaigning and, if leading, resign and release the lock so a standby takes over."
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self.is_leader:
+            self.on_resign()
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+            self.is_leader = False
@@ -0,0 +1,211 @@
+import os
+import json
+import base64
+import time
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from datetime import datetime
+from typing import AsyncIterator
+from .metadata import MetadataCache
+from .validate import FileValidator
+from .preview import PreviewCache
+
+class FileLibrary:
+    "Paginated, sortable listing of a media directory backed by the metadata cache."
+
+    SORT_KEYS = {
+        "name": lambda name, stat: name,
+        "size": lambda name, stat: stat.st_size,
+        "mtime": lambda name, stat: stat.st_mtime_ns,
+    }
+    ORDERS = ("asc", "desc")
+    PROBE_BATCH = 32
+    SNAPSHOTS = 8
+    SNAPSHOT_TTL = 2.0
+    CURSOR_TYPES = {"name": str, "size": int, "mtime": int}
+
+    def __init__(self, directory: Path, file_validator: FileValidator, metadata_cache: MetadataCache, probe_timeout: float, format_size=None, previews: PreviewCache = None):
+        "Initialize the library for one directory; with `previews`, records carry the key of their cached previews."
+        self.directory = Path(directory)
+        self.file_validator = file_validator
+        self.metadata_cache = metadata_cache
+        self.probe_timeout = probe_timeout
+        self.format_size = format_size or str
+        self.previews = previews
+        self._snapshots = {}
+        self._snapshots_lock = threading.Lock()
+
+    # --------------- [Private Methods] ---------------
+
+    @staticmethod
+    def _encode_cursor(key: tuple) -> str:
+        "Serialize the sort key of the last returned file into an opaque token."
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        "Parse a cursor token back into a sort key."
+        try:
+            value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return value, name
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def _snapshot(self, sort: str, extensions: set) -> tuple[list, list]:
+        """
+        Ascending (key, name) entries of the directory and their keys.
+
+        Creating, deleting or renaming a file changes the directory mtime, which rescans it.
+        Files growing or rewritten in place do not, so orders by size or mtime are also
+        rebuilt after SNAPSHOT_TTL seconds; the stat shown for each file is always taken
+        again when its page is listed.
+        """
+
+        stat = os.stat(self.directory)
+        version = (stat.st_ino, stat.st_mtime_ns)
+        snapshot_key = (sort, frozenset(extensions or ()))
+        now = time.monotonic()
+        with self._snapshots_lock:
+            cached = self._snapshots.get(snapshot_key)
+        if cached and cached[0] == version and (sort == "name" or now - cached[1] < self.SNAPSHOT_TTL):
+            return cached[2], cached[3]
+
+        sort_key = self.SORT_KEYS[sort]
+        entries = []
+        with os.scandir(self.directory) as iterator:
+            for entry in iterator:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                if extensions and Path(entry.name).suffix.lower().lstrip(".") not in extensions:
+                    continue
+                # Ordenar por nombre no necesita stat
+                stat = entry.stat() if sort != "name" else None
+                entries.append(((sort_key(entry.name, stat), entry.name), entry.name))
+        entries.sort(key=lambda item: item[0])
+        keys = [item[0] for item in entries]
+
+        with self._snapshots_lock:
+            self._snapshots.pop(snapshot_key, None)
+            self._snapshots[snapshot_key] = (version, now, entries, keys)
+            while len(self._snapshots) > self.SNAPSHOTS:
+                self._snapshots.pop(next(iter(self._snapshots)))
+        return entries, keys
+
+    def _scan(self, sort: str, order: str, cursor: str, extensions: set, limit: int = None) -> list:
+        "Return up to `limit` (key, name) entries after the cursor, seeking in the cached sorted snapshot."
+
+        entries, keys = self._snapshot(sort, extensions)
+        after = tuple(self._decode_cursor(cursor)) if cursor else None
+        if order == "desc":
+            end = bisect_left(keys, after) if after else len(entries)
+            start = 0 if limit is None else max(0, end - limit)
+            return entries[start:end][::-1]
+        start = bisect_right(keys, after) if after else 0
+        return entries[start:] if limit is None else entries[start:start + limit]
+
+    def _restat(self, entries: list) -> list:
+        "Current (key, name, stat) of listed entries, leaving out files deleted since the scan."
+        current = []
+        for key, name in entries:
+            try:
+                current.append((key, name, os.stat(self.directory / name)))
+            except FileNotFoundError:
+                continue
+        return current
+
+    def _file_info(self, name: str, stat: os.stat_result) -> dict:
+        "Base listing fields that come from the directory entry alone."
+        return {
+            "filename": name,
+            "size": self.format_size(stat.st_size),
+            "bytes": stat.st_size,
+            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        }
+
+    @staticmethod
+    def _has_codec(info: dict, codec: str) -> bool:
+        "Whether any video or audio stream uses `codec`."
+        streams = info.get("video_streams", []) + info.get("audio_streams", [])
+        return any((stream.get("codec") or "").lower() == codec for stream in streams)
+
+    # --------------- [Listing methods] ---------------
+
+    def validate(self, sort: str, order: str, cursor: str = None) -> None:
+        "Reject unknown sort keys, orders or malformed cursors (including one from another sort key) before listing starts."
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Invalid sort key: {sort}: Allowed keys: {', '.join(self.SORT_KEYS)}")
+        if order not in self.ORDERS:
+            raise ValueError(f"Invalid order: {order}: Allowed orders: {', '.join(self.ORDERS)}")
+        if cursor:
+            value, name = self._decode_cursor(cursor)
+            expected = self.CURSOR_TYPES[sort]
+            if not isinstance(name, str) or not isinstance(value, expected) or isinstance(value, bool):
+                raise ValueError(f"Invalid cursor for sort key: {sort}")
+
+    async def iter_files(self, sort: str = "name", order: str = "asc", limit: int = 100, cursor: str = None, extensions: set = None, codec: str = None) -> AsyncIterator[dict]:
+        """
+        Yield one dict per file of the requested page, then a final {"next_cursor": ...} record.
+
+        Args:
+            sort: Sort key, one of name, size or mtime
+            order: asc or desc
+            limit: Maximum number of files in the page
+            cursor: Token returned by the previous page
+            extensions: Only include files with these extensions (without dot)
+            codec: Only include files with a stream in this codec; files whose
+                probe has not finished yet are left out
+        """
+        self.validate(sort, order, cursor)
+        # Con filtro de codec no se sabe de antemano cuántas entradas hacen falta
+        window = None if codec else limit + 1
+        entries = await asyncio.to_thread(self._scan, sort, order, cursor, extensions, window)
+        codec = codec.lower() if codec else None
+
+        emitted = 0
+        last_key = None
+        start = 0
+        while start < len(entries):
+            # Sin filtro de codec no hace falta sondear más allá del final de la página
+            size = self.PROBE_BATCH if codec else max(1, min(self.PROBE_BATCH, limit + 1 - emitted))
+            batch = await asyncio.to_thread(self._restat, entries[start:start + size])
+            start += size
+            videos = [
+                (self.directory / name, stat) for _, name, stat in batch
+                if self.file_validator.validate_extension(name)[0]
+            ]
+            probed = await self.metadata_cache.get_many(videos, timeout=self.probe_timeout)
+            preview_keys = await asyncio.to_thread(self.previews.keys, videos) if self.previews and videos else {}
+
+            for key, name, stat in batch:
+                info = probed.get(self.directory / name, {})
+                if codec and not self._has_codec(info, codec):
+                    continue
+                if emitted == limit:
+                    yield {"next_cursor": self._encode_cursor(last_key)}
+                    return
+                file_info = self._file_info(name, stat)
+                file_info.update(info)
+                if self.directory / name in preview_keys:
+                    file_info["preview"] = preview_keys[self.directory / name]
+                yield file_info
+                emitted += 1
+                last_key = key
+
+        # Si se borraron ficheros de la ventana puede haber más detrás: seguir desde aquí
+        if window and len(entries) == window and last_key is not None:
+            yield {"next_cursor": self._encode_cursor(last_key)}
+            return
+        yield {"next_cursor": None}
+
+    async def list_files(self, **kwargs) -> tuple[list, str]:
+        "Collect a page into a list, returning (files, next_cursor)."
+        files = []
+        next_cursor = None
+        async for record in self.iter_files(**kwargs):
+            if "next_cursor" in record:
+                next_cursor = record["next_cursor"]
+            else:
+                files.append(record)
+        return files, next_cursor
@@ -1,45 +1,191 @@
+import os
+import json
+import time
+import fcntl
+import queue
+import atexit
 import logging
+import logging.handlers
+import contextvars
 from pathlib import Path
 from datetime import datetime
+from contextlib import contextmanager
+
+# Id de la tarea en curso en este thread (o tarea asyncio), añadido a cada línea de log
+current_task_id = contextvars.ContextVar("current_task_id", default=None)
+
+
+class TaskContextFilter(logging.Filter):
+    """Stamp records with the task id of the calling context before they leave its thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "task_id"):
+            record.task_id = current_task_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "task_id"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if getattr(record, "task_id", None):
+            entry["task_id"] = record.task_id
+        # Campos estructurados pasados con extra={...}
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RotatingJsonFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    Rotate on a schedule (`when`) and also as soon as the file exceeds `max_bytes`.
+
+    Every uvicorn worker and worker.py append to the same file, so rotation is
+    coordinated: it runs under an exclusive flock, and a process that finds the file
+    already rotated by another one only reopens it. Before each record the handler
+    also checks that the path still names the file it has open (as WatchedFileHandler
+    does), so no process keeps writing into a rotated file.
+    """
+
+    def __init__(self, filename: Path, max_bytes: int, when: str, backup_count: int):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        self.namer = self._unique_name
+        self.lock_file = Path(self.baseFilename).with_suffix(".lock")
+
+    @staticmethod
+    def _unique_name(default_name: str) -> str:
+        # Varias rotaciones por tamaño en el mismo periodo no deben pisarse: processing.log.<fecha>.1, .2...
+        name, index = default_name, 1
+        while os.path.exists(name):
+            name = f"{default_name}.{index}"
+            index += 1
+        return name
+
+    def _rotated_elsewhere(self) -> bool:
+        "Whether the log path no longer names the file this process has open."
+        if self.stream is None:
+            return False
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self.stream.fileno())
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def _reopen(self) -> None:
+        "Drop the stream of a rotated file; the next record opens the current one."
+        self.stream.close()
+        self.stream = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._rotated_elsewhere():
+            self._reopen()
+        super().emit(record)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes and self.stream is not None:
+            self.stream.seek(0, os.SEEK_END)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def doRollover(self) -> None:
+        with open(self.lock_file, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._rotated_elsewhere():
+                # Otro proceso ya ha rotado: solo reabrir y recalcular la próxima rotación
+                self._reopen()
+                self.rolloverAt = self.computeRollover(int(time.time()))
+                return
+            super().doRollover()
+
 
 class VideoLogger:
     """Custom logger for video processing operations."""
-    
-    def __init__(self, log_dir: Path):
-        self.log_dir = log_dir
+
+    def __init__(self, log_dir: Path, level: str = "INFO", max_bytes: int = 50 * 1024 * 1024, when: str = "midnight", backup_count: int = 14):
+        """
+        Initialize the logger.
+
+        Records are only put on an in-memory queue by the calling thread (request
+        handlers, processor threads); a background listener formats them as JSON
+        lines and writes them, so logging never blocks on disk I/O.
+
+        Args:
+            log_dir: Directory of processing.log
+            level: Minimum level name
+            max_bytes: Rotate once the file reaches this size (0 = no size limit)
+            when: Time-based rotation interval (TimedRotatingFileHandler `when`)
+            backup_count: Rotated files to keep
+        """
+        self.log_dir = Path(log_dir)
         self.log_dir.mkdir(parents=True, exist_ok=True)
-        
+
         # Configurar un único logger
         self.logger = logging.getLogger('processing')
-        self.logger.setLevel(logging.INFO)
-        
-        # Configurar el handler para el archivo
-        log_file = log_dir / 'processing.log'
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.INFO)
-        
-        # Formato del log
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        
-        self.logger.addHandler(file_handler)
-    
-    def log_info(self, message: str):
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+
+        # El fichero se escribe en el thread del listener, no en el que registra el mensaje
+        file_handler = RotatingJsonFileHandler(self.log_dir / 'processing.log', max_bytes, when, backup_count)
+        file_handler.setFormatter(JsonFormatter())
+
+        self._queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(self._queue)
+        queue_handler.addFilter(TaskContextFilter())
+
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(queue_handler)
+
+        self._listener = logging.handlers.QueueListener(self._queue, file_handler, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.close)
+
+    @contextmanager
+    def task_context(self, task_id: str):
+        """Tag every record logged inside the block with `task_id`."""
+        token = current_task_id.set(task_id)
+        try:
+            yield
+        finally:
+            current_task_id.reset(token)
+
+    def close(self):
+        """Flush pending records and stop the listener thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def log_info(self, message: str, **fields):
         """Log información general."""
-        self.logger.info(message)
-    
-    def log_error(self, message: str):
+        self.logger.info(message, extra=fields)
+
+    def log_error(self, message: str, **fields):
         """Log errores."""
-        self.logger.error(message)
-    
+        self.logger.error(message, extra=fields)
+
     def log_processing_start(self, filename: str):
         """Log inicio de procesamiento."""
-        self.log_info(f"Started processing video: {filename}")
-    
+        self.log_info(f"Started processing video: {filename}", video=filename, event="start")
+
     def log_processing_complete(self, filename: str):
         """Log fin de procesamiento exitoso."""
-        self.log_info(f"Successfully processed video: {filename}")
-    
+        self.log_info(f"Successfully processed video: {filename}", video=filename, event="complete")
+
     def log_processing_error(self, filename: str, error: str):
         """Log error de procesamiento."""
-        self.log_error(f"Error processing video {filename}: {error}") 
\ No newline at end of file
+        self.log_error(f"Error processing video {filename}: {error}", video=filename, event="error")
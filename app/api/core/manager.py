@@ -1,110 +1,290 @@
-import json
+import time
 import uuid
+import threading
 from pathlib import Path
+from typing import Callable
 from datetime import datetime
+from .store import QueueStore, create_store
+from .notify import QueueNotifier
+from .scheduler import SchedulingPolicy
 
 class QueueManager:
     "Queue manager for video processing tasks."
-    
-    def __init__(self, queue_file: Path, config: dict):
-        "Initialize the queue manager."
+
+    # Una tarea en estos estados impide volver a encolar el mismo fichero
+    ACTIVE_STATUSES = ("pending", "processing", "completed")
+
+    # Las posiciones en cola se recalculan como mucho una vez por segundo, las pida quien las pida
+    ESTIMATE_TTL = 1.0
+
+    def __init__(self, queue_file: Path, config: dict, store: QueueStore = None, notifier: QueueNotifier = None, policy: SchedulingPolicy = None, concurrency: Callable[[], int] = None):
+        """
+        Initialize the queue manager on the configured storage backend.
+
+        Args:
+            concurrency: Returns how many tasks the processor daemons run at once right now,
+                or None if unknown; start time estimates then use `processing.max_workers`
+        """
         self.queue_file = queue_file
         self.config = config
         self.path = self.config["path"]
-        self._create()
+        self.store = store or create_store(queue_file, config)
+        self.notifier = notifier
+        self.policy = policy or SchedulingPolicy.from_config(config)
+        self.concurrency = concurrency
+        self._estimates = (float("-inf"), {})
+        self._estimates_lock = threading.Lock()
 
     # --------------- [Private Methods] ---------------
 
-    def _create(self) -> None:
-        "Create queue file if not exists."
-        if not self.queue_file.exists():
-            initial_queue = {"pending": [], "processing": [], "completed": [], "error": []}
-            self.queue_file.parent.mkdir(parents=True, exist_ok=True)
-            self._save(initial_queue)
-
-    def _save(self, queue_data: dict) -> None:
-        "Dump data into the queue file."
-        with open(self.queue_file, 'w') as f:
-            json.dump(queue_data, f, indent=4)
-    
-    def _load(self) -> dict:
-        "Read the current status of the queue file."
-        with open(self.queue_file, 'r') as f:
-            return json.load(f)
-        
+    def _notify(self) -> None:
+        "Wake the processor daemons after new work becomes pending."
+        self._estimates = (float("-inf"), {})
+        if self.notifier:
+            self.notifier.notify()
+
     # --------------- [Task methods] ---------------
 
+    def get_task(self, task_id: str) -> dict:
+        "Get a task by id, whatever its status."
+
+        return self.store.get(task_id)
+
+    def get_tasks(self, task_ids: list) -> dict:
+        "Get many tasks by id in one query, keyed by id; unknown ids are left out."
+
+        return self.store.get_many(task_ids)
+
     def find_task_status(self, task_id: str) -> str:
         "Find current status of a task."
 
-        queue_data = self._load()
-        states = ["pending", "processing", "completed", "error"]
+        task = self.store.get(task_id)
+        return task["status"] if task else None
+
+    def list_tasks(self, status: str) -> list:
+        "Every task in a given status, oldest first."
+
+        return self.store.list(status)
 
-        for state in states:
-            if any(task["id"] == task_id for task in queue_data[state]):
-                return state
-        return None
-    
     def get_task_status(self, task_id: str, status: str) -> dict:
         "Get task from a specific status list."
 
-        queue_data = self._load()
-        for task in queue_data[status]:
-            if task["id"] == task_id:
-                return task
+        task = self.store.get(task_id)
+        if task and task["status"] == status:
+            return task
         return None
-    
-    def update_task_status(self, task_id: str, new_status: str) -> bool:
+
+    def update_task_status(self, task_id: str, new_status: str, error: str = None) -> bool:
         """Update task status."""
 
-        queue_data = self._load() # load queue on memory.
-        current_status = self.find_task_status(task_id) # Get task status by task id.
-        
-        if not current_status:
-            return False
-            
-        task = self.get_task_status(task_id, current_status) 
-        if not task: 
-            return False
-        
-        queue_data[current_status].remove(task)
-        
-        task["status"] = new_status
-        task["updated_at"] = datetime.now().isoformat()
-        
-        queue_data[new_status].append(task)
-        self._save(queue_data)
-        return True
-
-    def add_task(self, filename: str) -> str:
-        """Add new task to the queue."""
+        fields = {"status": new_status, "updated_at": datetime.now().isoformat()}
+        if error is not None:
+            fields["error"] = error
+        updated = self.store.update(task_id, fields) is not None
+        if updated and new_status == "pending":
+            self._notify()
+        return updated
+
+    def update_task(self, task_id: str, fields: dict) -> bool:
+        "Attach extra fields to a task without changing its status."
+
+        fields = {**fields, "updated_at": datetime.now().isoformat()}
+        return self.store.update(task_id, fields) is not None
+
+    def update_task_progress(self, task_id: str, progress: dict) -> bool:
+        "Record live progress (percent, fps, speed, ETA) of a running task."
+
+        return self.update_task(task_id, {"progress": progress})
+
+    def claim_task(self, owner: str = None, lease_seconds: float = None) -> dict:
+        """
+        Atomically move the next pending task, as chosen by the scheduling policy, to processing and return it.
+
+        Args:
+            owner: Worker claiming the task; with `lease_seconds`, the claim is a lease that
+                must be renewed with `renew_lease` or it is reclaimed by `reclaim_expired`
+            lease_seconds: Lease duration
+        """
+
+        fields = {"lease_owner": owner, "lease_expires": time.time() + lease_seconds} if owner and lease_seconds else None
+        short_job_seconds = self.policy.short_job_seconds if self.policy.short_job_boost else None
+        return self.store.claim(datetime.now().isoformat(), select=self.policy.select, fields=fields, short_job_seconds=short_job_seconds)
+
+    def renew_lease(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        "Extend the lease of a running task. False means the lease was lost and the task must stop."
+
+        fields = {"lease_expires": time.time() + lease_seconds}
+        return self.store.update(task_id, fields, expect={"status": "processing", "lease_owner": owner}) is not None
+
+    def finish_task(self, task_id: str, owner: str, new_status: str, error: str = None, retry_after: float = None) -> bool:
+        """
+        Record the outcome of a leased task, only if `owner` still holds the lease.
+
+        Args:
+            new_status: completed, error, or pending to put the task back in the queue
+            retry_after: With pending, seconds before the task may be claimed again
+        """
+
+        fields = {"status": new_status, "updated_at": datetime.now().isoformat(), "lease_owner": None, "lease_expires": None}
+        if error is not None:
+            fields["error"] = error
+        if retry_after:
+            fields["not_before"] = time.time() + retry_after
+        updated = self.store.update(task_id, fields, expect={"status": "processing", "lease_owner": owner}) is not None
+        if updated and new_status == "pending":
+            self._notify()
+        return updated
+
+    def defer_task(self, task: dict, owner: str, reason: str, retry_after: float) -> bool:
+        """
+        Put a leased task back in the queue without using up an attempt, e.g. until enough disk space is free.
+
+        Args:
+            task: The task as returned by `claim_task`
+            reason: Why the task is waiting, shown in its status until it starts
+            retry_after: Seconds before the task may be claimed again
+        """
+
+        fields = {
+            "status": "pending",
+            "updated_at": datetime.now().isoformat(),
+            "lease_owner": None,
+            "lease_expires": None,
+            "attempts": max(0, task.get("attempts", 1) - 1),
+            "waiting": reason,
+            "not_before": time.time() + retry_after,
+        }
+        updated = self.store.update(task["id"], fields, expect={"status": "processing", "lease_owner": owner}) is not None
+        if updated:
+            self._notify()
+        return updated
+
+    def reclaim_expired(self, max_attempts: int) -> list:
+        """
+        Return processing tasks whose lease expired (their worker died) to the queue.
+
+        Tasks claimed without a lease by an older version are reclaimed too. A task that
+        already used `max_attempts` attempts is marked as error instead.
+
+        Returns:
+            Ids of the reclaimed tasks
+        """
+
+        reclaimed = []
+        now = time.time()
+        for task in self.store.list("processing"):
+            expires = task.get("lease_expires")
+            if expires and expires > now:
+                continue
+            exhausted = task.get("attempts", 1) >= max_attempts
+            fields = {
+                "status": "error" if exhausted else "pending",
+                "updated_at": datetime.now().isoformat(),
+                "lease_owner": None,
+                "lease_expires": None,
+                "error": "Worker lost while processing" + (f" ({task.get('attempts', 1)} attempts)" if exhausted else ""),
+            }
+            expect = {"status": "processing", "lease_owner": task.get("lease_owner"), "lease_expires": expires}
+            if self.store.update(task["id"], fields, expect=expect) is not None:
+                reclaimed.append(task["id"])
+        if reclaimed:
+            self._notify()
+        return reclaimed
+
+    def queue_position(self, task_id: str) -> dict:
+        "Position in the queue and estimated start time of a pending task, or None."
+
+        return self.queue_positions().get(task_id)
+
+    def queue_positions(self) -> dict:
+        """
+        Position and estimated start of every pending task, keyed by id.
+
+        The ordering is computed once per ESTIMATE_TTL and shared by every caller, so
+        status polls and open SSE streams do not each read and sort the whole queue.
+        """
+
+        with self._estimates_lock:
+            computed, estimates = self._estimates
+            if time.monotonic() - computed >= self.ESTIMATE_TTL:
+                workers = self.concurrency() if self.concurrency else None
+                estimates = self.policy.estimate(self.store.list("pending"), self.store.list("processing"), workers=workers)
+                self._estimates = (time.monotonic(), estimates)
+        return estimates
+
+    def _new_task(self, filename: str, priority: int, client: str, duration: float, reused: dict) -> dict:
+        "Build the record of a new task."
 
         task_id = str(uuid.uuid4()) # Get random id with uuid module.
         now = datetime.now().isoformat()
-        
+
         task = {
             "id": task_id,
             "filename": filename,
             "status": "pending",
             "created_at": now,
-            "updated_at": now
+            "updated_at": now,
+            "priority": priority,
+            "client": client
         }
-        
-        queue_data = self._load()
-        queue_data["pending"].append(task)
-        self._save(queue_data)
-        
-        return task_id
+        if duration:
+            task["duration"] = duration
+        if reused:
+            task.update(reused, status="completed")
+        return task
+
+    def add_task(self, filename: str, priority: int = 0, client: str = None, duration: float = None, reused: dict = None) -> str:
+        """
+        Add new task to the queue.
+
+        Args:
+            filename: Video in the uploads directory
+            priority: Higher values are processed first
+            client: Submitter used for fair sharing between clients
+            duration: Probed length of the video in seconds, lets short jobs jump ahead
+            reused: Fields of an existing output already linked for this file; the task
+                is then recorded as completed instead of being queued
+        """
+
+        task = self._new_task(filename, priority, client, duration, reused)
+        self.store.add(task)
+        if not reused:
+            self._notify()
+        return task["id"]
+
+    def add_tasks(self, entries: list, priority: int = 0, client: str = None) -> list:
+        """
+        Add many tasks in a single transaction, skipping files that already have a task (as `check_task`).
+
+        Args:
+            entries: One dict per file with "filename" and optionally "duration" and "reused" (see `add_task`)
+
+        Returns:
+            One {"filename", "task_id", "status", "duplicate"} per entry; duplicates report the existing task
+        """
+
+        tasks = [
+            self._new_task(entry["filename"], priority, client, entry.get("duration"), entry.get("reused"))
+            for entry in entries
+        ]
+        stored = self.store.add_many(tasks, self.ACTIVE_STATUSES)
+        results = [
+            {"filename": task["filename"], "task_id": result["id"], "status": result["status"], "duplicate": result["id"] != task["id"]}
+            for task, result in zip(tasks, stored)
+        ]
+        if any(not result["duplicate"] and result["status"] == "pending" for result in results):
+            self._notify()
+        return results
 
     def check_task(self, filename: str) -> tuple[bool, str]:
         """Verify if a task is already on the queue."""
 
-        queue_data = self._load()
-        
-        for status in ["pending", "processing", "completed"]:
-            for task in queue_data[status]:
-                if task["filename"] == filename:
-                    return True, status
-        
+        task = self.store.find_by_filename(filename, self.ACTIVE_STATUSES)
+        if task:
+            return True, task["status"]
         return False, ""
 
+    def check_tasks(self, filenames: list) -> dict:
+        "Status of the existing task of each file that is already on the queue, in one query."
+
+        return {filename: task["status"] for filename, task in self.store.find_by_filenames(filenames, self.ACTIVE_STATUSES).items()}
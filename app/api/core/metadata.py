@@ -0,0 +1,201 @@
+import os
+import json
+import asyncio
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Awaitable, Callable
+from .database import Database
+
+class MetadataCache:
+    "Persistent ffprobe metadata index keyed by path, size and mtime, including the files ffprobe could not read."
+
+    # Bump when the shape of the probe output changes to drop stale entries.
+    VERSION = 2
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS video_metadata (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            info TEXT NOT NULL,
+            probed_at TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, index_file: Path, probe: Callable[[Path], dict], probe_async: Callable[[Path], Awaitable[dict]] = None, probe_concurrency: int = 4):
+        "Initialize the cache on an SQLite index, using `probe` (or `probe_async` from the event loop) to fill misses."
+        self.db = Database(index_file)
+        self.probe = probe
+        self.probe_async = probe_async
+        self.probe_concurrency = max(1, probe_concurrency)
+        self._memory = {}
+        self._memory_lock = threading.Lock()
+        self._semaphore = None
+        self._inflight = {}
+        self._create()
+
+    # --------------- [Private Methods] ---------------
+
+    def _create(self) -> None:
+        "Create the table, discarding entries written by an older probe format."
+        with self.db.transaction() as conn:
+            self.db.execute_script(conn, self.SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+                conn.execute("DELETE FROM video_metadata")
+                conn.execute(f"PRAGMA user_version = {self.VERSION}")
+
+    def _remember(self, key: str, size: int, mtime_ns: int, info: dict) -> None:
+        "Keep an entry in process memory."
+        with self._memory_lock:
+            self._memory[key] = (size, mtime_ns, info)
+
+    def _recall(self, key: str, stat: os.stat_result) -> dict:
+        "Info kept in process memory if it still matches the file on disk."
+        entry = self._memory.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def _probe_in_background(self, file_path: Path, stat: os.stat_result) -> asyncio.Task:
+        "Start (or join) a bounded async probe that stores its result when it finishes."
+
+        key = (str(file_path), stat.st_size, stat.st_mtime_ns)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._probe_and_store(file_path, stat))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _probe_and_store(self, file_path: Path, stat: os.stat_result) -> dict:
+        "Probe one file under the concurrency semaphore and cache the result."
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.probe_concurrency)
+        try:
+            async with self._semaphore:
+                if self.probe_async:
+                    info = await self.probe_async(file_path)
+                else:
+                    info = await asyncio.to_thread(self.probe, file_path)
+            return await asyncio.to_thread(self.store, file_path, info, stat)
+        except Exception as e:
+            return {"error": f"Failed to retrieve video info: {str(e)}"}
+
+    # --------------- [Cache methods] ---------------
+
+    def lookup(self, file_path: Path, stat: os.stat_result = None) -> dict:
+        "Return cached info if it is still valid for the file on disk, without probing."
+
+        key = str(file_path)
+        stat = stat or os.stat(file_path)
+
+        info = self._recall(key, stat)
+        if info is not None:
+            return info
+
+        row = self.db.connection().execute(
+            "SELECT size, mtime_ns, info FROM video_metadata WHERE path = ?", (key,)
+        ).fetchone()
+        if row and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+            info = json.loads(row["info"])
+            self._remember(key, stat.st_size, stat.st_mtime_ns, info)
+            return info
+        return None
+
+    def lookup_many(self, entries: list) -> dict:
+        "Cached info of many (path, stat) pairs in one query, keyed by path; misses are left out."
+
+        results = {}
+        stats = {}
+        for file_path, stat in entries:
+            info = self._recall(str(file_path), stat)
+            if info is not None:
+                results[file_path] = info
+            else:
+                stats[str(file_path)] = (file_path, stat)
+
+        paths = list(stats)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.db.connection().execute(
+                f"SELECT path, size, mtime_ns, info FROM video_metadata WHERE path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                file_path, stat = stats[row["path"]]
+                if row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+                    info = json.loads(row["info"])
+                    self._remember(row["path"], stat.st_size, stat.st_mtime_ns, info)
+                    results[file_path] = info
+        return results
+
+    def store(self, file_path: Path, info: dict, stat: os.stat_result = None) -> dict:
+        "Record probe output for a file. Failed probes are kept too, so a corrupt file is only probed again once it changes."
+
+        key = str(file_path)
+        stat = stat or os.stat(file_path)
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO video_metadata (path, size, mtime_ns, info, probed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, json.dumps(info), datetime.now().isoformat()),
+            )
+        self._remember(key, stat.st_size, stat.st_mtime_ns, info)
+        return info
+
+    def refresh(self, file_path: Path) -> dict:
+        "Probe a file and update its entry."
+
+        stat = os.stat(file_path)
+        return self.store(file_path, self.probe(file_path), stat)
+
+    def get(self, file_path: Path, stat: os.stat_result = None) -> dict:
+        "Return cached info, probing the file only on a miss."
+
+        stat = stat or os.stat(file_path)
+        info = self.lookup(file_path, stat)
+        if info is None:
+            info = self.store(file_path, self.probe(file_path), stat)
+        return info
+
+    async def get_many(self, entries: list, timeout: float) -> dict:
+        """
+        Return info for many files at once, probing misses concurrently off the event loop.
+
+        Args:
+            entries: (path, stat) pairs to resolve
+            timeout: Seconds to wait for probes; files still being probed are
+                reported as pending and their probe keeps running to fill the cache
+        """
+        # Las lecturas de SQLite salen del event loop; los aciertos en memoria no
+        results = {}
+        missing = []
+        for file_path, stat in entries:
+            info = self._recall(str(file_path), stat)
+            if info is not None:
+                results[file_path] = info
+            else:
+                missing.append((file_path, stat))
+        if missing:
+            results.update(await asyncio.to_thread(self.lookup_many, missing))
+
+        probes = {
+            file_path: self._probe_in_background(file_path, stat)
+            for file_path, stat in missing if file_path not in results
+        }
+
+        if probes:
+            done, _ = await asyncio.wait(probes.values(), timeout=timeout)
+            for file_path, task in probes.items():
+                results[file_path] = task.result() if task in done else {"probe": "pending"}
+        return results
+
+    def invalidate(self, file_path: Path) -> None:
+        "Forget a file, e.g. after it has been deleted."
+
+        key = str(file_path)
+        with self._memory_lock:
+            self._memory.pop(key, None)
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM video_metadata WHERE path = ?", (key,))
@@ -0,0 +1,286 @@
+import os
+import json
+import math
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+class Metric:
+    "Labelled samples of one metric, safe to update from any thread."
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), exported: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.exported = exported
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        "Label values in declaration order."
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def snapshot(self) -> dict:
+        "Copy of the samples keyed by JSON-encoded label values."
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._samples.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def merge(total, value):
+        "Add the samples of another process."
+        return total + value
+
+
+class Counter(Metric):
+    "Monotonically increasing value."
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    "Value that goes up and down; merged across processes by summing."
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._samples[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    "Distribution of observations in cumulative buckets."
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample["buckets"][index] += 1
+                    break
+            sample["sum"] += value
+            sample["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        "Observe the duration of a block."
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+
+    @staticmethod
+    def merge(total, value):
+        return {
+            "buckets": [a + b for a, b in zip(total["buckets"], value["buckets"])],
+            "sum": total["sum"] + value["sum"],
+            "count": total["count"] + value["count"],
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics, exported in the Prometheus text format.
+
+    uvicorn workers and worker.py are separate processes, so each one periodically
+    writes its samples to `<export_dir>/<pid>.json` and a scrape of any of them
+    merges the files of every live process.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.export_dir = None
+        self._collectors = []
+        self._thread = None
+
+    # --------------- [Private Methods] ---------------
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _write_snapshot(self) -> None:
+        "Atomically publish this process' samples."
+        snapshot = {name: metric.snapshot() for name, metric in self.metrics.items() if metric.exported}
+        target = self.export_dir / f"{os.getpid()}.json"
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, target)
+
+    def _export_loop(self, interval: float) -> None:
+        while True:
+            try:
+                self._write_snapshot()
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    def _read_snapshots(self) -> list:
+        "Samples published by the other live processes; files of dead processes are removed."
+        snapshots = []
+        if not self.export_dir:
+            return snapshots
+        for snapshot_file in self.export_dir.glob("*.json"):
+            pid = int(snapshot_file.stem) if snapshot_file.stem.isdigit() else None
+            if pid is None or pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                snapshot_file.unlink(missing_ok=True)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(snapshot_file, 'r') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    @staticmethod
+    def _format_labels(names: tuple, values: tuple, extra: str = None) -> str:
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    # --------------- [Registry methods] ---------------
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = (), exported: bool = True) -> Gauge:
+        "A gauge; pass exported=False for values read from shared state at scrape time, which must not be summed."
+        return self._register(Gauge(name, documentation, labels, exported))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = None) -> Histogram:
+        if buckets is None:
+            return self._register(Histogram(name, documentation, labels))
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collect) -> None:
+        "Register a callable run before each scrape, e.g. to refresh gauges read from the queue."
+        self._collectors.append(collect)
+
+    def start_export(self, export_dir: Path, interval: float = 5) -> None:
+        "Publish this process' samples every `interval` seconds so other processes can merge them."
+        if self._thread:
+            return
+        self.export_dir = Path(export_dir)
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._export_loop, args=(interval,), name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def render(self) -> str:
+        "All metrics of every process, in the Prometheus text exposition format."
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+
+        others = self._read_snapshots()
+        lines = []
+        for name, metric in self.metrics.items():
+            samples = metric.snapshot()
+            for snapshot in others:
+                for key, value in snapshot.get(name, {}).items():
+                    samples[key] = metric.merge(samples[key], value) if key in samples else value
+
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(samples.items()):
+                label_values = tuple(json.loads(key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{self._format_labels(metric.labels, label_values)} {self._format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value["buckets"]):
+                    cumulative += count
+                    le = f'le="{self._format_value(bound) if bound == math.inf else bound}"'
+                    lines.append(f"{name}_bucket{self._format_labels(metric.labels, label_values, le)} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(metric.labels, label_values)} {self._format_value(value['sum'])}")
+                lines.append(f"{name}_count{self._format_labels(metric.labels, label_values)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --------------- [Metrics] ---------------
+
+QUEUE_TASKS = REGISTRY.gauge("vault_queue_tasks", "Tasks in the processing queue by state.", ("state",), exported=False)
+QUEUE_STORE_SECONDS = REGISTRY.histogram(
+    "vault_queue_store_seconds", "Time spent in queue store operations.", ("backend", "operation"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+TASK_WAIT_SECONDS = REGISTRY.histogram(
+    "vault_task_wait_seconds", "Time from enqueue to claim.", (),
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+)
+TASK_RUN_SECONDS = REGISTRY.histogram(
+    "vault_task_run_seconds", "Time from claim to outcome.", ("outcome",),
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 4 * 3600)
+)
+ENCODE_SPEED = REGISTRY.histogram(
+    "vault_encode_speed_ratio", "Media seconds processed per wall-clock second (x realtime).", ("mode",),
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+)
+ENCODE_CONCURRENCY = REGISTRY.gauge("vault_encode_concurrency", "Jobs the processor daemons run at once, as set by the tuner.")
+ENCODE_THROUGHPUT = REGISTRY.gauge("vault_encode_throughput", "Seconds of video encoded per second over the last tuning window, summed over running jobs.")
+FFMPEG_PROCESSES = REGISTRY.gauge("vault_ffmpeg_processes", "Running ffmpeg processes.")
+UPLOAD_BYTES = REGISTRY.counter("vault_upload_bytes_total", "Bytes received by upload endpoints.", ("kind",))
+UPLOAD_THROUGHPUT = REGISTRY.histogram(
+    "vault_upload_throughput_bytes_per_second", "Throughput of each upload request.", ("kind",),
+    buckets=(1e5, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+)
+PROBE_CALLS = REGISTRY.counter("vault_ffprobe_calls_total", "ffprobe runs by outcome.", ("outcome",))
+PROBE_SECONDS = REGISTRY.histogram("vault_ffprobe_seconds", "ffprobe latency.", ("mode",))
+LISTING_SECONDS = REGISTRY.histogram("vault_listing_seconds", "Latency of directory listings, until the last record.", ("directory", "format"))
+DISK_FREE_BYTES = REGISTRY.gauge("vault_disk_free_bytes", "Free space on the output filesystem.", exported=False)
+DISK_RESERVED_BYTES = REGISTRY.gauge("vault_disk_reserved_bytes", "Space reserved by running encodes and uploads and not yet written.", exported=False)
+PREVIEW_SECONDS = REGISTRY.histogram("vault_preview_seconds", "Time to generate the poster and sprite sheet of a video.", buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300))
+WATCHER_FILES = REGISTRY.counter("vault_watcher_files_total", "Files settled in the watched uploads directory, by outcome.", ("outcome",))
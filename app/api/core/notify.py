@@ -0,0 +1,71 @@
+import os
+import uuid
+import socket
+import threading
+from pathlib import Path
+
+class QueueNotifier:
+    "Wake processor daemons in any process through Unix datagram sockets."
+
+    def __init__(self, socket_dir: Path):
+        "Initialize the notifier on a directory shared by every process."
+        self.socket_dir = Path(socket_dir)
+        self.socket_dir.mkdir(parents=True, exist_ok=True)
+        self._socket = None
+        self._socket_path = None
+        self._thread = None
+
+    # --------------- [Sender] ---------------
+
+    def notify(self) -> None:
+        "Send a wakeup datagram to every listening daemon."
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for path in self.socket_dir.glob("*.sock"):
+                try:
+                    sender.sendto(b"1", str(path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Nobody is bound to it anymore: stale socket from a dead process
+                    path.unlink(missing_ok=True)
+                except BlockingIOError:
+                    # Receive buffer full, the daemon already has a wakeup pending
+                    pass
+
+    # --------------- [Listener] ---------------
+
+    def listen(self, event: threading.Event) -> None:
+        "Bind a socket for this process and set `event` on every datagram received."
+
+        self._socket_path = self.socket_dir / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(str(self._socket_path))
+        self._thread = threading.Thread(target=self._receive, args=(event,), name="queue-notifier", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        "Stop listening and remove this process' socket."
+
+        if self._socket is None:
+            return
+        sock, path = self._socket, self._socket_path
+        self._socket = None
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            try:
+                sender.sendto(b"", str(path))  # Desbloquear recv()
+            except OSError:
+                pass
+        self._thread.join()
+        sock.close()
+        path.unlink(missing_ok=True)
+
+    def _receive(self, event: threading.Event) -> None:
+        "Block on the socket and forward wakeups to the daemon."
+
+        sock = self._socket
+        while self._socket is not None:
+            try:
+                sock.recv(16)
+            except OSError:
+                break
+            event.set()
@@ -0,0 +1,304 @@
+import os
+import math
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .database import Database
+from .metadata import MetadataCache
+from .logging import VideoLogger
+from .metrics import PREVIEW_SECONDS
+
+class PreviewCache:
+    """
+    Poster frames and seek-preview sprite sheets, generated in the background and kept in a
+    content-addressed cache with least-recently-used eviction.
+
+    Each entry lives in `<cache_dir>/<key[:2]>/<key>/` and holds poster.jpg, sprite.jpg and
+    sprite.vtt, the WebVTT index mapping time ranges to tiles of the sprite. The key is the
+    content hash of the video when it is known, so identical uploads share one entry;
+    otherwise it is derived from the inode, which hardlinked copies share as well.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS preview_entries (
+            key TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_previews_accessed ON preview_entries (accessed_at);
+        CREATE TABLE IF NOT EXISTS preview_sources (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            key TEXT NOT NULL
+        )
+    """
+
+    ASSETS = {
+        "poster.jpg": "image/jpeg",
+        "sprite.jpg": "image/jpeg",
+        "sprite.vtt": "text/vtt",
+    }
+
+    DEFAULT = {
+        "max_bytes": 1024 * 1024 * 1024,
+        "interval": 10,
+        "max_tiles": 100,
+        "columns": 10,
+        "tile_width": 160,
+        "poster_width": 640,
+        "workers": 1,
+        "timeout": 600,
+    }
+
+    # Los accesos solo se apuntan en la base de datos una vez por minuto y entrada
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, cache_dir: Path, index_file: Path, metadata_cache: MetadataCache, settings: dict = None, logger: VideoLogger = None):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the generated previews
+            index_file: SQLite database with the entries and the file -> key mapping
+            metadata_cache: Source of the duration and resolution of each video
+            settings: Overrides of DEFAULT (the `previews` section of the config)
+            logger: Where failed generations are reported
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db = Database(index_file)
+        self.metadata_cache = metadata_cache
+        self.settings = {**self.DEFAULT, **(settings or {})}
+        self.logger = logger
+        self._executor = ThreadPoolExecutor(max_workers=self.settings["workers"], thread_name_prefix="previews")
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._touched = {}
+        with self.db.transaction() as conn:
+            self.db.execute_script(conn, self.SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: dict, metadata_cache: MetadataCache, logger: VideoLogger = None) -> "PreviewCache":
+        "Build the cache from the `path.previews` entry and `previews` section of the config."
+        return cls(Path(config["path"]["previews"]), Path(config["path"]["index"]), metadata_cache, config.get("previews"), logger)
+
+    # --------------- [Private Methods] ---------------
+
+    def _entry_dir(self, key: str) -> Path:
+        "Directory of a cache entry, fanned out by the first byte of the key."
+        return self.cache_dir / key[:2] / key
+
+    @staticmethod
+    def _file_key(stat: os.stat_result) -> str:
+        "Key of a file without a known content hash: hardlinked copies share it."
+        identity = f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.blake2b(identity.encode(), digest_size=32).hexdigest()
+
+    def _layout(self, info: dict) -> dict:
+        "Sampling interval, tile grid and tile size of the sprite for a video."
+        duration = info.get("duration") or 0
+        interval = max(self.settings["interval"], duration / self.settings["max_tiles"])
+        count = max(1, math.ceil(duration / interval))
+        columns = min(self.settings["columns"], count)
+
+        width, height = 16, 9
+        streams = info.get("video_streams") or []
+        if streams and "x" in (streams[0].get("resolution") or ""):
+            try:
+                width, height = (int(value) for value in streams[0]["resolution"].split("x"))
+            except ValueError:
+                pass
+        tile_width = self.settings["tile_width"]
+        tile_height = max(2, round(tile_width * height / max(width, 1) / 2) * 2)
+        return {
+            "duration": duration,
+            "interval": interval,
+            "count": count,
+            "columns": columns,
+            "rows": math.ceil(count / columns),
+            "tile_width": tile_width,
+            "tile_height": tile_height,
+            # Póster al 10% del vídeo, pasado el típico fundido de entrada
+            "poster": min(count - 1, int(duration * 0.1 // interval)),
+        }
+
+    def _command(self, source: Path, work_dir: Path, layout: dict) -> list:
+        "One ffmpeg pass decoding only keyframes and writing both the sprite sheet and the poster."
+        graph = (
+            f"[0:v:0]fps=1/{layout['interval']:.3f},split=2[tiles][frames];"
+            f"[tiles]scale={layout['tile_width']}:{layout['tile_height']},tile={layout['columns']}x{layout['rows']}[sprite];"
+            f"[frames]select=eq(n\\,{layout['poster']}),scale={self.settings['poster_width']}:-2[poster]"
+        )
+        return [
+            'ffmpeg', '-y', '-nostdin', '-v', 'error',
+            '-skip_frame', 'nokey', '-i', str(source),
+            '-filter_complex', graph,
+            '-map', '[sprite]', '-frames:v', '1', '-q:v', '4', str(work_dir / "sprite.jpg"),
+            '-map', '[poster]', '-frames:v', '1', '-q:v', '3', str(work_dir / "poster.jpg"),
+        ]
+
+    @staticmethod
+    def _timestamp(seconds: float) -> str:
+        "WebVTT cue time (hh:mm:ss.mmm)."
+        hours, rest = divmod(seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+    def _vtt(self, layout: dict) -> str:
+        "WebVTT cues pointing each time range at its tile with a media fragment."
+        lines = ["WEBVTT", ""]
+        for index in range(layout["count"]):
+            start = index * layout["interval"]
+            end = min((index + 1) * layout["interval"], layout["duration"]) or layout["interval"]
+            x = (index % layout["columns"]) * layout["tile_width"]
+            y = (index // layout["columns"]) * layout["tile_height"]
+            lines.append(f"{self._timestamp(start)} --> {self._timestamp(end)}")
+            lines.append(f"sprite.jpg#xywh={x},{y},{layout['tile_width']},{layout['tile_height']}")
+            lines.append("")
+        return "\n".join(lines)
+
+    def _remember_source(self, source: Path, stat: os.stat_result, key: str) -> None:
+        "Map a file, as it is now, to its preview key."
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO preview_sources (path, size, mtime_ns, key) VALUES (?, ?, ?, ?)",
+                (str(source), stat.st_size, stat.st_mtime_ns, key),
+            )
+
+    def _generate(self, source: Path, key: str) -> None:
+        "Render the previews of one video into a temp directory and publish it atomically."
+        try:
+            stat = os.stat(source)
+            if self.has(key):
+                self._remember_source(source, stat, key)
+                return
+
+            layout = self._layout(self.metadata_cache.get(source, stat))
+            work_dir = self.cache_dir / f".tmp-{uuid.uuid4().hex}"
+            work_dir.mkdir()
+            try:
+                with PREVIEW_SECONDS.time():
+                    subprocess.run(
+                        self._command(source, work_dir, layout),
+                        check=True, capture_output=True, timeout=self.settings["timeout"]
+                    )
+                (work_dir / "sprite.vtt").write_text(self._vtt(layout))
+                size = sum(entry.stat().st_size for entry in work_dir.iterdir())
+
+                entry_dir = self._entry_dir(key)
+                entry_dir.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.rename(work_dir, entry_dir)
+                except OSError:
+                    # Otro proceso ya la generó
+                    pass
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            now = time.time()
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO preview_entries (key, bytes, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, size, now, now),
+                )
+            self._remember_source(source, stat, key)
+            self._evict()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Sin previews la API sigue funcionando: solo se registra el fallo
+            if self.logger:
+                detail = e.stderr.decode(errors="replace").strip() if getattr(e, "stderr", None) else str(e)
+                self.logger.log_error(f"Could not generate previews for {source.name}: {detail}", video=source.name, event="previews")
+        finally:
+            # Otros ficheros con la misma clave pedidos mientras se generaba
+            with self._pending_lock:
+                waiting = self._pending.pop(key, [])
+            if self.has(key):
+                for other in waiting:
+                    try:
+                        self._remember_source(other, os.stat(other), key)
+                    except FileNotFoundError:
+                        continue
+
+    def _evict(self) -> None:
+        "Delete the least recently used entries until the cache fits in `max_bytes`."
+        with self.db.transaction() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM preview_entries").fetchone()[0]
+            if total <= self.settings["max_bytes"]:
+                return
+            evicted = []
+            for row in conn.execute("SELECT key, bytes FROM preview_entries ORDER BY accessed_at").fetchall():
+                if total <= self.settings["max_bytes"]:
+                    break
+                conn.execute("DELETE FROM preview_entries WHERE key = ?", (row["key"],))
+                total -= row["bytes"]
+                evicted.append(row["key"])
+        for key in evicted:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    # --------------- [Cache methods] ---------------
+
+    def schedule(self, source: Path, content_hash: str = None) -> str:
+        "Queue the previews of a video for background generation, unless they are cached. Returns the key."
+        try:
+            key = content_hash or self._file_key(os.stat(source))
+        except FileNotFoundError:
+            return None
+        with self._pending_lock:
+            if key in self._pending:
+                self._pending[key].append(Path(source))
+                return key
+            self._pending[key] = []
+        self._executor.submit(self._generate, Path(source), key)
+        return key
+
+    def has(self, key: str) -> bool:
+        "Whether the previews of a key are cached."
+        return (self._entry_dir(key) / "sprite.vtt").is_file()
+
+    def keys(self, entries: list) -> dict:
+        "Preview key of each cached (path, stat) pair whose file has not changed since, in one query."
+        if not entries:
+            return {}
+        stats = {str(path): stat for path, stat in entries}
+        keys = {}
+        paths = list(stats)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.db.connection().execute(
+                f"SELECT s.path, s.size, s.mtime_ns, s.key FROM preview_sources s "
+                f"JOIN preview_entries e ON e.key = s.key WHERE s.path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                stat = stats[row["path"]]
+                if row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+                    keys[Path(row["path"])] = row["key"]
+        return keys
+
+    def asset(self, key: str, name: str) -> Path:
+        "Path of a cached preview file, marking the entry as recently used, or None."
+        if name not in self.ASSETS or not all(char in "0123456789abcdef" for char in key) or len(key) < 8:
+            return None
+        file_path = self._entry_dir(key) / name
+        if not file_path.is_file():
+            return None
+        now = time.time()
+        if now - self._touched.get(key, 0) > self.TOUCH_INTERVAL:
+            self._touched[key] = now
+            with self.db.transaction() as conn:
+                conn.execute("UPDATE preview_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return file_path
+
+    def forget(self, source: Path) -> None:
+        "Drop the mapping of a deleted file; its previews stay cached until evicted."
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM preview_sources WHERE path = ?", (str(source),))
@@ -1,13 +1,48 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
 import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from .logging import VideoLogger
 from .manager import QueueManager
 from .validate import FileValidator
+from .metadata import MetadataCache
+from .progress import ProgressTracker
+from .profile import TranscodeProfile
+from .dedup import ContentIndex
+from .preview import PreviewCache
+from .tuning import JobSlot
+from .metrics import ENCODE_SPEED, FFMPEG_PROCESSES
 
 class VideoProcessor:
     "Video processor function that handles video processing tasks."
+
+    STDERR_TAIL_LINES = 50
+    STDERR_LINE_LENGTH = 500
+
+    # Estimación de espacio: sobrecoste del contenedor MPEG-TS y bitrate del audio recodificado
+    MUXING_OVERHEAD = 1.05
+    AUDIO_BITRATE = 256_000
+
+    # Errores que no se arreglan reintentando
+    PERMANENT_ERRORS = (
+        "Invalid file extension",
+        "File not found",
+        "Output file already exists",
+        "Invalid data found",
+        "does not contain any stream",
+        "Unknown encoder",
+        "Unrecognized option",
+        "Error opening output",
+    )
     
-    def __init__(self, input_dir: Path, output_dir: Path, queue_manager: QueueManager, file_validator: FileValidator, logger: VideoLogger):
+    def __init__(self, input_dir: Path, output_dir: Path, queue_manager: QueueManager, file_validator: FileValidator, logger: VideoLogger, metadata_cache: MetadataCache = None, profile: TranscodeProfile = None, segmented: dict = None, hls: dict = None, content_index: ContentIndex = None, previews: PreviewCache = None):
         "Initialize video processor."
 
         self.uploads = Path(input_dir)
@@ -15,67 +50,497 @@ class VideoProcessor:
         self.queue_manager = queue_manager
         self.file_validator = file_validator
         self.logger = logger
+        self.metadata_cache = metadata_cache
+        self.profile = profile or TranscodeProfile("default", TranscodeProfile.DEFAULT)
+        self.segmented = segmented or {}
+        self.hls = hls or {}
+        self.content_index = content_index
+        self.previews = previews
+        self._active = {}
+        self._active_lock = threading.Lock()
+        self._slots = {}
+        self._encoded = 0.0
     
-    def process_video(self, filename: str, task_id: str) -> bool:
-        "Process a video file using ffmpeg."
+    def process_video(self, filename: str, task_id: str, threads: int = 0, required_space: int = None, slot: JobSlot = None) -> tuple[bool, str]:
+        """
+        Process a video file using ffmpeg, limited to `threads` encoder threads (0 = ffmpeg default).
+
+        With a `slot`, its CPUs and priorities are applied to every ffmpeg process of the job.
+
+        `required_space` is the disk space reserved for the job on the output filesystem (see
+        `estimate_space`); without it, the validator asks for twice the input size.
+
+        ffmpeg writes to a hidden temp file that is renamed over the output only once it is
+        complete, so a crash never leaves a partial output behind.
+
+        Returns:
+            (success, error message)
+        """
 
         input_file = self.uploads / filename
-        processed_filename = f"processed_{Path(filename).stem}.ts"
-        output_file = self.processed / processed_filename
+        output_file = self.output_file(filename)
+        tmp_file = self._tmp_file(output_file, task_id)
 
-        valid, message = self.file_validator.validate(input_file, output_file)
+        valid, message = self.file_validator.validate(input_file, output_file, required_space, reservation=task_id)
         if not valid:
             self.logger.log_error(f"File validation failed: {message}")
-            self.queue_manager.update_task_status(task_id, "error")
-            return False
+            return False, message
         
+        if slot:
+            self._slots[task_id] = slot
         try:
-            command = [
-                'ffmpeg', '-n',
-                '-i', str(input_file),
-                '-bsf:v', 'h264_mp4toannexb',
-                '-profile:v', 'main', 
-                '-crf', '20',
-                '-codec:v', 'libx264',
-                '-x264opts', 'keyint=100',
-                '-preset', 'fast',
-                '-codec:a', 'aac',
-                '-map', 'v:0',
-                '-map', '0:a',
-                '-strict', '-2',
-                '-sn',
-                '-maxrate', '14M',
-                '-bufsize', '1M',
-                str(output_file)
-            ]
-            
+            content_hash = self._content_hash(input_file)
+            reused = self.reuse_output(filename, content_hash)
+            if reused:
+                self.queue_manager.update_task(task_id, reused)
+                self.logger.log_info(f"{filename}: reused output of identical content {reused['reused_from']}")
+                return True, "OK"
+
+            info = self._probe(input_file)
+            plan = self.profile.plan(info)
+            duration = info.get("duration", 0)
+            segments = self._segment_count(plan, duration, threads)
+            mode = "remux" if self.profile.is_remux(plan) else ("segmented" if segments > 1 else "transcode")
+            hls_dir = self._hls_dir(output_file)
+            fields = {"mode": mode, "plan": plan, "profile": self.profile.name}
+            if hls_dir:
+                shutil.rmtree(hls_dir, ignore_errors=True)
+                hls_dir.mkdir(parents=True)
+                fields["hls"] = hls_dir.name
+            self.queue_manager.update_task(task_id, fields)
+
             self.logger.log_processing_start(filename)
+            started = time.monotonic()
+            self.logger.log_info(f"{filename}: {mode} with profile {self.profile.name} (video {plan['video']}, audio {plan['audio']})")
+
+            if segments > 1:
+                returncode, stderr = self._encode_segmented(input_file, tmp_file, task_id, plan, duration, segments, threads)
+                if returncode == 0 and hls_dir:
+                    returncode, stderr = self._package_hls(tmp_file, hls_dir, task_id)
+            else:
+                # Con HLS activo, el muxer tee escribe el .ts y los segmentos a la vez: se puede reproducir mientras codifica
+                outputs = ['-f', 'tee', self._tee_outputs(tmp_file, hls_dir)] if hls_dir else ['-f', 'mpegts', str(tmp_file)]
+                command = [
+                    'ffmpeg', '-y', '-nostdin',
+                    '-progress', 'pipe:1', '-nostats',
+                    *self.profile.input_args(plan, threads),
+                    '-i', str(input_file),
+                    *self.profile.output_args(plan, threads),
+                    *outputs
+                ]
+                tracker = ProgressTracker(
+                    duration,
+                    on_update=lambda progress: self.queue_manager.update_task_progress(task_id, progress)
+                )
+                returncode, stderr = self._run_ffmpeg(command, task_id, tracker, encoding=plan["video"] == "encode")
             
-            result = subprocess.run(
-                command,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                error_msg = f"FFmpeg error: {result.stderr}"
-                self._handle_error(filename, error_msg, output_file)
-                self.queue_manager.update_task_status(task_id, "error")
-                return False
-            
+            if returncode != 0:
+                error_msg = self._ffmpeg_error(returncode, stderr)
+                # El stderr completo se guarda en la tarea; el log solo lleva el resumen
+                self.queue_manager.update_task(task_id, {"stderr": stderr.splitlines()})
+                self._handle_error(filename, error_msg, tmp_file, hls_dir)
+                return False, error_msg
+
+            if output_file.exists():
+                raise FileExistsError(f"Output file already exists: {output_file.name}")
+            tmp_file.replace(output_file)
+            if duration:
+                ENCODE_SPEED.observe(duration / max(time.monotonic() - started, 1e-3), mode=mode)
+
             self.logger.log_processing_complete(filename)
-            return True
+            self._refresh_metadata(output_file)
+            if content_hash:
+                self.content_index.record_output(content_hash, self._variant(), output_file, hls_dir)
+            return True, "OK"
             
         except Exception as e:
             error_msg = f"Processing error: {str(e)}"
-            self._handle_error(filename, error_msg, output_file)
-            self.queue_manager.update_task_status(task_id, "error", error_msg)
-            return False 
+            self._handle_error(filename, error_msg, tmp_file, self._hls_dir(output_file))
+            return False, error_msg
+        finally:
+            self._slots.pop(task_id, None)
+
+    def estimate_space(self, filename: str, threads: int = 0) -> dict:
+        """
+        Bytes a job will have on disk at its peak in each directory it writes to, from the probed bitrate and duration of the upload.
+
+        Stream copies keep the source bitrate and encodes are capped by the profile's -maxrate.
+        The HLS rendition needs as much again in the HLS directory, which may be on another
+        filesystem, and a segmented encode also holds the split and encoded parts in the output
+        directory until the final join. Without probe info, the output is assumed as big as the
+        input and twice that is reserved in the output directory.
+        """
+
+        input_file = self.uploads / filename
+        size = input_file.stat().st_size
+        if self.content_index:
+            content_hash = self.content_index.lookup(input_file)
+            if content_hash and self.content_index.find_output(content_hash, self._variant()):
+                return {}  # Se enlazará la salida existente
+
+        info = self._probe(input_file)
+        duration = info.get("duration")
+        if "error" in info or not duration:
+            output = size
+            estimate = {self.processed: size * 2}
+        else:
+            bitrate = info.get("bit_rate") or size * 8 / duration
+            plan = self.profile.plan(info)
+            max_bitrate = self.profile.max_bitrate()
+            if plan["video"] == "encode" and max_bitrate:
+                bitrate = min(bitrate, max_bitrate + self.AUDIO_BITRATE)
+            output = int(bitrate / 8 * duration * self.MUXING_OVERHEAD)
+            estimate = {self.processed: output}
+            if self._segment_count(plan, duration, threads) > 1:
+                estimate[self.processed] += size + output
+
+        hls_dir = self._hls_dir(self.output_file(filename))
+        if hls_dir:
+            estimate[hls_dir.parent] = estimate.get(hls_dir.parent, 0) + output
+        return estimate
+
+    def space_parts(self, filename: str, task_id: str, threads: int = 0) -> list:
+        """
+        (directory, bytes, paths) for each directory a job writes to, as reserved in the space ledger.
+
+        The paths are everything the job writes there while it runs, to measure how much of its
+        reservation is already on disk.
+        """
+
+        output_file = self.output_file(filename)
+        paths = {self.processed: [self._tmp_file(output_file, task_id), self.processed / ".work" / task_id]}
+        hls_dir = self._hls_dir(output_file)
+        if hls_dir:
+            hls_dir.parent.mkdir(parents=True, exist_ok=True)
+            paths.setdefault(hls_dir.parent, []).append(hls_dir)
+        return [(directory, size, paths.get(directory, [])) for directory, size in self.estimate_space(filename, threads).items()]
+
+    def is_transient(self, error: str) -> bool:
+        "Whether a failed task is worth retrying (interrupted process, full disk, I/O error...)."
+
+        return not any(marker in (error or "") for marker in self.PERMANENT_ERRORS)
+
+    def remove_stale_files(self, active_task_ids: set) -> int:
+        "Delete temp outputs and work directories left behind by tasks that are no longer running."
+
+        removed = 0
+        for tmp_file in self.processed.glob(".*.processed_*.ts"):
+            if tmp_file.name.split(".")[1] not in active_task_ids:
+                tmp_file.unlink(missing_ok=True)
+                removed += 1
+        work_root = self.processed / ".work"
+        if work_root.is_dir():
+            for work_dir in work_root.iterdir():
+                if work_dir.name not in active_task_ids:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    removed += 1
+        return removed
+
+    def output_file(self, filename: str) -> Path:
+        "Processed file produced from an upload."
+
+        return self.processed / f"processed_{Path(filename).stem}.ts"
+
+    def _tmp_file(self, output_file: Path, task_id: str) -> Path:
+        "Hidden file ffmpeg writes to until the output is complete; the listing skips dot files."
+
+        return output_file.with_name(f".{task_id}.{output_file.name}")
+
+    def reuse_output(self, filename: str, content_hash: str = None) -> dict:
+        """
+        Hardlink the output of an earlier job on identical content instead of encoding again.
+
+        Args:
+            filename: Upload to produce an output for
+            content_hash: Hash of the upload; looked up in the index when omitted
+
+        Returns:
+            Task fields describing the reused output, or None if there is nothing to reuse
+        """
+        if not self.content_index:
+            return None
+        input_file = self.uploads / filename
+        output_file = self.output_file(filename)
+        content_hash = content_hash or self.content_index.lookup(input_file)
+        if not content_hash or output_file.exists():
+            return None
+        source = self.content_index.find_output(content_hash, self._variant())
+        if source is None:
+            return None
+
+        hls_dir = self._hls_dir(output_file)
+        if hls_dir:
+            shutil.rmtree(hls_dir, ignore_errors=True)
+        try:
+            self.content_index.link_output(source, output_file, hls_dir)
+        except Exception:
+            # No dejar una salida a medias que bloquee el reintento
+            output_file.unlink(missing_ok=True)
+            if hls_dir:
+                shutil.rmtree(hls_dir, ignore_errors=True)
+            raise
+        self._refresh_metadata(output_file)
+        fields = {"mode": "reused", "profile": self.profile.name, "reused_from": source[0].name, "content_hash": content_hash}
+        if hls_dir:
+            fields["hls"] = hls_dir.name
+        return fields
+
+    def _content_hash(self, input_file: Path) -> str:
+        "Content hash of an upload, hashing (and deduplicating) it now only if it was not hashed while uploading."
+
+        if not self.content_index:
+            return None
+        content_hash = self.content_index.lookup(input_file)
+        if content_hash is None:
+            # Ficheros copiados al directorio sin pasar por la API (watcher, batch)
+            content_hash = self.content_index.hash_file(input_file)
+            self.content_index.deduplicate(input_file, content_hash)
+        return content_hash
+
+    def _variant(self) -> str:
+        "Key of the output settings; outputs are only reused when they were produced with the same ones."
+
+        settings = [self.profile.copy_video_codecs, self.profile.copy_audio_codecs, self.profile.video_args, self.profile.audio_args]
+        settings.append(self.hls.get("segment_duration", 6) if self.hls.get("enabled") else None)
+        digest = hashlib.blake2b(json.dumps(settings, sort_keys=True, default=sorted).encode(), digest_size=8).hexdigest()
+        return f"{self.profile.name}:{digest}"
+
+    def _hls_dir(self, output_file: Path) -> Path:
+        "Directory with the HLS playlist and segments of an output, or None when HLS is disabled."
+
+        if not self.hls.get("enabled"):
+            return None
+        return Path(self.hls["directory"]) / output_file.stem
+
+    def _hls_options(self, hls_dir: Path) -> dict:
+        "hls muxer options: fixed-duration segments, playlist growing while the encode runs."
+
+        return {
+            "hls_time": str(self.hls.get("segment_duration", 6)),
+            "hls_playlist_type": "event",
+            "hls_flags": "independent_segments+temp_file",
+            "hls_segment_filename": str(hls_dir / "seg_%05d.ts"),
+        }
+
+    def _tee_outputs(self, output_file: Path, hls_dir: Path) -> str:
+        "tee muxer target writing the monolithic .ts and the HLS rendition from a single encode."
+
+        def escape(value: str) -> str:
+            return re.sub(r"([\\:|\[\]'])", r"\\\1", value)
+
+        options = ":".join(f"{key}={escape(value)}" for key, value in self._hls_options(hls_dir).items())
+        return f"[f=mpegts]{escape(str(output_file))}|[f=hls:{options}]{escape(str(hls_dir / 'index.m3u8'))}"
+
+    def _package_hls(self, source: Path, hls_dir: Path, task_id: str) -> tuple[int, str]:
+        "Package an already encoded .ts into HLS without re-encoding."
+
+        command = ['ffmpeg', '-nostdin', '-progress', 'pipe:1', '-nostats', '-i', str(source), '-map', '0', '-codec', 'copy', '-f', 'hls']
+        for key, value in self._hls_options(hls_dir).items():
+            command += [f"-{key}", value]
+        command.append(str(hls_dir / "index.m3u8"))
+        return self._run_ffmpeg(command, f"{task_id}:hls", ProgressTracker(0))
+
+    @staticmethod
+    def _thread_budget(threads: int) -> int:
+        "Encoder threads a job may use: `threads`, or every CPU this process may run on when it is 0 (auto)."
+        return threads or len(os.sched_getaffinity(0))
+
+    def _segment_count(self, plan: dict, duration: float, threads: int) -> int:
+        "How many parallel segments to split a job into (1 = single ffmpeg process)."
+
+        if not self.segmented.get("enabled") or plan["video"] != "encode":
+            return 1
+        if not duration or duration < self.segmented.get("min_duration", 600):
+            return 1
+        budget = self._thread_budget(threads)
+        # Con menos de 4 hilos, trozos de un hilo van más lentos que un solo x264 con todos
+        if budget < 4:
+            return 1
+        # Por defecto, trozos de ~2 hilos cada uno dentro del presupuesto del worker
+        segments = self.segmented.get("segments") or min(8, budget // 2)
+        # Cada segmento debe durar al menos un par de GOPs para que el corte en keyframes tenga sentido
+        return max(1, min(segments, budget // 2, int(duration // 30)))
+
+    def _encode_segmented(self, input_file: Path, output_file: Path, task_id: str, plan: dict, duration: float, segments: int, threads: int) -> tuple[int, str]:
+        """
+        Split the video at keyframes, encode the parts concurrently and join them with the concat demuxer.
+
+        Audio is not split: it is copied or encoded once from the original during the final join,
+        so segment boundaries cannot introduce audio gaps.
+        """
+        work_dir = self.processed / ".work" / task_id
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        try:
+            # 1. Cortar el vídeo sin recodificar; el segmentador solo corta en keyframes
+            split = [
+                'ffmpeg', '-nostdin', '-progress', 'pipe:1', '-nostats',
+                '-i', str(input_file),
+                '-map', '0:v:0', '-an', '-sn', '-codec:v', 'copy',
+                '-f', 'segment', '-segment_time', f"{duration / segments:.3f}", '-reset_timestamps', '1',
+                str(work_dir / "part_%03d.mkv")
+            ]
+            returncode, stderr = self._run_ffmpeg(split, f"{task_id}:split", ProgressTracker(duration))
+            if returncode != 0:
+                return returncode, stderr
+            parts = sorted(work_dir.glob("part_*.mkv"))
+
+            # 2. Codificar los trozos en paralelo, un proceso ffmpeg por trozo
+            progress_lock = threading.Lock()
+            trackers = []
+
+            def report(_):
+                with progress_lock:
+                    self.queue_manager.update_task_progress(task_id, ProgressTracker.combine(trackers, duration))
+
+            for _ in parts:
+                trackers.append(ProgressTracker(duration / len(parts), on_update=report, interval=len(parts)))
+
+            def encode(index: int) -> tuple[int, str]:
+                part_threads = max(1, self._thread_budget(threads) // len(parts))
+                command = [
+                    'ffmpeg', '-nostdin', '-progress', 'pipe:1', '-nostats',
+                    *self.profile.input_args(plan, part_threads),
+                    '-i', str(parts[index]),
+                    *self.profile.segment_args(part_threads),
+                    str(work_dir / f"encoded_{index:03d}.ts")
+                ]
+                result = self._run_ffmpeg(command, f"{task_id}:{index}", trackers[index], encoding=True)
+                if result[0] != 0:
+                    # Anotar el primer fallo antes de matar al resto: sus errores son del SIGTERM
+                    with failure_lock:
+                        failures.append(index)
+                        first = len(failures) == 1
+                    if first:
+                        self.cancel(task_id)  # No tiene sentido seguir con el resto
+                return result
+
+            failure_lock = threading.Lock()
+            failures = []
+            with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix=f"segment-{task_id[:8]}") as pool:
+                results = list(pool.map(encode, range(len(parts))))
+            if failures:
+                return results[failures[0]]
+
+            # 3. Unir los trozos y añadir el audio original
+            concat_list = work_dir / "concat.txt"
+            concat_list.write_text("".join(f"file '{work_dir / f'encoded_{index:03d}.ts'}'\n" for index in range(len(parts))))
+            join = [
+                'ffmpeg', '-y', '-nostdin', '-progress', 'pipe:1', '-nostats',
+                '-f', 'concat', '-safe', '0', '-i', str(concat_list),
+                '-i', str(input_file),
+                *self.profile.concat_args(plan),
+                str(output_file)
+            ]
+            return self._run_ffmpeg(join, f"{task_id}:concat", ProgressTracker(duration))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def cancel(self, task_id: str) -> None:
+        "Terminate the ffmpeg processes of one task."
+
+        with self._active_lock:
+            processes = [process for key, process in self._active.items() if key.split(":")[0] == task_id]
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def _run_ffmpeg(self, command: list, key: str, tracker: ProgressTracker, encoding: bool = False) -> tuple[int, str]:
+        """
+        Run ffmpeg, feeding its -progress output to `tracker`. Returns the exit code and the stderr tail.
+
+        `encoding` runs count towards `encoded_seconds`; remuxes and copies would inflate it.
+        """
+
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        with self._active_lock:
+            self._active[key] = process
+        FFMPEG_PROCESSES.inc()
+        slot = self._slots.get(key.split(":")[0])
+        if slot:
+            slot.apply(process.pid)
+
+        # Leer stderr en paralelo para que ffmpeg no se bloquee con el pipe lleno
+        stderr_tail = deque(maxlen=self.STDERR_TAIL_LINES)
+        lines = (line[:self.STDERR_LINE_LENGTH].rstrip("\n") + "\n" for line in process.stderr)
+        stderr_reader = threading.Thread(target=stderr_tail.extend, args=(lines,), daemon=True)
+        stderr_reader.start()
+        try:
+            placed = False
+            for line in process.stdout:
+                encoded = tracker.out_time
+                tracker.feed(line)
+                if encoding and tracker.out_time > encoded:
+                    with self._active_lock:
+                        self._encoded += tracker.out_time - encoded
+                if slot and not placed and line.startswith("progress="):
+                    # Con el primer bloque de progreso ya existen los hilos del codificador
+                    slot.apply(process.pid)
+                    placed = True
+            process.wait()
+        finally:
+            stderr_reader.join()
+            process.stdout.close()
+            process.stderr.close()
+            with self._active_lock:
+                self._active.pop(key, None)
+            FFMPEG_PROCESSES.dec()
+        return process.returncode, "".join(stderr_tail)
+
+    def _ffmpeg_error(self, returncode: int, stderr: str) -> str:
+        "One-line error for a failed ffmpeg run: the line naming a known permanent error, else the last line."
+
+        lines = [line.strip() for line in stderr.splitlines() if line.strip()]
+        summary = next((line for line in reversed(lines) if any(marker in line for marker in self.PERMANENT_ERRORS)), None)
+        summary = summary or (lines[-1] if lines else "no output")
+        return f"FFmpeg exited with code {returncode}: {summary}"
+
+    def _probe(self, input_file: Path) -> dict:
+        "Input stream info from the metadata cache, probing on a miss."
+
+        if not self.metadata_cache:
+            return {}
+        try:
+            return self.metadata_cache.get(input_file)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def encoded_seconds(self) -> float:
+        "Seconds of video encoded so far by this process, summed over every encode; the tuner's throughput signal."
+
+        return self._encoded
+
+    def cancel_all(self) -> None:
+        "Terminate every running ffmpeg process."
+
+        with self._active_lock:
+            processes = list(self._active.values())
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def _refresh_metadata(self, output_file: Path) -> None:
+        "Index the probe info of a finished output and queue its previews; a failure here must not fail the task."
+
+        if not self.metadata_cache:
+            return
+        try:
+            self.metadata_cache.refresh(output_file)
+        except Exception as e:
+            self.logger.log_error(f"Could not index metadata for {output_file.name}: {str(e)}")
+            return
+        if self.previews:
+            self.previews.schedule(output_file)
 
-    def _handle_error(self, filename: str, error_msg: str, output_file: Path) -> None:
+    def _handle_error(self, filename: str, error_msg: str, tmp_file: Path, hls_dir: Path = None) -> None:
         "Handle processing errors and cleanup."
 
         self.logger.log_processing_error(filename, error_msg)
-        if output_file.exists():
-            output_file.unlink()
\ No newline at end of file
+        tmp_file.unlink(missing_ok=True)
+        if hls_dir:
+            shutil.rmtree(hls_dir, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+class TranscodeProfile:
+    "Encoding settings from config.json and the copy-or-encode decision for each input."
+
+    # Mismos parámetros que el comando original, usados si config.json no define perfiles
+    DEFAULT = {
+        "copy_video_codecs": ["h264"],
+        "copy_audio_codecs": ["aac"],
+        "video": [
+            "-codec:v", "libx264",
+            "-profile:v", "main",
+            "-crf", "20",
+            "-x264opts", "keyint=100",
+            "-preset", "fast",
+            "-maxrate", "14M",
+            "-bufsize", "1M",
+        ],
+        "audio": ["-codec:a", "aac"],
+    }
+
+    def __init__(self, name: str, settings: dict):
+        self.name = name
+        self.copy_video_codecs = set(settings.get("copy_video_codecs", []))
+        self.copy_audio_codecs = set(settings.get("copy_audio_codecs", []))
+        self.video_args = list(settings.get("video", self.DEFAULT["video"]))
+        self.audio_args = list(settings.get("audio", self.DEFAULT["audio"]))
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TranscodeProfile":
+        "Load the active profile from the `transcode` section of the config."
+        transcode = config.get("transcode", {})
+        name = transcode.get("profile", "default")
+        profiles = transcode.get("profiles", {})
+        if name not in profiles and name != "default":
+            raise ValueError(f"Unknown transcode profile: {name}")
+        return cls(name, profiles.get(name, cls.DEFAULT))
+
+    def plan(self, info: dict) -> dict:
+        """
+        Decide per stream type whether the input can be stream-copied.
+
+        Returns:
+            {"video": "copy" | "encode", "audio": "copy" | "encode" | "none"}
+        """
+        video = info.get("video_streams", [])
+        audio = info.get("audio_streams", [])
+        if "error" in info or not video:
+            # Sin información fiable: codificar todo
+            return {"video": "encode", "audio": "encode"}
+
+        video_mode = "copy" if video[0].get("codec") in self.copy_video_codecs else "encode"
+        if not audio:
+            audio_mode = "none"
+        elif all(stream.get("codec") in self.copy_audio_codecs for stream in audio):
+            audio_mode = "copy"
+        else:
+            audio_mode = "encode"
+        return {"video": video_mode, "audio": audio_mode}
+
+    def input_args(self, plan: dict, threads: int = 0) -> list:
+        "ffmpeg input options: cap the decoder threads too when the video is encoded."
+        if plan["video"] == "copy" or not threads:
+            return []
+        return ["-threads", str(threads)]
+
+    def output_args(self, plan: dict, threads: int = 0) -> list:
+        "ffmpeg output options implementing a plan."
+        args = ["-map", "0:v:0", "-map", "0:a?"]
+        if plan["video"] == "copy":
+            args += ["-codec:v", "copy"]
+        else:
+            args += ["-threads", str(threads)] + self.video_args
+        args += ["-bsf:v", "h264_mp4toannexb"]
+
+        if plan["audio"] == "copy":
+            args += ["-codec:a", "copy"]
+        elif plan["audio"] == "encode":
+            args += self.audio_args
+        return args + ["-strict", "-2", "-sn"]
+
+    def segment_args(self, threads: int = 0) -> list:
+        "Output options to encode one video-only segment of a split input."
+        return ["-map", "0:v:0", "-an", "-sn", "-threads", str(threads)] + self.video_args + ["-bsf:v", "h264_mp4toannexb"]
+
+    def concat_args(self, plan: dict) -> list:
+        "Output options to join encoded segments (input 0) with the original audio (input 1)."
+        args = ["-map", "0:v:0", "-map", "1:a?", "-codec:v", "copy", "-bsf:v", "h264_mp4toannexb"]
+        if plan["audio"] == "copy":
+            args += ["-codec:a", "copy"]
+        elif plan["audio"] == "encode":
+            args += self.audio_args
+        return args + ["-strict", "-2", "-sn"]
+
+    @staticmethod
+    def is_remux(plan: dict) -> bool:
+        "Whether no stream needs to be re-encoded."
+        return plan["video"] == "copy" and plan["audio"] != "encode"
+
+    def max_bitrate(self) -> int:
+        "Video bitrate cap (-maxrate) of the encoder settings in bits per second, or None if uncapped."
+        if "-maxrate" not in self.video_args[:-1]:
+            return None
+        value = self.video_args[self.video_args.index("-maxrate") + 1].strip()
+        multiplier = {"k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9}.get(value[-1:].lower(), 1)
+        try:
+            return int(float(value.rstrip("kKmMgG")) * multiplier)
+        except ValueError:
+            return None
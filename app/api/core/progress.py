@@ -0,0 +1,83 @@
+import time
+from typing import Callable
+
+class ProgressTracker:
+    "Incremental parser for the key=value blocks ffmpeg writes with `-progress`."
+
+    def __init__(self, duration: float, on_update: Callable[[dict], None] = None, interval: float = 1.0):
+        """
+        Initialize the tracker.
+
+        Args:
+            duration: Length of the input in seconds (0 if unknown; percent and ETA are then omitted)
+            on_update: Called with a snapshot at most once per `interval` seconds, and at the end
+            interval: Minimum seconds between two calls to `on_update`
+        """
+        self.duration = duration or 0
+        self.on_update = on_update
+        self.interval = interval
+        self.out_time = 0.0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.finished = False
+        self._block = {}
+        self._last_emit = 0.0
+
+    # --------------- [Private Methods] ---------------
+
+    @staticmethod
+    def _number(value: str) -> float:
+        "Parse ffmpeg numbers such as '24.5', '1.23x' or 'N/A'."
+        try:
+            return float(value.rstrip("x"))
+        except (AttributeError, ValueError):
+            return 0.0
+
+    def _apply_block(self) -> None:
+        "Take the values of the block that just ended."
+        block = self._block
+        if "out_time_us" in block or "out_time_ms" in block:
+            # out_time_ms también está en microsegundos (bug histórico de ffmpeg)
+            self.out_time = self._number(block.get("out_time_us", block.get("out_time_ms"))) / 1_000_000
+        self.fps = self._number(block.get("fps"))
+        self.speed = self._number(block.get("speed"))
+        self._block = {}
+
+    # --------------- [Tracker methods] ---------------
+
+    def feed(self, line: str) -> None:
+        "Consume one line of progress output."
+        key, _, value = line.strip().partition("=")
+        if not key:
+            return
+        self._block[key] = value
+        if key == "progress":
+            self.finished = value == "end"
+            self._apply_block()
+            now = time.monotonic()
+            if self.on_update and (self.finished or now - self._last_emit >= self.interval):
+                self._last_emit = now
+                self.on_update(self.snapshot())
+
+    def snapshot(self) -> dict:
+        "Current progress as stored on the task."
+        progress = {
+            "out_time": round(self.out_time, 2),
+            "fps": round(self.fps, 2),
+            "speed": round(self.speed, 3),
+        }
+        if self.duration:
+            remaining = max(self.duration - self.out_time, 0.0)
+            progress["percent"] = 100.0 if self.finished else round(min(self.out_time / self.duration * 100, 99.9), 1)
+            progress["eta"] = 0 if self.finished else (round(remaining / self.speed) if self.speed else None)
+        return progress
+
+    @staticmethod
+    def combine(trackers: list, duration: float) -> dict:
+        "Aggregate snapshot of trackers running in parallel over consecutive parts of one input."
+        total = ProgressTracker(duration)
+        total.out_time = sum(tracker.out_time for tracker in trackers)
+        total.fps = sum(tracker.fps for tracker in trackers)
+        total.speed = sum(tracker.speed for tracker in trackers if not tracker.finished)
+        total.finished = all(tracker.finished for tracker in trackers)
+        return total.snapshot()
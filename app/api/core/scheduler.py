@@ -0,0 +1,127 @@
+import time
+import heapq
+from datetime import datetime, timedelta
+
+class SchedulingPolicy:
+    "Decides which pending task runs next: priority, short-job boost, aging and per-client fair share."
+
+    DEFAULT = {
+        "short_job_seconds": 300,
+        "short_job_boost": 1,
+        "aging_seconds": 1800,
+        "estimated_speed": 1.0,
+        "default_job_seconds": 600,
+    }
+
+    def __init__(self, settings: dict = None, workers: int = 1):
+        """
+        Initialize the policy.
+
+        Args:
+            settings: The `scheduling` section of the config; missing keys take DEFAULT values
+            workers: Number of tasks processed concurrently, used to estimate start times
+        """
+        settings = {**self.DEFAULT, **(settings or {})}
+        self.short_job_seconds = settings["short_job_seconds"]
+        self.short_job_boost = settings["short_job_boost"]
+        self.aging_seconds = settings["aging_seconds"]
+        self.estimated_speed = settings["estimated_speed"]
+        self.default_job_seconds = settings["default_job_seconds"]
+        self.workers = max(1, workers)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SchedulingPolicy":
+        "Build the policy from the `scheduling` and `processing` sections of the config."
+        return cls(config.get("scheduling"), config.get("processing", {}).get("max_workers", 1))
+
+    # --------------- [Private Methods] ---------------
+
+    def _effective_priority(self, task: dict, now: datetime) -> int:
+        "Requested priority, raised for short jobs and for every `aging_seconds` spent waiting."
+        priority = task.get("priority", 0)
+        duration = task.get("duration")
+        if duration and duration <= self.short_job_seconds:
+            priority += self.short_job_boost
+        if self.aging_seconds:
+            # El envejecimiento evita que las tareas de baja prioridad esperen para siempre
+            waited = (now - datetime.fromisoformat(task["created_at"])).total_seconds()
+            priority += int(max(waited, 0) // self.aging_seconds)
+        return priority
+
+    def _job_seconds(self, task: dict, speed: float) -> float:
+        "Expected wall time of a task from its probed duration."
+        duration = task.get("duration")
+        return duration / speed if duration else self.default_job_seconds
+
+    def _observed_speed(self, running: list) -> float:
+        "Mean encode speed of the running tasks, or the configured estimate when none is reported yet."
+        speeds = [task["progress"]["speed"] for task in running if task.get("progress", {}).get("speed")]
+        return sum(speeds) / len(speeds) if speeds else self.estimated_speed
+
+    # --------------- [Policy methods] ---------------
+
+    def order(self, pending: list, running: list, now: datetime = None) -> list:
+        """
+        Sort pending tasks in the order they will be claimed.
+
+        Higher effective priority goes first. Within a priority level, clients take
+        turns: a task's fair-share rank is the number of tasks its client already has
+        running plus the number of its tasks queued ahead of it, so one bulk import
+        cannot hold the queue while other clients wait. Ties keep submission order.
+        """
+        now = now or datetime.now()
+        in_flight = {}
+        for task in running:
+            client = task.get("client")
+            in_flight[client] = in_flight.get(client, 0) + 1
+
+        levels = {task["id"]: self._effective_priority(task, now) for task in pending}
+        queued = {}
+        keys = {}
+        for position, task in enumerate(sorted(pending, key=lambda task: -levels[task["id"]])):
+            client = task.get("client")
+            level = levels[task["id"]]
+            rank = queued.get((client, level), 0)
+            queued[(client, level)] = rank + 1
+            keys[task["id"]] = (-level, in_flight.get(client, 0) + rank, position)
+        return sorted(pending, key=lambda task: keys[task["id"]])
+
+    def select(self, pending: list, running: list) -> dict:
+        "Return the task to claim next, or None. Tasks waiting out a retry backoff are not eligible."
+        now = time.time()
+        ordered = self.order([task for task in pending if task.get("not_before", 0) <= now], running)
+        return ordered[0] if ordered else None
+
+    def estimate(self, pending: list, running: list, now: datetime = None, workers: int = None) -> dict:
+        """
+        Queue position and estimated start of every pending task.
+
+        Args:
+            workers: Tasks processed concurrently right now, when known (the tuner may have
+                moved it away from the configured value)
+
+        Returns:
+            {task_id: {"position": int, "estimated_start": iso timestamp}}
+        """
+        now = now or datetime.now()
+        speed = self._observed_speed(running)
+        workers = max(1, workers or self.workers)
+
+        # Momento en que queda libre cada worker
+        free_at = []
+        for task in running[:workers]:
+            eta = task.get("progress", {}).get("eta")
+            free_at.append(eta if eta is not None else self._job_seconds(task, speed))
+        free_at += [0.0] * (workers - len(free_at))
+        heapq.heapify(free_at)
+
+        estimates = {}
+        for position, task in enumerate(self.order(pending, running, now), start=1):
+            # Una tarea en espera de reintento no empieza antes de su not_before
+            start = max(heapq.heappop(free_at), task.get("not_before", 0) - time.time())
+            heapq.heappush(free_at, start + self._job_seconds(task, speed))
+            estimates[task["id"]] = {
+                "position": position,
+                "estimated_start": (now + timedelta(seconds=round(start))).isoformat(timespec="seconds"),
+            }
+        return estimates
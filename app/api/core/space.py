@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import shutil
+from pathlib import Path
+from .database import Database
+
+class InsufficientSpaceError(Exception):
+    "A job does not fit on disk next to the space already reserved by others."
+
+
+class SpaceLedger:
+    """
+    Disk space promised to running encodes and uploads, shared by every process.
+
+    A reservation holds the estimated final size of what a job is going to write. The
+    bytes it has already written to its `paths` are on disk, and so already missing from
+    the free space, so only the remainder counts as committed. New reservations are
+    admitted under the database lock, which makes check-and-reserve atomic across the
+    uvicorn workers and worker.py.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS space_reservations (
+            id TEXT PRIMARY KEY,
+            device INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            paths TEXT NOT NULL,
+            pid INTEGER,
+            created_at REAL NOT NULL
+        )
+    """
+
+    # Margen antes de dar por abandonada una reserva sin dueño cuyos ficheros aún no existen
+    UNOWNED_GRACE = 60
+
+    def __init__(self, ledger_file: Path, min_free: int = 0):
+        """
+        Initialize the ledger in the library database.
+
+        Args:
+            ledger_file: SQLite database file
+            min_free: Bytes that must stay free on every filesystem after all reservations
+        """
+        self.db = Database(ledger_file)
+        self.min_free = min_free
+        with self.db.transaction() as conn:
+            self.db.execute_script(conn, self.SCHEMA)
+
+    # --------------- [Private Methods] ---------------
+
+    @staticmethod
+    def _used(path: Path) -> int:
+        "Bytes allocated on disk to a file or a directory tree (preallocated uploads included)."
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0
+        if not os.path.isdir(path):
+            return stat.st_blocks * 512
+        used = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    used += os.stat(os.path.join(root, name)).st_blocks * 512
+                except FileNotFoundError:
+                    continue
+        return used
+
+    def _is_stale(self, row, now: float) -> bool:
+        "A reservation whose process died, or an unowned one whose files are gone."
+        if row["pid"] is not None:
+            try:
+                os.kill(row["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+            return False
+        if now - row["created_at"] < self.UNOWNED_GRACE:
+            return False
+        return not any(os.path.exists(path) for path in json.loads(row["paths"]))
+
+    @staticmethod
+    def _belongs(part_id: str, reservation_id: str) -> bool:
+        "Whether a row is `reservation_id` or one of its parts on other filesystems."
+        return part_id == reservation_id or part_id.startswith(f"{reservation_id}/")
+
+    def _rows(self, conn, devices: list) -> list:
+        "Reservation rows on the given filesystems."
+        return conn.execute(
+            f"SELECT * FROM space_reservations WHERE device IN ({','.join('?' * len(devices))})", devices
+        ).fetchall()
+
+    def _measure(self, rows: list, written: dict = None) -> dict:
+        "Bytes already on disk for each reservation id, measuring only the rows missing from `written`."
+        written = dict(written or {})
+        for row in rows:
+            if row["id"] not in written:
+                written[row["id"]] = sum(self._used(Path(path)) for path in json.loads(row["paths"]))
+        return written
+
+    def _outstanding(self, rows: list, written: dict, device: int, exclude: str = None) -> tuple[int, list, list]:
+        "Bytes still to be written by the live reservations on a filesystem (but `exclude`), and the ids of stale ones."
+        now = time.time()
+        committed = 0
+        reservations = []
+        stale = []
+        for row in rows:
+            if row["device"] != device:
+                continue
+            if self._is_stale(row, now):
+                stale.append(row["id"])
+                continue
+            if exclude and self._belongs(row["id"], exclude):
+                continue
+            remaining = max(0, row["bytes"] - written.get(row["id"], 0))
+            committed += remaining
+            reservations.append({"id": row["id"], "bytes": row["bytes"], "remaining": remaining})
+        return committed, reservations, stale
+
+    # --------------- [Ledger methods] ---------------
+
+    def reserve(self, reservation_id: str, directory: Path, size: int, paths: list = (), owned: bool = True) -> tuple[bool, str]:
+        """
+        Reserve `size` bytes on the filesystem of `directory` if they fit next to every other reservation.
+
+        Args:
+            reservation_id: Task or upload id; reserving an existing id again keeps the first reservation
+            directory: Where the job writes
+            size: Estimated total bytes the job will write
+            paths: Files or directories the job writes to, measured to discount what is already written
+            owned: Released automatically when this process dies; pass False for reservations that
+                outlive a request (chunked uploads), which are dropped once their paths are gone
+        """
+        return self.reserve_parts(reservation_id, [(directory, size, paths)], owned)
+
+    def reserve_parts(self, reservation_id: str, parts: list, owned: bool = True) -> tuple[bool, str]:
+        """
+        Reserve space for a job that writes to several directories, possibly on different filesystems: all parts fit or none is reserved.
+
+        Args:
+            reservation_id: Task id; released as a whole with `release`
+            parts: (directory, size, paths) for every directory the job writes to, as in `reserve`
+            owned: As in `reserve`
+        """
+        rows = []
+        needed = {}
+        for directory, size, paths in parts:
+            device = os.stat(directory).st_dev
+            rows.append((device, int(size), json.dumps([str(path) for path in paths])))
+            needed.setdefault(device, [directory, 0])[1] += int(size)
+
+        # Medir lo ya escrito fuera del bloqueo; bajo el bloqueo solo se miden las reservas nuevas.
+        # Lo escrito solo crece, así que una medida algo vieja sobreestima lo comprometido.
+        written = self._measure(self._rows(self.db.connection(), list(needed)))
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM space_reservations WHERE id = ?", (reservation_id,)).fetchone():
+                return True, "OK"
+            current = self._rows(conn, list(needed))
+            written = self._measure(current, written)
+            for device, (directory, size) in needed.items():
+                committed, reservations, stale = self._outstanding(current, written, device)
+                for stale_id in stale:
+                    conn.execute("DELETE FROM space_reservations WHERE id = ?", (stale_id,))
+                free = shutil.disk_usage(directory).free
+                available = free - committed - self.min_free
+                if size > available:
+                    return False, (
+                        f"Not enough disk space in {directory}: needs {size} bytes, {free} free, "
+                        f"{committed} reserved by {len(reservations)} running jobs"
+                    )
+            # La primera parte lleva el id de la reserva; las demás, id/n
+            for index, (device, size, paths) in enumerate(rows):
+                conn.execute(
+                    "INSERT INTO space_reservations (id, device, bytes, paths, pid, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (reservation_id if index == 0 else f"{reservation_id}/{index}", device, size, paths, os.getpid() if owned else None, time.time()),
+                )
+        return True, "OK"
+
+    def release(self, reservation_id: str) -> None:
+        "Give back the space of a finished, failed or cancelled job, on every filesystem it reserved."
+        with self.db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM space_reservations WHERE id = ? OR substr(id, 1, ?) = ?",
+                (reservation_id, len(reservation_id) + 1, f"{reservation_id}/"),
+            )
+
+    def usage(self, directory: Path, exclude: str = None) -> dict:
+        "Free, committed and still available bytes on the filesystem of `directory`, leaving out the reservation `exclude`."
+        device = os.stat(directory).st_dev
+        # Solo lectura: no toma el bloqueo de escritura; las reservas caducadas se borran en reserve_parts
+        rows = self._rows(self.db.connection(), [device])
+        committed, reservations, _ = self._outstanding(rows, self._measure(rows), device, exclude)
+        free = shutil.disk_usage(directory).free
+        return {
+            "free": free,
+            "reserved": committed,
+            "available": max(0, free - committed - self.min_free),
+            "reservations": reservations,
+        }
@@ -0,0 +1,566 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+from .database import Database
+from .metrics import QUEUE_STORE_SECONDS
+
+STATES = ("pending", "processing", "completed", "error")
+
+
+def _matches(task: dict, expect: dict) -> bool:
+    "Whether a task has every expected field value."
+    return not expect or all(task.get(key) == value for key, value in expect.items())
+
+
+class QueueStore(ABC):
+    "Storage backend interface for the processing queue."
+
+    @abstractmethod
+    def add(self, task: dict) -> None:
+        "Insert a new task."
+
+    @abstractmethod
+    def add_many(self, tasks: list, unique_statuses: tuple = ()) -> list:
+        """
+        Insert many tasks in one transaction.
+
+        Args:
+            unique_statuses: Skip a task when its filename already has a task in one of these
+                statuses, or appears earlier in the batch
+
+        Returns:
+            For each input task, the inserted task or the existing one it duplicates
+        """
+
+    @abstractmethod
+    def get(self, task_id: str) -> dict:
+        "Return a task by id, or None."
+
+    @abstractmethod
+    def get_many(self, task_ids: list) -> dict:
+        "Return the tasks that exist among `task_ids`, keyed by id."
+
+    @abstractmethod
+    def update(self, task_id: str, fields: dict, expect: dict = None) -> dict:
+        """
+        Merge `fields` into a task and return it, or None if it does not exist.
+
+        Args:
+            expect: Only update if the task currently has these values (compare-and-set);
+                returns None otherwise
+        """
+
+    @abstractmethod
+    def claim(self, updated_at: str, select: Callable[[list, list], dict] = None, fields: dict = None, short_job_seconds: float = None) -> dict:
+        """
+        Atomically move the next pending task to processing, count the attempt and return it.
+
+        Args:
+            updated_at: Timestamp stored on the claimed task
+            select: Called with (pending, processing) task lists inside the claim to
+                pick the task; the oldest pending task not waiting for a retry is taken when omitted
+            fields: Extra fields stored on the claimed task, e.g. its lease
+            short_job_seconds: Duration up to which `select` boosts a task; backends that
+                only hand `select` part of the queue keep the oldest short task of every group
+        """
+
+    @abstractmethod
+    def find_by_filename(self, filename: str, statuses: tuple) -> dict:
+        "Return the first task for `filename` in any of `statuses`, or None."
+
+    @abstractmethod
+    def find_by_filenames(self, filenames: list, statuses: tuple) -> dict:
+        "Return, keyed by filename, the first task of each of `filenames` in any of `statuses`."
+
+    @abstractmethod
+    def list(self, status: str) -> list:
+        "Return every task in a given status, oldest first."
+
+    @abstractmethod
+    def counts(self) -> dict:
+        "Return the number of tasks per status."
+
+
+class JsonQueueStore(QueueStore):
+    "Legacy backend that keeps the whole queue in a single JSON file."
+
+    def __init__(self, queue_file: Path):
+        self.queue_file = Path(queue_file)
+        self.lock_file = self.queue_file.with_suffix(".lock")
+        self._thread_lock = threading.Lock()
+        self._create()
+
+    # --------------- [Private Methods] ---------------
+
+    def _create(self) -> None:
+        "Create queue file if not exists."
+        if not self.queue_file.exists():
+            self.queue_file.parent.mkdir(parents=True, exist_ok=True)
+            self._save({state: [] for state in STATES})
+
+    def _save(self, queue_data: dict) -> None:
+        "Dump data into the queue file, replacing it atomically so readers never see a partial write."
+        tmp_file = self.queue_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(queue_data, f, indent=4)
+        os.replace(tmp_file, self.queue_file)
+
+    def _load(self) -> dict:
+        "Read the current status of the queue file."
+        with open(self.queue_file, 'r') as f:
+            return json.load(f)
+
+    @contextmanager
+    def _lock(self):
+        "Serialize read-modify-write cycles across threads and processes."
+        with self._thread_lock:
+            with open(self.lock_file, 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # --------------- [Store methods] ---------------
+
+    def add(self, task: dict) -> None:
+        with self._lock():
+            queue_data = self._load()
+            queue_data[task["status"]].append(task)
+            self._save(queue_data)
+
+    def add_many(self, tasks: list, unique_statuses: tuple = ()) -> list:
+        with self._lock():
+            queue_data = self._load()
+            existing = {}
+            for state in reversed(unique_statuses):
+                existing.update((task["filename"], task) for task in reversed(queue_data[state]))
+            results = []
+            for task in tasks:
+                if unique_statuses and task["filename"] in existing:
+                    results.append(existing[task["filename"]])
+                    continue
+                queue_data[task["status"]].append(task)
+                existing[task["filename"]] = task
+                results.append(task)
+            self._save(queue_data)
+        return results
+
+    def get(self, task_id: str) -> dict:
+        queue_data = self._load()
+        for state in STATES:
+            for task in queue_data[state]:
+                if task["id"] == task_id:
+                    return task
+        return None
+
+    def get_many(self, task_ids: list) -> dict:
+        wanted = set(task_ids)
+        queue_data = self._load()
+        return {task["id"]: task for state in STATES for task in queue_data[state] if task["id"] in wanted}
+
+    def update(self, task_id: str, fields: dict, expect: dict = None) -> dict:
+        with self._lock():
+            queue_data = self._load()
+            for state in STATES:
+                for task in queue_data[state]:
+                    if task["id"] == task_id:
+                        break
+                else:
+                    continue
+                break
+            else:
+                return None
+
+            if not _matches(task, expect):
+                return None
+            task.update(fields)
+            if task["status"] != state:
+                queue_data[state].remove(task)
+                queue_data[task["status"]].append(task)
+            self._save(queue_data)
+        return task
+
+    def claim(self, updated_at: str, select: Callable[[list, list], dict] = None, fields: dict = None, short_job_seconds: float = None) -> dict:
+        with self._lock():
+            queue_data = self._load()
+            if not queue_data["pending"]:
+                return None
+
+            if select:
+                task = select(queue_data["pending"], queue_data["processing"])
+            else:
+                # La más antigua que no esté esperando un reintento
+                now = time.time()
+                task = next((task for task in queue_data["pending"] if (task.get("not_before") or 0) <= now), None)
+            if task is None:
+                return None
+            queue_data["pending"].remove(task)
+            task.update(fields or {})
+            task["status"] = "processing"
+            task["updated_at"] = updated_at
+            task["attempts"] = task.get("attempts", 0) + 1
+
+            queue_data["processing"].append(task)
+            self._save(queue_data)
+        return task
+
+    def find_by_filename(self, filename: str, statuses: tuple) -> dict:
+        queue_data = self._load()
+        for state in statuses:
+            for task in queue_data[state]:
+                if task["filename"] == filename:
+                    return task
+        return None
+
+    def find_by_filenames(self, filenames: list, statuses: tuple) -> dict:
+        wanted = set(filenames)
+        queue_data = self._load()
+        found = {}
+        for state in statuses:
+            for task in queue_data[state]:
+                if task["filename"] in wanted:
+                    found.setdefault(task["filename"], task)
+        return found
+
+    def list(self, status: str) -> list:
+        return self._load()[status]
+
+    def counts(self) -> dict:
+        queue_data = self._load()
+        return {state: len(queue_data[state]) for state in STATES}
+
+
+class SqliteQueueStore(QueueStore):
+    "Indexed, transactional backend on SQLite in WAL mode, safe across threads and processes."
+
+    COLUMNS = ("id", "filename", "status", "created_at", "updated_at")
+
+    # Campos que usa la política de planificación, en columnas indexadas en vez de en el blob
+    SCHEDULING = ("priority", "client", "duration", "not_before")
+
+    # Límite de parámetros por consulta IN (...) en SQLite antiguos
+    BATCH = 500
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS processing_queue (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            data TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_queue_status ON processing_queue (status);
+        CREATE INDEX IF NOT EXISTS idx_queue_filename ON processing_queue (filename, status);
+    """
+
+    # Versión 2: columnas de planificación para que el claim no lea toda la cola
+    SCHEDULING_SCHEMA = """
+        ALTER TABLE processing_queue ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE processing_queue ADD COLUMN client TEXT;
+        ALTER TABLE processing_queue ADD COLUMN duration REAL;
+        ALTER TABLE processing_queue ADD COLUMN not_before REAL;
+    """
+
+    # Versión 3: índices por cliente y prioridad para las consultas del claim
+    CLAIM_SCHEMA = """
+        DROP INDEX IF EXISTS idx_queue_priority;
+        DROP INDEX IF EXISTS idx_queue_duration;
+        DROP INDEX IF EXISTS idx_queue_client;
+        CREATE INDEX idx_queue_client ON processing_queue (status, client, priority);
+        CREATE INDEX idx_queue_short ON processing_queue (status, client, priority, duration, not_before);
+    """
+
+    def __init__(self, db_file: Path, legacy_file: Path = None):
+        self.db = Database(db_file)
+        self._create(legacy_file)
+
+    # --------------- [Private Methods] ---------------
+
+    def _create(self, legacy_file: Path) -> None:
+        "Create the schema and import the legacy JSON queue the first time."
+        with self.db.transaction() as conn:
+            self.db.execute_script(conn, self.SCHEMA)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 2:
+                self.db.execute_script(conn, self.SCHEDULING_SCHEMA)
+            if version == 0:
+                if legacy_file and Path(legacy_file).exists():
+                    with open(legacy_file, 'r') as f:
+                        legacy = json.load(f)
+                    for state in STATES:
+                        for task in legacy.get(state, []):
+                            self._insert(conn, task)
+            elif version == 1:
+                # Sacar los campos de planificación del blob a sus columnas
+                for row in conn.execute("SELECT * FROM processing_queue").fetchall():
+                    self._write(conn, self._row_to_task(row))
+            if version < 3:
+                self.db.execute_script(conn, self.CLAIM_SCHEMA)
+            conn.execute("PRAGMA user_version = 3")
+
+    def _extra(self, task: dict) -> str:
+        "The data blob: every field without a column of its own."
+        return json.dumps({k: v for k, v in task.items() if k not in self.COLUMNS and k not in self.SCHEDULING})
+
+    def _insert(self, conn: sqlite3.Connection, task: dict) -> None:
+        "Insert a task dict, keeping non-column fields in the data blob."
+        conn.execute(
+            "INSERT OR IGNORE INTO processing_queue (id, filename, status, created_at, updated_at, priority, client, duration, not_before, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                task["id"], task["filename"], task["status"], task["created_at"], task["updated_at"],
+                task.get("priority") or 0, task.get("client"), task.get("duration"), task.get("not_before"), self._extra(task),
+            ),
+        )
+
+    def _row_to_task(self, row: sqlite3.Row) -> dict:
+        "Rebuild a task dict from a table row."
+        if row is None:
+            return None
+        task = {column: row[column] for column in self.COLUMNS}
+        # Antes de la versión 2 estos campos están en el blob
+        keys = row.keys()
+        task.update((column, row[column]) for column in self.SCHEDULING if column in keys and row[column] is not None)
+        task.update(json.loads(row["data"]))
+        return task
+
+    def _select_status(self, conn: sqlite3.Connection, status: str) -> list:
+        "Every task in a given status, oldest first."
+        rows = conn.execute("SELECT * FROM processing_queue WHERE status = ? ORDER BY rowid", (status,)).fetchall()
+        return [self._row_to_task(row) for row in rows]
+
+    def _select_in(self, conn: sqlite3.Connection, column: str, values: list, extra: str = "", params: tuple = ()) -> list:
+        "Tasks whose `column` is in `values`, querying in batches of BATCH."
+        tasks = []
+        values = list(values)
+        for start in range(0, len(values), self.BATCH):
+            chunk = values[start:start + self.BATCH]
+            rows = conn.execute(
+                f"SELECT * FROM processing_queue WHERE {column} IN ({', '.join('?' for _ in chunk)}){extra} ORDER BY rowid",
+                (*chunk, *params),
+            ).fetchall()
+            tasks += [self._row_to_task(row) for row in rows]
+        return tasks
+
+    def _write(self, conn: sqlite3.Connection, task: dict) -> None:
+        "Persist every field of an existing task."
+        conn.execute(
+            "UPDATE processing_queue SET filename = ?, status = ?, updated_at = ?, priority = ?, client = ?, duration = ?, not_before = ?, data = ?"
+            " WHERE id = ?",
+            (
+                task["filename"], task["status"], task["updated_at"], task.get("priority") or 0, task.get("client"),
+                task.get("duration"), task.get("not_before"), self._extra(task), task["id"],
+            ),
+        )
+
+    def _groups(self, conn: sqlite3.Connection) -> list:
+        "Distinct (client, priority) pairs of the pending tasks, jumping through the index instead of scanning it."
+
+        def next_value(column: str, where: str, params: tuple, after) -> tuple:
+            query = f"SELECT {column} FROM processing_queue WHERE status = 'pending' AND {where}"
+            if after is not None:
+                query, params = query + f" AND {column} > ?", (*params, after)
+            return conn.execute(query + f" ORDER BY {column} LIMIT 1", params).fetchone()
+
+        clients = [None] if conn.execute("SELECT 1 FROM processing_queue WHERE status = 'pending' AND client IS NULL LIMIT 1").fetchone() else []
+        row = next_value("client", "client IS NOT NULL", (), None)
+        while row:
+            clients.append(row[0])
+            row = next_value("client", "client IS NOT NULL", (), row[0])
+
+        groups = []
+        for client in clients:
+            row = next_value("priority", "client IS ?", (client,), None)
+            while row:
+                groups.append((client, row[0]))
+                row = next_value("priority", "client IS ?", (client,), row[0])
+        return groups
+
+    def _candidates(self, conn: sqlite3.Connection, now: float, short_job_seconds: float = None) -> list:
+        """
+        Eligible pending tasks a scheduling policy can pick from, read through the indexes.
+
+        For each client and requested priority, the oldest eligible task and, with
+        `short_job_seconds`, the oldest eligible short one. Inside such a group the
+        short-job boost is the same for every task and waiting longer only raises the
+        effective priority (aging), so the first task of each client at the top effective
+        priority, which is what fair share and ties choose from, is always in the set
+        (tasks are inserted as they are created, so rowid order is age order).
+        The claim costs two index lookups per group instead of reading the whole queue.
+        """
+        eligible = "status = 'pending' AND client IS ? AND priority = ? AND (not_before IS NULL OR not_before <= ?)"
+        rows = {}
+        for client, priority in self._groups(conn):
+            queries = [(f"SELECT rowid, * FROM processing_queue WHERE {eligible} ORDER BY rowid LIMIT 1", (client, priority, now))]
+            if short_job_seconds:
+                queries.append((
+                    f"SELECT rowid, * FROM processing_queue WHERE {eligible} AND duration > 0 AND duration <= ? ORDER BY rowid LIMIT 1",
+                    (client, priority, now, short_job_seconds),
+                ))
+            for query, params in queries:
+                row = conn.execute(query, params).fetchone()
+                if row:
+                    rows[row["rowid"]] = row
+        # Orden de llegada, como espera la política para deshacer empates
+        return [self._row_to_task(row) for _, row in sorted(rows.items())]
+
+    # --------------- [Store methods] ---------------
+
+    def add(self, task: dict) -> None:
+        with self.db.transaction() as conn:
+            self._insert(conn, task)
+
+    def add_many(self, tasks: list, unique_statuses: tuple = ()) -> list:
+        with self.db.transaction() as conn:
+            existing = {}
+            if unique_statuses:
+                placeholders = ", ".join("?" for _ in unique_statuses)
+                for task in self._select_in(conn, "filename", {task["filename"] for task in tasks}, f" AND status IN ({placeholders})", unique_statuses):
+                    existing.setdefault(task["filename"], task)
+            results = []
+            for task in tasks:
+                if unique_statuses and task["filename"] in existing:
+                    results.append(existing[task["filename"]])
+                    continue
+                self._insert(conn, task)
+                existing[task["filename"]] = task
+                results.append(task)
+        return results
+
+    def get(self, task_id: str) -> dict:
+        row = self.db.connection().execute("SELECT * FROM processing_queue WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row)
+
+    def get_many(self, task_ids: list) -> dict:
+        return {task["id"]: task for task in self._select_in(self.db.connection(), "id", set(task_ids))}
+
+    def update(self, task_id: str, fields: dict, expect: dict = None) -> dict:
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT * FROM processing_queue WHERE id = ?", (task_id,)).fetchone()
+            task = self._row_to_task(row)
+            if task is None or not _matches(task, expect):
+                return None
+            task.update(fields)
+            self._write(conn, task)
+        return task
+
+    def claim(self, updated_at: str, select: Callable[[list, list], dict] = None, fields: dict = None, short_job_seconds: float = None) -> dict:
+        with self.db.transaction() as conn:
+            if select is None:
+                row = conn.execute(
+                    "SELECT * FROM processing_queue WHERE status = 'pending' AND (not_before IS NULL OR not_before <= ?) ORDER BY rowid LIMIT 1",
+                    (time.time(),),
+                ).fetchone()
+                task = self._row_to_task(row)
+            else:
+                # La política elige entre las ventanas indexadas, no entre toda la cola
+                pending = self._candidates(conn, time.time(), short_job_seconds)
+                # De lo que está en curso la política solo usa el cliente (reparto justo)
+                running = [{"client": row[0]} for row in conn.execute("SELECT client FROM processing_queue WHERE status = 'processing'")]
+                task = select(pending, running) if pending else None
+            if task is None:
+                return None
+            task.update(fields or {})
+            task["status"] = "processing"
+            task["updated_at"] = updated_at
+            task["attempts"] = task.get("attempts", 0) + 1
+            self._write(conn, task)
+        return task
+
+    def find_by_filename(self, filename: str, statuses: tuple) -> dict:
+        placeholders = ", ".join("?" for _ in statuses)
+        row = self.db.connection().execute(
+            f"SELECT * FROM processing_queue WHERE filename = ? AND status IN ({placeholders}) LIMIT 1",
+            (filename, *statuses),
+        ).fetchone()
+        return self._row_to_task(row)
+
+    def find_by_filenames(self, filenames: list, statuses: tuple) -> dict:
+        placeholders = ", ".join("?" for _ in statuses)
+        found = {}
+        for task in self._select_in(self.db.connection(), "filename", set(filenames), f" AND status IN ({placeholders})", tuple(statuses)):
+            found.setdefault(task["filename"], task)
+        return found
+
+    def list(self, status: str) -> list:
+        return self._select_status(self.db.connection(), status)
+
+    def counts(self) -> dict:
+        counts = {state: 0 for state in STATES}
+        for status, count in self.db.connection().execute(
+            "SELECT status, COUNT(*) FROM processing_queue GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+
+class TimedQueueStore(QueueStore):
+    "Wrapper that records the time spent in every call to another backend."
+
+    def __init__(self, store: QueueStore, backend: str):
+        self.store = store
+        self.backend = backend
+
+    def _timed(self, operation: str):
+        return QUEUE_STORE_SECONDS.time(backend=self.backend, operation=operation)
+
+    def add(self, task: dict) -> None:
+        with self._timed("add"):
+            return self.store.add(task)
+
+    def add_many(self, tasks: list, unique_statuses: tuple = ()) -> list:
+        with self._timed("add_many"):
+            return self.store.add_many(tasks, unique_statuses)
+
+    def get(self, task_id: str) -> dict:
+        with self._timed("get"):
+            return self.store.get(task_id)
+
+    def get_many(self, task_ids: list) -> dict:
+        with self._timed("get_many"):
+            return self.store.get_many(task_ids)
+
+    def update(self, task_id: str, fields: dict, expect: dict = None) -> dict:
+        with self._timed("update"):
+            return self.store.update(task_id, fields, expect)
+
+    def claim(self, updated_at: str, select: Callable[[list, list], dict] = None, fields: dict = None, short_job_seconds: float = None) -> dict:
+        with self._timed("claim"):
+            return self.store.claim(updated_at, select, fields, short_job_seconds)
+
+    def find_by_filename(self, filename: str, statuses: tuple) -> dict:
+        with self._timed("find_by_filename"):
+            return self.store.find_by_filename(filename, statuses)
+
+    def find_by_filenames(self, filenames: list, statuses: tuple) -> dict:
+        with self._timed("find_by_filenames"):
+            return self.store.find_by_filenames(filenames, statuses)
+
+    def list(self, status: str) -> list:
+        with self._timed("list"):
+            return self.store.list(status)
+
+    def counts(self) -> dict:
+        with self._timed("counts"):
+            return self.store.counts()
+
+
+def create_store(queue_file: Path, config: dict) -> QueueStore:
+    "Build the queue backend selected by `processing.queue_backend` (defaults to sqlite)."
+
+    backend = config.get("processing", {}).get("queue_backend", "sqlite")
+    if backend == "json":
+        return TimedQueueStore(JsonQueueStore(queue_file), backend)
+    if backend == "sqlite":
+        db_file = config["path"].get("queue_db") or Path(queue_file).with_suffix(".db")
+        return TimedQueueStore(SqliteQueueStore(Path(db_file), legacy_file=queue_file), backend)
+    raise ValueError(f"Unknown queue backend: {backend}")
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import platform
+import threading
+from pathlib import Path
+from collections import deque
+
+class JobSlot:
+    "CPUs, encoder threads and scheduling priority given to the ffmpeg processes of one job."
+
+    IOPRIO_CLASS_BE = 2
+    IOPRIO_CLASS_SHIFT = 13
+    IOPRIO_WHO_PROCESS = 1
+    # ioprio_set no tiene envoltorio en libc: número de syscall por arquitectura
+    SYS_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "i686": 289, "armv7l": 314}
+
+    _libc = None
+
+    def __init__(self, index: int, threads: int, cpus: list = None, nice: int = 0, ionice: int = None):
+        """
+        Initialize the slot.
+
+        Args:
+            index: Worker slot the job runs in
+            threads: Encoder and decoder threads per job (`-threads`, which sets the x264 thread count)
+            cpus: CPUs the job is pinned to, or None to let the kernel place it
+            nice: Niceness of the ffmpeg processes, so uploads and the API stay responsive
+            ionice: Best-effort I/O priority level (0-7), or None to keep the default
+        """
+        self.index = index
+        self.threads = threads
+        self.cpus = cpus
+        self.nice = nice
+        self.ionice = ionice
+
+    # --------------- [Private Methods] ---------------
+
+    @classmethod
+    def _ioprio_set(cls, tid: int, level: int) -> None:
+        "Set the best-effort I/O priority of one thread; silently unsupported off Linux."
+        number = cls.SYS_IOPRIO_SET.get(platform.machine())
+        if number is None:
+            return
+        if cls._libc is None:
+            cls._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        priority = (cls.IOPRIO_CLASS_BE << cls.IOPRIO_CLASS_SHIFT) | level
+        if cls._libc.syscall(number, cls.IOPRIO_WHO_PROCESS, tid, priority) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    # --------------- [Slot methods] ---------------
+
+    def apply(self, pid: int) -> None:
+        """
+        Pin and deprioritize every thread of a running process.
+
+        Affinity, niceness and I/O priority are per thread on Linux; threads created
+        afterwards inherit them, so calling this again once ffmpeg has started its
+        encoder threads covers the ones it spawned before the first call.
+        """
+        try:
+            tids = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+        except OSError:
+            tids = [pid]
+        for tid in tids:
+            try:
+                if self.cpus and hasattr(os, "sched_setaffinity"):
+                    os.sched_setaffinity(tid, self.cpus)
+                if self.nice:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                if self.ionice is not None:
+                    self._ioprio_set(tid, self.ionice)
+            except OSError:
+                continue  # El hilo o el proceso ya han terminado
+
+    def to_dict(self) -> dict:
+        "Placement of the slot, as shown in the tuner status."
+        return {"index": self.index, "threads": self.threads, "cpus": self.cpus, "nice": self.nice, "ionice": self.ionice}
+
+
+class ConcurrencyTuner:
+    """
+    Decides how many encodes run at once and how the CPUs are split between them.
+
+    Every `interval` seconds it measures the total encode throughput (seconds of video
+    encoded per wall-clock second, summed over the running jobs) and keeps a running
+    score per concurrency. It hill-climbs one step at a time: to a neighbour that beats
+    the current score by more than `tolerance`, or to one job fewer if that scores about
+    the same, so a plateau settles on the fewer jobs. At a local best it tries a
+    neighbour never measured, or not measured for `explore_windows` windows, and holds
+    otherwise. A load average or iowait over the limits steps down first. Windows where the queue did not keep every slot busy say
+    nothing about the concurrency and are not scored.
+
+    Each job gets an equal share of the CPUs as its thread count and, with `pin_cpus`,
+    a contiguous block of them, so parallel encoders do not evict each other's caches.
+    """
+
+    DEFAULT = {
+        "adaptive": False,
+        "min_workers": 1,
+        "max_workers": 0,
+        "interval": 120,
+        "sample_seconds": 5,
+        "tolerance": 0.05,
+        "explore_windows": 10,
+        "busy_ratio": 0.9,
+        "load_limit": 1.5,
+        "iowait_limit": 0.3,
+        "pin_cpus": False,
+        "nice": 0,
+        "ionice": None,
+        "history": 50,
+    }
+
+    def __init__(self, settings: dict = None, workers: int = 1, cpus: list = None):
+        """
+        Initialize the tuner.
+
+        Args:
+            settings: The `tuning` section of the config; missing keys take DEFAULT values
+                (a fixed pool of `workers` jobs without pinning, as before tuning existed)
+            workers: Initial number of concurrent jobs
+            cpus: CPUs available to the encoders; defaults to this process' affinity
+        """
+        settings = {**self.DEFAULT, **(settings or {})}
+        if cpus is None:
+            cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else range(os.cpu_count() or 1)
+        self.cpus = sorted(cpus)
+        self.adaptive = settings["adaptive"]
+        self.min_workers = max(1, settings["min_workers"])
+        # Sin adaptación, la concurrencia es fija
+        self.max_workers = max(settings["max_workers"] or len(self.cpus), workers, self.min_workers) if self.adaptive else max(1, workers)
+        self.interval = settings["interval"]
+        self.sample_seconds = settings["sample_seconds"]
+        self.tolerance = settings["tolerance"]
+        self.explore_windows = settings["explore_windows"]
+        self.busy_ratio = settings["busy_ratio"]
+        self.load_limit = settings["load_limit"]
+        self.iowait_limit = settings["iowait_limit"]
+        self.pin_cpus = settings["pin_cpus"]
+        self.nice = settings["nice"]
+        self.ionice = settings["ionice"]
+        self.concurrency = min(max(workers, self.min_workers), self.max_workers)
+        self.direction = 1
+        self.history = deque(maxlen=settings["history"])
+        self._scores = {}
+        self._measured = 0
+        self._window = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict, workers: int = None) -> "ConcurrencyTuner":
+        "Build the tuner from the `tuning` and `processing` sections of the config."
+        return cls(config.get("tuning"), workers or config.get("processing", {}).get("max_workers", 1))
+
+    # --------------- [Private Methods] ---------------
+
+    @staticmethod
+    def _cpu_times() -> tuple:
+        "Total and iowait jiffies from /proc/stat, or None where it does not exist."
+        try:
+            with open("/proc/stat", 'r') as f:
+                fields = [int(value) for value in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        return sum(fields), fields[4] if len(fields) > 4 else 0
+
+    def _open_window(self, now: float, encoded: float) -> None:
+        self._window = {"started": now, "encoded": encoded, "cpu": self._cpu_times(), "busy": 0, "samples": 0}
+
+    def _close_window(self, now: float, encoded: float) -> dict:
+        "Throughput, busy ratio and system load measured over the window that ends now."
+        window = self._window
+        elapsed = max(now - window["started"], 1e-6)
+        throughput = (encoded - window["encoded"]) / elapsed
+        running = window["busy"] / max(window["samples"], 1)
+        iowait = None
+        cpu = self._cpu_times()
+        if cpu and window["cpu"] and cpu[0] > window["cpu"][0]:
+            iowait = (cpu[1] - window["cpu"][1]) / (cpu[0] - window["cpu"][0])
+        return {
+            "at": time.time(),
+            "concurrency": self.concurrency,
+            "threads": self.threads(),
+            "throughput": round(throughput, 3),
+            "per_job": round(throughput / running, 3) if running else None,
+            "busy": round(running / self.concurrency, 2),
+            "load": round(os.getloadavg()[0] / (os.cpu_count() or 1), 2) if hasattr(os, "getloadavg") else None,
+            "iowait": round(iowait, 3) if iowait is not None else None,
+        }
+
+    def _decide(self, measure: dict) -> str:
+        "Move the concurrency based on the last window. Returns the reason."
+        overloaded = (
+            (measure["load"] is not None and measure["load"] > self.load_limit)
+            or (measure["iowait"] is not None and measure["iowait"] > self.iowait_limit)
+        )
+        if overloaded and self.concurrency > self.min_workers:
+            self.direction = -1
+            self.concurrency -= 1
+            return "overloaded"
+        if measure["busy"] < self.busy_ratio:
+            # Pocas tareas en cola: la medida no depende de la concurrencia
+            return "idle"
+
+        # Media móvil por concurrencia; una medida antigua se sustituye en vez de promediarse
+        self._measured += 1
+        score = self._scores.get(self.concurrency)
+        throughput = measure["throughput"]
+        if score and self._measured - score[1] <= self.explore_windows:
+            throughput = (score[0] + throughput) / 2
+        self._scores[self.concurrency] = (throughput, self._measured)
+
+        neighbours = [
+            target for target in (self.concurrency + self.direction, self.concurrency - self.direction)
+            if self.min_workers <= target <= self.max_workers
+        ]
+        best = self.concurrency
+        for target in sorted(target for target in neighbours if target in self._scores):
+            score, current = self._scores[target][0], self._scores[best][0]
+            # Subir solo si mejora claramente; bajar también si rinde casi lo mismo
+            if score > current * (1 + self.tolerance) or (target < best and score >= current * (1 - self.tolerance)):
+                best = target
+        if best != self.concurrency:
+            self.direction = best - self.concurrency
+            self.concurrency = best
+            return "climb"
+
+        # En el mejor punto conocido: probar un vecino sin medir o con una medida antigua
+        for target in neighbours:
+            score = self._scores.get(target)
+            if score is None or self._measured - score[1] > self.explore_windows:
+                self.direction = target - self.concurrency
+                self.concurrency = target
+                return "explore"
+        return "hold"
+
+    # --------------- [Tuner methods] ---------------
+
+    def threads(self) -> int:
+        "Threads each job gets at the current concurrency."
+        return max(1, len(self.cpus) // self.concurrency)
+
+    def slot(self, index: int) -> JobSlot:
+        "Threads, CPUs and priority for a job started by worker slot `index`."
+        with self._lock:
+            concurrency = self.concurrency
+        cpus = None
+        threads = max(1, len(self.cpus) // concurrency)
+        if self.pin_cpus:
+            total = len(self.cpus)
+            position = index % concurrency
+            cpus = self.cpus[position * total // concurrency:(position + 1) * total // concurrency]
+            # Más trabajos que CPUs: varios comparten la misma
+            cpus = cpus or [self.cpus[position * total // concurrency]]
+            threads = len(cpus)
+        return JobSlot(index, threads, cpus, self.nice, self.ionice)
+
+    def sample(self, encoded: float, running: int) -> int:
+        """
+        Record one sample and, once per `interval`, re-evaluate the concurrency.
+
+        Args:
+            encoded: Seconds of video encoded so far by this process (monotonic)
+            running: Jobs running right now
+
+        Returns:
+            The concurrency to use from now on
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._window is None:
+                self._open_window(now, encoded)
+                return self.concurrency
+            self._window["busy"] += running
+            self._window["samples"] += 1
+            if now - self._window["started"] < self.interval:
+                return self.concurrency
+
+            measure = self._close_window(now, encoded)
+            measure["decision"] = self._decide(measure) if self.adaptive else "fixed"
+            self.history.append(measure)
+            self._open_window(now, encoded)
+            return self.concurrency
+
+    def status(self) -> dict:
+        "Policy, current state and recent measurements, for tuning."
+        slots = [self.slot(index).to_dict() for index in range(self.concurrency)]
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "adaptive": self.adaptive,
+                "concurrency": self.concurrency,
+                "threads": self.threads(),
+                "direction": self.direction,
+                "bounds": [self.min_workers, self.max_workers],
+                "cpus": self.cpus,
+                "policy": {
+                    "interval": self.interval,
+                    "tolerance": self.tolerance,
+                    "explore_windows": self.explore_windows,
+                    "busy_ratio": self.busy_ratio,
+                    "load_limit": self.load_limit,
+                    "iowait_limit": self.iowait_limit,
+                    "pin_cpus": self.pin_cpus,
+                    "nice": self.nice,
+                    "ionice": self.ionice,
+                },
+                "slots": slots,
+                "scores": {str(concurrency): round(score[0], 3) for concurrency, score in sorted(self._scores.items())},
+                "history": list(self.history),
+            }
+
+    def publish(self, status_dir: Path) -> None:
+        "Atomically write the status of this process, for the API workers to read."
+        status_dir.mkdir(parents=True, exist_ok=True)
+        target = status_dir / f"{os.getpid()}.json"
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.status(), f)
+        os.replace(tmp, target)
+
+    def unpublish(self, status_dir: Path) -> None:
+        "Remove the status of this process once its daemon stops."
+        (status_dir / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+    @staticmethod
+    def read_status(status_dir: Path) -> list:
+        "Status published by every live daemon process; files of dead processes are removed."
+        statuses = []
+        for status_file in sorted(status_dir.glob("*.json")) if status_dir.is_dir() else ():
+            if not status_file.stem.isdigit():
+                continue
+            try:
+                os.kill(int(status_file.stem), 0)
+            except ProcessLookupError:
+                status_file.unlink(missing_ok=True)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(status_file, 'r') as f:
+                    statuses.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return statuses
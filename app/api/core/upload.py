@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+from pathlib import Path
+from typing import BinaryIO
+from .dedup import TreeHasher
+from .space import SpaceLedger, InsufficientSpaceError
+
+class RawUpload:
+    "Request body streamed straight into a preallocated temp file with large aligned writes."
+
+    BLOCK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, tmp_file: Path, destination: Path, expected_size: int = None, space_ledger: SpaceLedger = None):
+        "Create the temp file and reserve `expected_size` bytes for it up front."
+        self.tmp_file = Path(tmp_file)
+        self.destination = Path(destination)
+        self.expected_size = expected_size
+        self.space_ledger = space_ledger
+        self.reservation = f"upload:{self.tmp_file.stem}"
+        self.written = 0
+        self.hasher = TreeHasher()
+        self._buffer = bytearray()
+        if space_ledger and expected_size:
+            fits, message = space_ledger.reserve(self.reservation, self.tmp_file.parent, expected_size, [self.tmp_file])
+            if not fits:
+                raise InsufficientSpaceError(message)
+        self._fd = os.open(self.tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        if expected_size:
+            try:
+                os.posix_fallocate(self._fd, 0, expected_size)
+            except OSError:
+                pass
+
+    def append(self, data: bytes) -> bool:
+        "Buffer a piece of the body. Returns True once a full block is ready to flush."
+        self._buffer += data
+        if self.expected_size is not None and self.written + len(self._buffer) > self.expected_size:
+            raise ValueError("Body exceeds the declared Content-Length")
+        return len(self._buffer) >= self.BLOCK_SIZE
+
+    def flush(self, final: bool = False) -> None:
+        "Write every complete block (or everything, when final) and keep the remainder buffered."
+        end = len(self._buffer) if final else len(self._buffer) - len(self._buffer) % self.BLOCK_SIZE
+        view = memoryview(self._buffer)[:end]
+        # El hash se calcula sobre los mismos bloques que se escriben, sin releer el fichero
+        self.hasher.update(view)
+        while view:
+            count = os.write(self._fd, view)
+            view = view[count:]
+            self.written += count
+        view.release()
+        del self._buffer[:end]
+
+    def commit(self) -> Path:
+        "Flush the tail, check the length and atomically rename into place."
+        self.flush(final=True)
+        if self.expected_size is not None and self.written != self.expected_size:
+            raise ValueError(f"Incomplete body: received {self.written} of {self.expected_size} bytes")
+        os.ftruncate(self._fd, self.written)
+        os.close(self._fd)
+        self._fd = None
+        os.replace(self.tmp_file, self.destination)
+        self._release()
+        return self.destination
+
+    @property
+    def content_hash(self) -> str:
+        "Content hash of everything written so far."
+        return self.hasher.hexdigest()
+
+    def abort(self) -> None:
+        "Discard a failed upload."
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.tmp_file.unlink(missing_ok=True)
+        self._release()
+
+    def _release(self) -> None:
+        "Give back the space reserved for this upload."
+        if self.space_ledger:
+            self.space_ledger.release(self.reservation)
+
+
+class ChunkedUploadManager:
+    "Resumable uploads assembled from chunks written at their offsets into a preallocated file."
+
+    UPLOAD_ID = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+    COPY_BUFFER = 1024 * 1024
+
+    def __init__(self, uploads_dir: Path, partial_dir: Path = None, space_ledger: SpaceLedger = None):
+        "Initialize the manager; partial uploads live on the same filesystem so finalize is a rename."
+        self.uploads_dir = Path(uploads_dir)
+        self.space_ledger = space_ledger
+        self.partial_dir = Path(partial_dir) if partial_dir else self.uploads_dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+
+    # --------------- [Private Methods] ---------------
+
+    def _upload_dir(self, upload_id: str) -> Path:
+        "Directory holding one upload in progress."
+        if not self.UPLOAD_ID.match(upload_id or ""):
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return self.partial_dir / upload_id
+
+    def _load_meta(self, upload_dir: Path) -> dict:
+        "Read the upload description written by the first chunk."
+        try:
+            with open(upload_dir / "meta.json", 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError("Upload not found")
+
+    def _open(self, upload_dir: Path, filename: str, total_size: int, chunk_count: int) -> dict:
+        "Create the upload on its first chunk, or load it. Parallel first chunks race safely on mkdir."
+        meta = {"filename": filename, "total_size": total_size, "chunk_count": chunk_count, "created_at": time.time()}
+        try:
+            upload_dir.mkdir()
+        except FileExistsError:
+            # La subida ya existe o otro chunk la está creando; esperar a meta.json
+            for _ in range(100):
+                if (upload_dir / "meta.json").exists():
+                    return self._load_meta(upload_dir)
+                time.sleep(0.01)
+            raise
+
+        if self.space_ledger:
+            # La reserva sobrevive a la petición: se libera al finalizar o al purgar la subida
+            fits, message = self.space_ledger.reserve(f"upload:{upload_dir.name}", upload_dir, total_size, [upload_dir], owned=False)
+            if not fits:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                raise InsufficientSpaceError(message)
+        (upload_dir / "chunks").mkdir()
+        fd = os.open(upload_dir / "data", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if total_size:
+                os.posix_fallocate(fd, 0, total_size)
+        except OSError:
+            os.ftruncate(fd, total_size)
+        finally:
+            os.close(fd)
+
+        tmp_meta = upload_dir / "meta.json.tmp"
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, upload_dir / "meta.json")
+        return meta
+
+    def _content_hash(self, upload_dir: Path, chunk_count: int) -> str:
+        "Combine the leaf digests recorded by each chunk, or None if some chunk was not leaf-aligned."
+        chunks = []
+        for index in range(chunk_count):
+            with open(upload_dir / "chunks" / str(index), 'r') as f:
+                marker = json.load(f)
+            if marker["leaves"] is None:
+                return None
+            chunks.append((marker["offset"], marker["leaves"]))
+        chunks.sort()
+        return TreeHasher.root([bytes.fromhex(leaf) for _, leaves in chunks for leaf in leaves])
+
+    # --------------- [Upload methods] ---------------
+
+    def write_chunk(self, upload_id: str, filename: str, index: int, offset: int, total_size: int, chunk_count: int, source: BinaryIO) -> dict:
+        """
+        Write one chunk at its byte offset. Chunks may arrive in any order and be retried.
+
+        Returns:
+            The upload status after this chunk
+        """
+        filename = Path(filename).name
+        if not filename:
+            raise ValueError("Missing filename")
+        if index < 0 or index >= chunk_count or offset < 0 or offset > total_size:
+            raise ValueError(f"Invalid chunk {index} at offset {offset}")
+
+        upload_dir = self._upload_dir(upload_id)
+        meta = self._open(upload_dir, filename, total_size, chunk_count)
+        if (meta["filename"], meta["total_size"], meta["chunk_count"]) != (filename, total_size, chunk_count):
+            raise ValueError("Chunk does not belong to this upload")
+
+        # Los chunks alineados a hojas del árbol se hashean al escribirlos; el hash final solo combina hojas
+        hasher = TreeHasher() if offset % TreeHasher.LEAF_SIZE == 0 else None
+        fd = os.open(upload_dir / "data", os.O_WRONLY)
+        try:
+            position = offset
+            while data := source.read(self.COPY_BUFFER):
+                if position + len(data) > total_size:
+                    raise ValueError("Chunk exceeds the declared file size")
+                os.pwrite(fd, data, position)
+                if hasher:
+                    hasher.update(data)
+                position += len(data)
+        finally:
+            os.close(fd)
+
+        aligned = hasher and ((position - offset) % TreeHasher.LEAF_SIZE == 0 or position == total_size)
+        leaves = [leaf.hex() for leaf in hasher.leaf_digests()] if aligned else None
+        tmp_marker = upload_dir / f"chunk-{index}.tmp"
+        with open(tmp_marker, 'w') as f:
+            json.dump({"offset": offset, "leaves": leaves}, f)
+        os.replace(tmp_marker, upload_dir / "chunks" / str(index))
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        "Report which chunks have been received so a client can resume."
+        upload_dir = self._upload_dir(upload_id)
+        meta = self._load_meta(upload_dir)
+        received = sorted(int(name) for name in os.listdir(upload_dir / "chunks"))
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "total_size": meta["total_size"],
+            "chunk_count": meta["chunk_count"],
+            "received": received,
+            "complete": len(received) == meta["chunk_count"],
+        }
+
+    def finalize(self, upload_id: str) -> tuple[Path, str]:
+        """
+        Atomically move a complete upload into the uploads directory.
+
+        Returns:
+            (destination, content hash); the hash is None when the client's chunks were
+            not aligned to TreeHasher.LEAF_SIZE and it has to be computed from the file
+        """
+        status = self.status(upload_id)
+        if not status["complete"]:
+            missing = sorted(set(range(status["chunk_count"])) - set(status["received"]))
+            raise ValueError(f"Upload incomplete, missing chunks: {missing[:20]}")
+
+        upload_dir = self._upload_dir(upload_id)
+        content_hash = self._content_hash(upload_dir, status["chunk_count"])
+        destination = self.uploads_dir / status["filename"]
+        os.replace(upload_dir / "data", destination)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        if self.space_ledger:
+            self.space_ledger.release(f"upload:{upload_id}")
+        return destination, content_hash
+
+    def open_stream(self, filename: str, expected_size: int = None) -> RawUpload:
+        "Start a raw-body upload that lands in the uploads directory on commit."
+        filename = Path(filename).name
+        if not filename or filename.startswith("."):
+            raise ValueError(f"Invalid filename: {filename}")
+        tmp_file = self.partial_dir / f"{uuid.uuid4().hex}.raw"
+        return RawUpload(tmp_file, self.uploads_dir / filename, expected_size, self.space_ledger)
+
+    def purge_stale(self, max_age: float) -> int:
+        "Remove uploads abandoned for more than `max_age` seconds."
+        removed = 0
+        now = time.time()
+        for upload_dir in self.partial_dir.iterdir():
+            try:
+                # El directorio chunks/ cambia con cada chunk recibido
+                activity = upload_dir / "chunks" if (upload_dir / "chunks").exists() else upload_dir
+                if now - activity.stat().st_mtime > max_age:
+                    if upload_dir.is_dir():
+                        shutil.rmtree(upload_dir, ignore_errors=True)
+                    else:
+                        upload_dir.unlink()
+                    if self.space_ledger:
+                        self.space_ledger.release(f"upload:{upload_dir.stem}")
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
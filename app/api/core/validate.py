@@ -1,13 +1,15 @@
 from pathlib import Path
 import shutil
+from .space import SpaceLedger
 
 class FileValidator:
     "Validator for video processing operations."
 
     ALLOWED_VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".ts", ".flv"}
     
-    def __init__(self, path_config: dict):
+    def __init__(self, path_config: dict, space_ledger: SpaceLedger = None):
         self.path_config = path_config
+        self.space_ledger = space_ledger
         self.uploads_dir = Path(path_config["uploads"])
         self.processed_dir = Path(path_config["processed"])
 
@@ -19,8 +21,13 @@ class FileValidator:
             return False, f"Invalid file extension: {extension}: Allowed extensions: {', '.join(self.ALLOWED_VIDEO_EXTENSIONS)}"
         return True, "OK"
     
-    def validate_space(self, filename: str) -> tuple[bool, str]:
-        "Validate if file size is allowed."
+    def validate_space(self, filename: str, required_space: int = None, reservation: str = None) -> tuple[bool, str]:
+        """
+        Validate if there is room for the output: `required_space` bytes, or twice the input size without an estimate.
+
+        With a space ledger, the space reserved by other jobs and the configured minimum free
+        space are not available; the job's own `reservation` is.
+        """
         
         try:
             output_dir = Path(self.processed_dir)
@@ -33,8 +40,12 @@ class FileValidator:
 
             file_size = file_path.stat().st_size
 
-            required_space = file_size * 2
-            available_space = shutil.disk_usage(output_dir).free
+            if required_space is None:
+                required_space = file_size * 2
+            if self.space_ledger:
+                available_space = self.space_ledger.usage(output_dir, exclude=reservation)["available"]
+            else:
+                available_space = shutil.disk_usage(output_dir).free
 
             if available_space <= required_space:
                 return False, "Not enough disk space"
@@ -50,14 +61,14 @@ class FileValidator:
             return False, "Output file already exists"
         return True, "OK"
     
-    def validate(self, filename: str, output_file: Path) -> tuple[bool, str]:
+    def validate(self, filename: str, output_file: Path, required_space: int = None, reservation: str = None) -> tuple[bool, str]:
         "Validate if file is allowed to be processed."
 
         valid_extension, message = self.validate_extension(filename)
         if not valid_extension:
             return False, message
         
-        valid_space, message = self.validate_space(filename)
+        valid_space, message = self.validate_space(filename, required_space, reservation)
         if not valid_space:
             return False, message
         
@@ -0,0 +1,277 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Callable
+from .manager import QueueManager
+from .validate import FileValidator
+from .logging import VideoLogger
+from .metrics import WATCHER_FILES
+
+class Inotify:
+    "Minimal inotify(7) binding through ctypes (Linux only)."
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        "Create a non-blocking inotify instance."
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        "Watch a directory; returns the watch descriptor."
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def read(self) -> list:
+        "Every queued event as (wd, mask, cookie, name); empty when none is pending."
+        events = []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        "Release the inotify instance and all its watches."
+        os.close(self.fd)
+
+
+class UploadWatcher:
+    """
+    Enqueue videos copied straight into the uploads directory (rsync, NFS, cp...).
+
+    inotify events only mark files as changed; a file is taken once no event has arrived
+    for `settle_seconds` and its size and mtime have stopped changing. Everything that
+    settles within `batch_seconds` is enqueued in transactions of `max_batch` files, so a
+    bulk drop of thousands of files costs a handful of queue writes. Hidden files and directories are
+    ignored: rsync temp files, and the API's own partial uploads, only count once they are
+    renamed into place.
+    """
+
+    MASK = (
+        Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_MODIFY | Inotify.IN_ATTRIB
+        | Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE_SELF
+    )
+
+    def __init__(self, directory: Path, queue_manager: QueueManager, file_validator: FileValidator, logger: VideoLogger, prepare: Callable[[Path], dict] = None, settle_seconds: float = 10, batch_seconds: float = 2, max_batch: int = 100, scan_existing: bool = False):
+        """
+        Initialize the watcher.
+
+        Args:
+            directory: Directory to watch, subdirectories included
+            prepare: Called with each settled video before it is enqueued; returns the
+                `QueueManager.add_tasks` entry, or None to leave the file alone. It runs on
+                the watcher thread, so it should only do cheap lookups
+            settle_seconds: Quiet time before a file is considered complete
+            batch_seconds: Window in which settled files are grouped into one enqueue
+            max_batch: Largest number of files enqueued at once
+            scan_existing: Also enqueue the files already in the directory at start, e.g. those
+                dropped while the watcher was down; files that already have a task are skipped
+        """
+        self.directory = Path(directory)
+        self.queue_manager = queue_manager
+        self.file_validator = file_validator
+        self.logger = logger
+        self.prepare = prepare
+        self.settle_seconds = settle_seconds
+        self.batch_seconds = batch_seconds
+        self.max_batch = max_batch
+        self.scan_existing = scan_existing
+        self._candidates = {}
+        self._watches = {}
+        self._inotify = None
+        self._wakeup = None
+        self._thread = None
+
+    # --------------- [Private Methods] ---------------
+
+    def _ignored(self, path: Path) -> bool:
+        "Hidden files and anything inside hidden directories."
+        return any(part.startswith(".") for part in path.relative_to(self.directory).parts)
+
+    def _watch_tree(self, root: Path, queue_files: bool = True) -> None:
+        "Watch a directory and its subdirectories, optionally queueing the files already in them."
+        for current, dirs, files in os.walk(root):
+            current = Path(current)
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            if current != self.directory and self._ignored(current):
+                continue
+            try:
+                self._watches[self._inotify.add_watch(current, self.MASK)] = current
+            except OSError as e:
+                self.logger.log_error(f"Cannot watch {current}: {e}")
+                continue
+            for name in files if queue_files else ():
+                if not name.startswith("."):
+                    # Ficheros que ya estaban: comprobables de inmediato
+                    self._candidates[current / name] = {"since": 0, "signature": None}
+
+    def _handle(self, events: list, now: float) -> None:
+        "Coalesce a burst of events into the candidate set; only directory changes act immediately."
+        for wd, mask, _, name in events:
+            if mask & Inotify.IN_Q_OVERFLOW:
+                self.logger.log_error("inotify queue overflow, rescanning the uploads directory")
+                self._watch_tree(self.directory, self.scan_existing)
+                continue
+            if mask & Inotify.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            parent = self._watches.get(wd)
+            if parent is None or not name:
+                continue
+            path = parent / name
+            if self._ignored(path):
+                continue
+            if mask & Inotify.IN_ISDIR:
+                if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                    self._watch_tree(path)
+                continue
+            if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                self._candidates.pop(path, None)
+            else:
+                self._candidates[path] = {"since": now, "signature": None}
+
+    def _settled(self, now: float) -> list:
+        "Candidates with no events for settle_seconds whose size and mtime no longer change."
+        ready = []
+        for path, state in list(self._candidates.items()):
+            if now - state["since"] < self.settle_seconds:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._candidates[path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            # Sin cambios desde la última comprobación, o escrito hace más de settle_seconds
+            if signature == state["signature"] or time.time() - stat.st_mtime >= self.settle_seconds:
+                del self._candidates[path]
+                ready.append(path)
+            else:
+                state.update(since=now, signature=signature)
+        return ready
+
+    def _next_deadline(self, now: float) -> float:
+        "Seconds until the earliest candidate may have settled, or None to wait for events only."
+        if not self._candidates:
+            return None
+        earliest = min(state["since"] for state in self._candidates.values())
+        return max(self.batch_seconds, earliest + self.settle_seconds - now)
+
+    def _enqueue(self, paths: list) -> None:
+        "Validate settled files and enqueue the videos among them in batches of max_batch."
+        videos = []
+        for path in sorted(paths):
+            filename = str(path.relative_to(self.directory))
+            if self.file_validator.validate_extension(filename)[0]:
+                videos.append((path, filename))
+            else:
+                WATCHER_FILES.inc(outcome="ignored")
+
+        # Por lotes pequeños: cada lote queda en cola sin esperar a preparar el resto
+        for start in range(0, len(videos), self.max_batch):
+            self._enqueue_batch(videos[start:start + self.max_batch])
+
+    def _enqueue_batch(self, videos: list) -> None:
+        "Prepare and enqueue up to max_batch videos in one transaction, skipping those that already have a task."
+        existing = self.queue_manager.check_tasks([filename for _, filename in videos])
+        WATCHER_FILES.inc(len(existing), outcome="duplicate")
+        entries = []
+        for path, filename in videos:
+            if filename in existing:
+                continue
+            try:
+                entry = self.prepare(path) if self.prepare else {"filename": filename}
+            except Exception as e:
+                self.logger.log_error(f"Watcher could not ingest {filename}: {str(e)}", video=filename)
+                WATCHER_FILES.inc(outcome="error")
+                continue
+            if entry is None:
+                WATCHER_FILES.inc(outcome="skipped")
+                continue
+            entries.append(entry)
+        if not entries:
+            return
+
+        results = self.queue_manager.add_tasks(entries, client="watcher")
+        duplicates = sum(result["duplicate"] for result in results)
+        WATCHER_FILES.inc(len(results) - duplicates, outcome="queued")
+        WATCHER_FILES.inc(duplicates, outcome="duplicate")
+        if len(results) > duplicates:
+            self.logger.log_info(f"Watcher enqueued {len(results) - duplicates} files ({duplicates} already queued)")
+
+    def _run(self) -> None:
+        "Event loop: read events, collect settled files and enqueue them in batches."
+        while True:
+            now = time.monotonic()
+            timeout = self._next_deadline(now)
+            readable, _, _ = select.select([self._inotify.fd, self._wakeup[0]], [], [], timeout)
+            if self._wakeup[0] in readable:
+                break
+            events = self._inotify.read()
+            self._handle(events, time.monotonic())
+
+            ready = self._settled(time.monotonic())
+            if ready:
+                try:
+                    self._enqueue(ready)
+                except Exception as e:
+                    self.logger.log_error(f"Watcher could not enqueue {len(ready)} files: {str(e)}")
+
+    # --------------- [Watcher methods] ---------------
+
+    def start(self) -> None:
+        "Start watching in a background thread (and scan the existing files when `scan_existing` is set)."
+        if self._thread:
+            return
+        self._inotify = Inotify()
+        self._wakeup = os.pipe()
+        self._candidates = {}
+        self._watches = {}
+        self._watch_tree(self.directory, self.scan_existing)
+        self.logger.log_info(f"Watching {self.directory} ({len(self._watches)} directories)")
+        self._thread = threading.Thread(target=self._run, name="upload-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        "Stop watching; files that have not settled yet are dropped from the candidates."
+        if not self._thread:
+            return
+        os.write(self._wakeup[1], b"1")
+        self._thread.join()
+        self._thread = None
+        self._inotify.close()
+        for fd in self._wakeup:
+            os.close(fd)
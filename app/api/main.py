@@ -1,49 +1,63 @@
 import aiofiles
+import asyncio
 import json
 import os
-from dataclasses import dataclass
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 from typing import List
-from utils import get_video_info, format_size
-from core.process import VideoProcessor
-from core.validate import FileValidator
-from core.manager import QueueManager
-from core.daemon import ProcessorDaemon
-from core.logging import VideoLogger
+from utils import format_size, file_response
+from core.library import FileLibrary
+from core.upload import ChunkedUploadManager
+from core.space import InsufficientSpaceError
+from core.preview import PreviewCache
+from core.dedup import TreeHasher
+from core.leader import LeaderElection
+from core.tuning import ConcurrencyTuner
+from core.metrics import REGISTRY, UPLOAD_BYTES, UPLOAD_THROUGHPUT, LISTING_SECONDS
+from services import config, file_validator, queue_manager, metadata_cache, content_index, space_ledger, previews, video_processor, create_daemon, create_watcher, TUNING_STATUS_DIR
 from contextlib import asynccontextmanager
 
-with open("/var/www/vault/app/api/config/config.json") as config_file:
-    config = json.load(config_file)
-
-file_validator = FileValidator(config["path"])
-queue_manager = QueueManager(Path(config["path"]["queue"]), config)
-logger = VideoLogger(Path(config["path"]["logs"]))
-
-video_processor = VideoProcessor(
-    input_dir=Path(config["path"]["uploads"]),
-    output_dir=Path(config["path"]["processed"]),
-    queue_manager=queue_manager,
-    file_validator=file_validator,
-    logger=logger
-)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     "Lifecycle manager for the FastAPI application"
 
-    processor_daemon = ProcessorDaemon(
-        queue_manager=queue_manager,
-        video_processor=video_processor,
-        logger=logger,
-        file_validator=FileValidator,
-        check_interval=config["processing"]["check_interval"]
-    )
+    chunked_uploads.purge_stale(config["processing"]["partial_upload_ttl"])
+
+    # Un único planificador: con "embedded", solo el worker de uvicorn que gane el lock
+    # ejecuta el daemon; con "external", la API solo encola y procesa worker.py
+    # El watcher de uploads va con el daemon, para que solo un proceso encole lo que se copie
+    election = None
+    if config["processing"].get("daemon", "embedded") == "embedded":
+        processor_daemon = create_daemon()
+        upload_watcher = create_watcher()
+
+        def on_elected() -> None:
+            processor_daemon.start()
+            if upload_watcher:
+                upload_watcher.start()
 
-    processor_daemon.start()
+        def on_resign() -> None:
+            if upload_watcher:
+                upload_watcher.stop()
+            processor_daemon.stop()
+
+        election = LeaderElection(
+            Path(config["path"]["queue"]).with_name("scheduler.lock"),
+            on_elected=on_elected,
+            on_resign=on_resign,
+            retry_interval=config["processing"]["check_interval"]
+        )
+        election.start()
     yield
-    processor_daemon.stop()
+    if election:
+        election.stop()
 
 app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 
@@ -51,6 +65,17 @@ upload_dir = Path(config["path"]["uploads"]).resolve()
 output_dir = Path(config["path"]["processed"]).resolve()
 upload_dir.mkdir(parents=True, exist_ok=True)
 output_dir.mkdir(parents=True, exist_ok=True)
+hls_dir = Path(config["path"]["hls"]).resolve()
+hls_dir.mkdir(parents=True, exist_ok=True)
+accel_redirect = config.get("serve", {}).get("accel_redirect", {})
+
+HLS_FILE = re.compile(r"^(index\.m3u8|seg_\d+\.ts)$")
+
+chunked_uploads = ChunkedUploadManager(upload_dir, space_ledger=space_ledger)
+
+probe_timeout = config["processing"]["probe_timeout"]
+upload_library = FileLibrary(upload_dir, file_validator, metadata_cache, probe_timeout, format_size, previews)
+output_library = FileLibrary(output_dir, file_validator, metadata_cache, probe_timeout, format_size, previews)
 
 app.add_middleware(
     CORSMiddleware, 
@@ -60,39 +85,197 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+def record_upload(kind: str, size: int, started: float) -> None:
+    "Account the bytes and throughput of one upload request."
+
+    UPLOAD_BYTES.inc(size, kind=kind)
+    UPLOAD_THROUGHPUT.observe(size / max(time.perf_counter() - started, 1e-6), kind=kind)
+
+def store_upload(save_to: Path, content_hash: str = None) -> Path:
+    "Index a finished upload by content hash, hardlinking it to an identical earlier upload. Returns that upload, if any."
+
+    if content_hash is None:
+        content_hash = content_index.hash_file(save_to)
+    return content_index.deduplicate(save_to, content_hash)
+
+def index_upload(save_to: Path) -> None:
+    "Background stage after an upload: probe the video and queue its poster and sprite sheet."
+
+    metadata_cache.refresh(save_to)
+    previews.schedule(save_to, content_index.lookup(save_to))
+
 @app.post("/api/uploads/")
-async def create_upload_file(file_uploads: List[UploadFile] = File(...)) -> list:
+async def create_upload_file(background_tasks: BackgroundTasks, file_uploads: List[UploadFile] = File(...)) -> list:
     "Handles uploading multiple files."
 
     uploaded_files = []
-    for file in file_uploads:
-        save_to = upload_dir / file.filename
-        try:
-            async with aiofiles.open(save_to, "wb") as f:
-                while contents := await file.read(4 * 1024 * 1024):
-                    await f.write(contents)
-            uploaded_files.append(file.filename)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error saving file {file.filename}: {e}")
-        finally:
-            await file.close()
+    started = time.perf_counter()
+    received = 0
+    # Los ficheros ya están en el spool de la petición: reservar su tamaño antes de copiarlos
+    reservation = f"upload:{uuid.uuid4().hex}"
+    fits, message = await run_in_threadpool(space_ledger.reserve, reservation, upload_dir, sum(file.size or 0 for file in file_uploads))
+    if not fits:
+        raise HTTPException(status_code=507, detail=message)
+    try:
+        for file in file_uploads:
+            save_to = upload_dir / Path(file.filename).name
+            # Nunca escribir sobre el destino: podría ser un hardlink compartido con otra subida
+            tmp_file = chunked_uploads.partial_dir / f"{uuid.uuid4().hex}.upload"
+            hasher = TreeHasher()
+            try:
+                async with aiofiles.open(tmp_file, "wb") as f:
+                    while contents := await file.read(4 * 1024 * 1024):
+                        await f.write(contents)
+                        await run_in_threadpool(hasher.update, contents)
+                        received += len(contents)
+                os.replace(tmp_file, save_to)
+                await run_in_threadpool(store_upload, save_to, hasher.hexdigest())
+                uploaded_files.append(save_to.name)
+                if file_validator.validate_extension(save_to.name)[0]:
+                    background_tasks.add_task(index_upload, save_to)
+            except Exception as e:
+                tmp_file.unlink(missing_ok=True)
+                raise HTTPException(status_code=500, detail=f"Error saving file {file.filename}: {e}")
+            finally:
+                await file.close()
+    finally:
+        await run_in_threadpool(space_ledger.release, reservation)
+    record_upload("multipart", received, started)
     return uploaded_files
 
+@app.put("/api/uploads/raw/{filename}")
+async def upload_raw_file(filename: str, request: Request, background_tasks: BackgroundTasks) -> dict:
+    "Stream the raw request body into the uploads directory, bypassing multipart parsing and spooling."
+
+    started = time.perf_counter()
+    length = request.headers.get("content-length")
+    try:
+        writer = await run_in_threadpool(chunked_uploads.open_stream, filename, int(length) if length else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientSpaceError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        async for data in request.stream():
+            if writer.append(data):
+                await run_in_threadpool(writer.flush)
+        save_to = await run_in_threadpool(writer.commit)
+        original = await run_in_threadpool(store_upload, save_to, writer.content_hash)
+    except ValueError as e:
+        writer.abort()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        writer.abort()
+        raise HTTPException(status_code=500, detail=f"Error saving file {filename}: {e}")
+
+    record_upload("raw", writer.written, started)
+    if file_validator.validate_extension(save_to.name)[0]:
+        background_tasks.add_task(index_upload, save_to)
+    return {"filename": save_to.name, "size": writer.written, "duplicate_of": original.name if original else None}
+
+@app.post("/api/uploads/chunk")
+async def upload_chunk(
+    file_uploads: UploadFile = File(...),
+    dzuuid: str = Form(...),
+    dzchunkindex: int = Form(...),
+    dztotalfilesize: int = Form(...),
+    dztotalchunkcount: int = Form(...),
+    dzchunkbyteoffset: int = Form(...),
+) -> dict:
+    "Receive one chunk of a resumable upload (Dropzone chunking protocol). Chunks may arrive in parallel."
+
+    started = time.perf_counter()
+    try:
+        status = await run_in_threadpool(
+            chunked_uploads.write_chunk,
+            dzuuid, file_uploads.filename, dzchunkindex, dzchunkbyteoffset,
+            dztotalfilesize, dztotalchunkcount, file_uploads.file
+        )
+        record_upload("chunk", file_uploads.size or 0, started)
+        return status
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientSpaceError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving chunk {dzchunkindex} of {file_uploads.filename}: {e}")
+    finally:
+        await file_uploads.close()
+
+@app.get("/api/uploads/chunk/{upload_id}")
+async def get_upload_status(upload_id: str) -> dict:
+    "Report the chunks received so far, so an interrupted upload can resume."
+
+    try:
+        return chunked_uploads.status(upload_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/uploads/chunk/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, background_tasks: BackgroundTasks) -> dict:
+    "Move a completed chunked upload into the uploads directory."
+
+    try:
+        save_to, content_hash = await run_in_threadpool(chunked_uploads.finalize, upload_id)
+        original = await run_in_threadpool(store_upload, save_to, content_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if file_validator.validate_extension(save_to.name)[0]:
+        background_tasks.add_task(index_upload, save_to)
+    return {
+        "filename": save_to.name,
+        "duplicate_of": original.name if original else None,
+        "message": f"File {save_to.name} uploaded successfully."
+    }
+
+async def list_directory(library: FileLibrary, empty_message: str, limit: int, cursor: str, sort: str, order: str, ext: str, codec: str, format: str):
+    "Build a paginated listing, either as one JSON document or as an NDJSON stream."
+
+    started = time.perf_counter()
+    labels = {"directory": library.directory.name, "format": format}
+    extensions = {e.strip().lower().lstrip(".") for e in ext.split(",") if e.strip()} if ext else None
+    params = dict(sort=sort, order=order, limit=limit, cursor=cursor, extensions=extensions, codec=codec)
+    try:
+        library.validate(sort, order, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        async def stream():
+            try:
+                async for record in library.iter_files(**params):
+                    yield json.dumps(record) + "\n"
+            finally:
+                LISTING_SECONDS.observe(time.perf_counter() - started, **labels)
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    files, next_cursor = await library.list_files(**params)
+    LISTING_SECONDS.observe(time.perf_counter() - started, **labels)
+    if not files and not cursor:
+        return {"message": empty_message}
+    return {"files": files, "next_cursor": next_cursor}
+
 @app.get("/api/files/")
-async def list_upload_file() -> dict:
-    "Lists all files in the uploads directory."
+async def list_upload_file(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None,
+    sort: str = "name",
+    order: str = "asc",
+    ext: str = None,
+    codec: str = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    "Lists the files in the uploads directory, one page at a time."
 
     try:
-        files = []
-        for filename in os.listdir(upload_dir):
-            file_path = upload_dir / filename
-            if file_path.is_file():
-                file_info = {"filename": filename, "size": format_size(file_path.stat().st_size)}
-            if file_validator.validate_extension(filename):
-                file_info.update(get_video_info(file_path))
-            files.append(file_info)
-        
-        return {"files": files} if files else {"message": "No files found"}
+        return await list_directory(upload_library, "No files found", limit, cursor, sort, order, ext, codec, format)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {e}")
 
@@ -105,64 +288,293 @@ async def delete_file(filename: str) -> None:
         raise HTTPException(status_code=404, detail=f"File {filename} not found")
     try:
         os.remove(file_path)
+        metadata_cache.invalidate(file_path)
+        content_index.forget(file_path)
+        previews.forget(file_path)
         return {"message": f"File {filename} deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting file {filename}: {e}")
 
+def task_duration(filename: str) -> float:
+    "Probed duration of an upload, used by the scheduler to recognise short jobs."
+
+    try:
+        return metadata_cache.get(upload_dir / Path(filename).name).get("duration")
+    except Exception:
+        return None
+
+def task_status(task_id: str) -> dict:
+    "A task as stored, plus its queue position and estimated start while it is pending."
+
+    task = queue_manager.get_task(task_id)
+    if task and task["status"] == "pending":
+        task["queue"] = queue_manager.queue_position(task_id)
+    return task
+
+def enqueue_file(filename: str, priority: int, client: str) -> dict:
+    "Enqueue one upload unless it already has an active task, reusing the output of identical content if there is one."
+
+    existing = queue_manager.check_tasks([filename])
+    if filename in existing:
+        return {"filename": filename, "status": existing[filename], "duplicate": True}
+    # Si ya se procesó un vídeo idéntico, enlazar su salida en lugar de volver a codificar
+    reused = video_processor.reuse_output(filename)
+    entry = {"filename": filename, "duration": task_duration(filename), "reused": reused}
+    task = queue_manager.add_tasks([entry], priority=priority, client=client)[0]
+    task["reused"] = reused
+    return task
+
 @app.post("/api/process/add/{filename}")
-async def process_video(filename: str):
+async def process_video(filename: str, request: Request, priority: int = Query(0, ge=-10, le=10)):
     "Add a video to the processing queue"
 
+    filename = Path(filename).name
+    # Sin cabecera X-Client-Id, el reparto justo se hace por dirección del cliente
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else None)
     try:
-        task_id = queue_manager.add_task(filename)
-        return {
-            "status": "success",
-            "task_id": task_id,
-            "message": "Video added to processing queue"
-        }
+        task = await run_in_threadpool(enqueue_file, filename, priority, client)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if task["duplicate"]:
+        raise HTTPException(status_code=409, detail=f"File {filename} already has a {task['status']} task")
+    reused = task["reused"]
+    return {
+        "status": "success",
+        "task_id": task["task_id"],
+        "message": f"Reused the output of identical video {reused['reused_from']}" if reused else "Video added to processing queue"
+    }
+
+@dataclass
+class BatchEnqueue:
+    "Files to enqueue: explicit names and/or a glob or a directory, relative to the uploads directory."
+    filenames: List[str] = field(default_factory=list)
+    pattern: str = None
+    directory: str = None
+    priority: int = 0
+
+@dataclass
+class BatchStatus:
+    "Task ids to report on."
+    task_ids: List[str]
+
+MAX_BATCH = 10000
+
+def batch_filenames(batch: BatchEnqueue) -> list:
+    "Explicit filenames plus the matches of the glob or directory, in order and without repeats."
+
+    patterns = [batch.pattern] if batch.pattern else []
+    if batch.directory:
+        patterns.append(f"{batch.directory.rstrip('/')}/*")
+    filenames = list(batch.filenames)
+    for pattern in patterns:
+        if Path(pattern).is_absolute() or ".." in Path(pattern).parts:
+            raise ValueError(f"Invalid pattern: {pattern}")
+        matches = (path.relative_to(upload_dir) for path in upload_dir.glob(pattern) if path.is_file())
+        # Fuera quedan los ficheros ocultos y las subidas a medias de .partial
+        filenames += sorted(str(path) for path in matches if not any(part.startswith(".") for part in path.parts))
+    return list(dict.fromkeys(filenames))
+
+def enqueue_batch(filenames: list, priority: int, client: str) -> dict:
+    "Validate and enqueue many files in one transaction; files that already have a task are reported, not queued again."
+
+    rejected = []
+    accepted = []
+    for filename in filenames:
+        parts = Path(filename).parts
+        if not parts or Path(filename).is_absolute() or any(part.startswith(".") for part in parts):
+            rejected.append({"filename": filename, "error": "Invalid filename"})
+            continue
+        valid, message = file_validator.validate_extension(filename)
+        if not valid:
+            rejected.append({"filename": filename, "error": message})
+        elif not (upload_dir / filename).is_file():
+            rejected.append({"filename": filename, "error": "File not found"})
+        else:
+            accepted.append(filename)
+
+    existing = queue_manager.check_tasks(accepted)
+    entries = []
+    for filename in accepted:
+        entry = {"filename": filename}
+        if filename not in existing:
+            # Solo la caché: no lanzar un ffprobe por fichero dentro de la petición
+            info = metadata_cache.lookup(upload_dir / filename) or {}
+            entry["duration"] = info.get("duration")
+            entry["reused"] = video_processor.reuse_output(filename)
+        entries.append(entry)
+
+    tasks = queue_manager.add_tasks(entries, priority=priority, client=client)
+    return {
+        "queued": sum(not task["duplicate"] for task in tasks),
+        "duplicates": sum(task["duplicate"] for task in tasks),
+        "tasks": tasks,
+        "rejected": rejected,
+    }
+
+@app.post("/api/process/add")
+async def process_videos(batch: BatchEnqueue, request: Request) -> dict:
+    "Add many videos to the processing queue at once, by name, glob pattern or directory."
+
+    if not -10 <= batch.priority <= 10:
+        raise HTTPException(status_code=400, detail="priority must be between -10 and 10")
+    try:
+        filenames = await run_in_threadpool(batch_filenames, batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not filenames:
+        raise HTTPException(status_code=400, detail="No files to enqueue")
+    if len(filenames) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"Too many files in one batch: {len(filenames)} (max {MAX_BATCH})")
+
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else None)
+    try:
+        return await run_in_threadpool(enqueue_batch, filenames, batch.priority, client)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def tasks_status(task_ids: list) -> dict:
+    "Many tasks in one query, with the queue position of those still pending."
+
+    tasks = queue_manager.get_tasks(task_ids)
+    if any(task["status"] == "pending" for task in tasks.values()):
+        positions = queue_manager.queue_positions()
+        for task in tasks.values():
+            if task["status"] == "pending":
+                task["queue"] = positions.get(task["id"])
+    return {"tasks": tasks, "missing": [task_id for task_id in task_ids if task_id not in tasks]}
+
+@app.post("/api/process/status")
+async def get_processes_status(batch: BatchStatus) -> dict:
+    "Get the status of many processing tasks at once."
+
+    if len(batch.task_ids) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"Too many task ids: {len(batch.task_ids)} (max {MAX_BATCH})")
+    return await run_in_threadpool(tasks_status, list(dict.fromkeys(batch.task_ids)))
 
 @app.get("/api/process/status/{task_id}")
 async def get_process_status(task_id: str) -> dict:
-    "Get the status of a processing task."
-    
-    current_status = queue_manager.find_task_status(task_id)
+    "Get the status of a processing task, with queue position and estimated start while pending."
     
-    if not current_status:
-        raise HTTPException(status_code=404, detail="Task not found")
-        
-    task = queue_manager.get_task_status(task_id, current_status)
+    task = await run_in_threadpool(task_status, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
         
     return task
 
+@app.get("/api/process/space")
+async def get_space_usage() -> dict:
+    "Free space of the output filesystem and the part of it reserved by running encodes and uploads."
+
+    return await run_in_threadpool(space_ledger.usage, output_dir)
+
+@app.get("/api/process/tuning")
+async def get_tuning_status() -> dict:
+    "Concurrency policy, thread and CPU placement, and recent throughput measurements of every processor daemon."
+
+    return {"daemons": await run_in_threadpool(ConcurrencyTuner.read_status, TUNING_STATUS_DIR)}
+
+@app.get("/api/process/events/{task_id}")
+async def stream_process_status(task_id: str, request: Request):
+    "Push status and progress changes of a task as Server-Sent Events until it finishes."
+
+    if not queue_manager.get_task(task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        last_task = None
+        idle = 0
+        while not await request.is_disconnected():
+            task = await run_in_threadpool(task_status, task_id)
+            if task != last_task:
+                yield f"data: {json.dumps(task)}\n\n"
+                last_task = task
+                idle = 0
+            elif idle >= 15:
+                yield ": keep-alive\n\n"
+                idle = 0
+            if task is None or task["status"] in ("completed", "error"):
+                break
+            await asyncio.sleep(1)
+            idle += 1
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/process/ready")
-async def list_processed_files() -> dict:
-    "List all processed video files."
+async def list_processed_files(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None,
+    sort: str = "name",
+    order: str = "asc",
+    ext: str = None,
+    codec: str = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    "List processed video files, one page at a time."
     try:
-        files = []
-        for filename in os.listdir(output_dir):
-            file_path = output_dir / filename
-            if file_path.is_file():
-                file_info = {
-                    "filename": filename,
-                    "size": format_size(file_path.stat().st_size)
-                }
-                if file_validator.validate_extension(filename):
-                    file_info.update(get_video_info(file_path))
-                files.append(file_info)
-        
-        if not files:
-            return {"message": "No processed files found"}
-        return {"files": files}
+        return await list_directory(output_library, "No processed files found", limit, cursor, sort, order, ext, codec, format)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error listing processed files: {e}"
         )
 
+@app.api_route("/api/process/download/{filename}", methods=["GET", "HEAD"])
+async def download_processed_file(filename: str, request: Request):
+    "Serve a processed video with Range support and a strong ETag."
+
+    file_path = output_dir / Path(filename).name
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail=f"File {filename} not found")
+    accel = accel_redirect.get("processed")
+    return file_response(
+        request, file_path, "video/mp2t", "public, max-age=3600",
+        accel_redirect=f"{accel.rstrip('/')}/{file_path.name}" if accel else None
+    )
+
+@app.api_route("/api/hls/{name}/{segment}", methods=["GET", "HEAD"])
+async def get_hls_file(name: str, segment: str, request: Request):
+    "Serve an HLS playlist or segment. The playlist keeps growing while the transcode is running."
+
+    if not HLS_FILE.match(segment) or name.startswith(".") or Path(name).name != name:
+        raise HTTPException(status_code=404, detail="Not found")
+    file_path = hls_dir / name / segment
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+
+    if segment.endswith(".m3u8"):
+        media_type, cache_control = "application/vnd.apple.mpegurl", "no-cache"
+    else:
+        # Los segmentos no cambian una vez escritos (hls_flags=temp_file)
+        media_type, cache_control = "video/mp2t", "public, max-age=31536000, immutable"
+    accel = accel_redirect.get("hls")
+    return file_response(
+        request, file_path, media_type, cache_control,
+        accel_redirect=f"{accel.rstrip('/')}/{name}/{segment}" if accel else None
+    )
+
+@app.api_route("/api/previews/{key}/{asset}", methods=["GET", "HEAD"])
+async def get_preview(key: str, asset: str, request: Request):
+    "Serve a poster, sprite sheet or WebVTT sprite index by the preview key given in file listings."
+
+    file_path = await run_in_threadpool(previews.asset, key, asset)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    # La clave identifica el contenido: la respuesta no cambia nunca
+    return file_response(request, file_path, PreviewCache.ASSETS[asset], "public, max-age=31536000, immutable")
+
+@app.get("/metrics")
+async def get_metrics():
+    "Prometheus metrics, merged across the API and worker processes."
+
+    body = await run_in_threadpool(REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
 
     import uvicorn
@@ -0,0 +1,136 @@
+import os
+import json
+from pathlib import Path
+from utils import get_video_info, get_video_info_async
+from core.process import VideoProcessor
+from core.validate import FileValidator
+from core.manager import QueueManager
+from core.daemon import ProcessorDaemon
+from core.logging import VideoLogger
+from core.notify import QueueNotifier
+from core.metadata import MetadataCache
+from core.profile import TranscodeProfile
+from core.dedup import ContentIndex
+from core.space import SpaceLedger
+from core.preview import PreviewCache
+from core.watch import UploadWatcher
+from core.tuning import ConcurrencyTuner
+from core.metrics import REGISTRY, QUEUE_TASKS, DISK_FREE_BYTES, DISK_RESERVED_BYTES
+
+# Objetos compartidos por la API (main.py) y el worker de procesamiento (worker.py)
+
+CONFIG_FILE = os.environ.get("VAULT_CONFIG", "/var/www/vault/app/api/config/config.json")
+
+with open(CONFIG_FILE) as config_file:
+    config = json.load(config_file)
+
+# Estado del tuner de cada daemon, para la API (el daemon puede correr en otro proceso)
+TUNING_STATUS_DIR = Path(config["path"]["metrics"]) / "tuning"
+
+def current_concurrency() -> int:
+    "Tasks the live processor daemons run at once, as published by their tuners; None when none is running."
+
+    return sum(status["concurrency"] for status in ConcurrencyTuner.read_status(TUNING_STATUS_DIR)) or None
+
+space_ledger = SpaceLedger(Path(config["path"]["index"]), min_free=config["processing"]["min_free_space"])
+file_validator = FileValidator(config["path"], space_ledger=space_ledger)
+queue_notifier = QueueNotifier(Path(config["path"]["sockets"]))
+queue_manager = QueueManager(Path(config["path"]["queue"]), config, notifier=queue_notifier, concurrency=current_concurrency)
+logger = VideoLogger(Path(config["path"]["logs"]), level=config["processing"]["log_level"], **config.get("logging", {}))
+metadata_cache = MetadataCache(
+    Path(config["path"]["index"]),
+    probe=get_video_info,
+    probe_async=get_video_info_async,
+    probe_concurrency=config["processing"]["probe_concurrency"]
+)
+content_index = ContentIndex(Path(config["path"]["index"]))
+previews = PreviewCache.from_config(config, metadata_cache, logger)
+
+video_processor = VideoProcessor(
+    input_dir=Path(config["path"]["uploads"]),
+    output_dir=Path(config["path"]["processed"]),
+    queue_manager=queue_manager,
+    file_validator=file_validator,
+    logger=logger,
+    metadata_cache=metadata_cache,
+    profile=TranscodeProfile.from_config(config),
+    segmented=config["transcode"].get("segmented"),
+    hls={**config["transcode"].get("hls", {}), "directory": config["path"]["hls"]},
+    content_index=content_index,
+    previews=previews
+)
+
+def collect_queue_metrics() -> None:
+    "Refresh the queue depth gauge from the shared queue store."
+
+    for state, count in queue_manager.store.counts().items():
+        QUEUE_TASKS.set(count, state=state)
+
+def collect_space_metrics() -> None:
+    "Refresh the free and reserved space gauges of the output filesystem."
+
+    usage = space_ledger.usage(Path(config["path"]["processed"]))
+    DISK_FREE_BYTES.set(usage["free"])
+    DISK_RESERVED_BYTES.set(usage["reserved"])
+
+REGISTRY.add_collector(collect_queue_metrics)
+REGISTRY.add_collector(collect_space_metrics)
+REGISTRY.start_export(Path(config["path"]["metrics"]))
+
+def create_daemon(max_workers: int = None) -> ProcessorDaemon:
+    "Build the processor daemon from the `processing` section of the config."
+
+    return ProcessorDaemon(
+        queue_manager=queue_manager,
+        video_processor=video_processor,
+        logger=logger,
+        file_validator=file_validator,
+        check_interval=config["processing"]["check_interval"],
+        max_workers=max_workers or config["processing"]["max_workers"],
+        notifier=queue_notifier,
+        lease_seconds=config["processing"]["lease_seconds"],
+        max_attempts=config["processing"]["max_attempts"],
+        retry_backoff=config["processing"]["retry_backoff"],
+        space_ledger=space_ledger,
+        space_retry=config["processing"]["space_retry"],
+        tuner=ConcurrencyTuner.from_config(config, max_workers),
+        status_dir=TUNING_STATUS_DIR
+    )
+
+def ingest_dropped_file(file_path: Path) -> dict:
+    """
+    Queue entry for a video copied into the uploads directory outside the API.
+
+    Only cheap lookups run here, so a bulk drop is queued as soon as it settles; the
+    processor hashes (and deduplicates) the file and probes it when it claims the task.
+
+    Returns:
+        The `QueueManager.add_tasks` entry, or None for files uploaded through the API,
+        which are indexed already and only queued on request
+    """
+
+    if content_index.lookup(file_path):
+        return None
+    info = metadata_cache.lookup(file_path) or {}
+    return {
+        "filename": str(file_path.relative_to(Path(config["path"]["uploads"]))),
+        "duration": info.get("duration")
+    }
+
+def create_watcher() -> UploadWatcher:
+    "Build the uploads watcher from the `watch` section of the config, or None when it is disabled."
+
+    settings = config.get("watch", {})
+    if not settings.get("enabled"):
+        return None
+    return UploadWatcher(
+        directory=Path(config["path"]["uploads"]),
+        queue_manager=queue_manager,
+        file_validator=file_validator,
+        logger=logger,
+        prepare=ingest_dropped_file,
+        settle_seconds=settings.get("settle_seconds", 10),
+        batch_seconds=settings.get("batch_seconds", 2),
+        max_batch=settings.get("max_batch", 100),
+        scan_existing=settings.get("scan_existing", False)
+    )
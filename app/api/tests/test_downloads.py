@@ -0,0 +1,68 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+
+@pytest.fixture(scope="module")
+def app():
+    "Import the API against a throwaway config whose paths all live in a temp directory."
+
+    root = Path(tempfile.mkdtemp())
+    with open(API_DIR / "config" / "config.json") as config_file:
+        config = json.load(config_file)
+    config["path"] = {name: str(root / name) for name in config["path"]}
+    config["path"]["queue"] = str(root / "queue" / "queue.json")
+    config_path = root / "config.json"
+    config_path.write_text(json.dumps(config))
+
+    os.environ["VAULT_CONFIG"] = str(config_path)
+    import main
+    (main.output_dir / "movie.ts").write_bytes(bytes(range(256)) * 4)
+    (main.hls_dir / "movie").mkdir()
+    (main.hls_dir / "movie" / "seg_0.ts").write_bytes(b"segment")
+    return main.app
+
+
+def request(app, method: str, url: str, headers: dict = None) -> httpx.Response:
+    "Send one request to the app without running its lifespan (no daemon, no watcher)."
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.request(method, url, headers=headers)
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize("url, size", [("/api/process/download/movie.ts", 1024), ("/api/hls/movie/seg_0.ts", 7)])
+def test_head_matches_get_without_body(app, url, size):
+    get = request(app, "GET", url)
+    head = request(app, "HEAD", url)
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == str(size)
+    for name in ("etag", "accept-ranges", "content-type", "last-modified"):
+        assert head.headers[name] == get.headers[name]
+
+
+def test_head_with_range(app):
+    head = request(app, "HEAD", "/api/process/download/movie.ts", {"range": "bytes=100-199"})
+    assert head.status_code == 206
+    assert head.content == b""
+    assert head.headers["content-length"] == "100"
+    assert head.headers["content-range"] == "bytes 100-199/1024"
+
+    get = request(app, "GET", "/api/process/download/movie.ts", {"range": "bytes=100-199"})
+    assert get.status_code == 206
+    assert get.content == (bytes(range(256)) * 4)[100:200]
+
+
+def test_head_missing_file(app):
+    assert request(app, "HEAD", "/api/process/download/missing.ts").status_code == 404
@@ -0,0 +1,77 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.library import FileLibrary
+from core.metadata import MetadataCache
+from core.validate import FileValidator
+
+
+@pytest.fixture
+def library(tmp_path):
+    "A library over a temp directory whose probes report the file size as duration."
+
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    cache = MetadataCache(tmp_path / "index.db", probe=lambda path: {"duration": float(path.stat().st_size)})
+    validator = FileValidator({"uploads": uploads, "processed": tmp_path / "processed"})
+    return FileLibrary(uploads, validator, cache, probe_timeout=5)
+
+
+def listing(library: FileLibrary, **kwargs) -> tuple[list, str]:
+    return asyncio.run(library.list_files(**kwargs))
+
+
+@pytest.mark.parametrize("sort", ["name", "size", "mtime"])
+def test_file_grown_in_place_is_listed_with_its_new_size(library, sort):
+    (library.directory / "a.mp4").write_bytes(b"x" * 10)
+    (library.directory / "b.mp4").write_bytes(b"x" * 20)
+    files, _ = listing(library, sort=sort)
+    assert {f["filename"]: f["bytes"] for f in files} == {"a.mp4": 10, "b.mp4": 20}
+
+    # Escribir en el fichero no cambia el mtime del directorio
+    with open(library.directory / "a.mp4", "ab") as file:
+        file.write(b"x" * 1000)
+    files, _ = listing(library, sort=sort)
+    grown = next(f for f in files if f["filename"] == "a.mp4")
+    assert grown["bytes"] == 1010
+    assert grown["duration"] == 1010.0
+
+
+def test_pages_cover_every_file_once(library):
+    for index in range(25):
+        (library.directory / f"f{index:02d}.mp4").write_bytes(b"x" * (index % 7))
+    for sort in ("name", "size", "mtime"):
+        for order in ("asc", "desc"):
+            names, cursor = [], None
+            while True:
+                files, cursor = listing(library, sort=sort, order=order, limit=4, cursor=cursor)
+                names += [f["filename"] for f in files]
+                if not cursor:
+                    break
+            assert sorted(names) == sorted(f"f{index:02d}.mp4" for index in range(25))
+
+
+def test_deleted_file_is_left_out(library):
+    for name in ("a.mp4", "b.mp4", "c.mp4"):
+        (library.directory / name).write_bytes(b"x")
+    listing(library)
+    (library.directory / "b.mp4").unlink()
+    files, _ = listing(library)
+    assert [f["filename"] for f in files] == ["a.mp4", "c.mp4"]
+
+
+def test_cursor_from_another_sort_key_is_rejected(library):
+    for name in ("a.mp4", "b.mp4"):
+        (library.directory / name).write_bytes(b"x")
+    _, cursor = listing(library, sort="name", limit=1)
+    assert cursor
+    with pytest.raises(ValueError):
+        library.validate("size", "asc", cursor)
+    with pytest.raises(ValueError):
+        listing(library, sort="mtime", cursor=cursor)
+    library.validate("name", "desc", cursor)
@@ -0,0 +1,193 @@
+import json
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.manager import QueueManager
+from core.scheduler import SchedulingPolicy
+from core.store import JsonQueueStore, SqliteQueueStore
+
+
+def make_task(index: int, created_at: datetime, **fields) -> dict:
+    "A pending task as QueueManager builds it."
+    task = {
+        "id": f"task-{index:05d}",
+        "filename": f"video-{index:05d}.mp4",
+        "status": "pending",
+        "created_at": created_at.isoformat(),
+        "updated_at": created_at.isoformat(),
+        "priority": 0,
+        "client": None,
+    }
+    task.update((key, value) for key, value in fields.items() if value is not None)
+    return task
+
+
+def assert_claims_match_full_queue(store: SqliteQueueStore, policy: SchedulingPolicy, claims: int) -> None:
+    "Every claim through the indexed candidates picks what the policy picks from the whole queue."
+    for _ in range(claims):
+        expected = policy.select(store.list("pending"), store.list("processing"))
+        claimed = store.claim(datetime.now().isoformat(), select=policy.select, short_job_seconds=policy.short_job_seconds)
+        if expected is None:
+            assert claimed is None
+            return
+        assert claimed["id"] == expected["id"]
+
+
+# --------------- [Claim candidates] ---------------
+
+def test_claim_candidates_follow_aging(tmp_path):
+    # Muchas tareas de prioridad alta recientes y tareas viejas de prioridad baja que el envejecimiento adelanta
+    store = SqliteQueueStore(tmp_path / "queue.db")
+    policy = SchedulingPolicy({"aging_seconds": 1800, "short_job_boost": 0})
+    start = datetime.now() - timedelta(hours=10)
+    rng = random.Random(1)
+    tasks = []
+    for index in range(400):
+        created_at = start + timedelta(seconds=index * 90)
+        tasks.append(make_task(index, created_at, priority=rng.choice([0, 0, 0, 2, 5])))
+    store.add_many(tasks)
+    assert_claims_match_full_queue(store, policy, 120)
+
+
+def test_claim_candidates_follow_short_job_boost(tmp_path):
+    # Los trabajos cortos están al final de una cola larga y solo el impulso por duración los adelanta
+    store = SqliteQueueStore(tmp_path / "queue.db")
+    policy = SchedulingPolicy({"short_job_seconds": 300, "short_job_boost": 1, "aging_seconds": 0})
+    now = datetime.now()
+    tasks = [make_task(index, now, duration=3600.0) for index in range(300)]
+    tasks += [make_task(300 + index, now, duration=60.0 + index) for index in range(40)]
+    store.add_many(tasks)
+    assert_claims_match_full_queue(store, policy, 80)
+
+
+def test_claim_candidates_follow_fair_share(tmp_path):
+    # Un cliente encola en bloque y otros llegan después con pocas tareas
+    store = SqliteQueueStore(tmp_path / "queue.db")
+    policy = SchedulingPolicy({"aging_seconds": 0})
+    now = datetime.now()
+    tasks = [make_task(index, now, client="bulk") for index in range(300)]
+    tasks += [make_task(300 + index, now, client=f"user-{index % 5}") for index in range(25)]
+    tasks += [make_task(400 + index, now) for index in range(10)]
+    store.add_many(tasks)
+    assert_claims_match_full_queue(store, policy, 100)
+
+
+def test_claim_candidates_mixed_policy_and_backoff(tmp_path):
+    store = SqliteQueueStore(tmp_path / "queue.db")
+    policy = SchedulingPolicy({"aging_seconds": 3600, "short_job_seconds": 300})
+    rng = random.Random(7)
+    start = datetime.now() - timedelta(hours=6)
+    tasks = []
+    for index in range(600):
+        tasks.append(make_task(
+            index,
+            start + timedelta(seconds=index * 30),
+            priority=rng.choice([-1, 0, 0, 0, 1, 3]),
+            client=rng.choice(["bulk"] * 6 + ["alice", "bob", None]),
+            duration=rng.choice([None, 45.0, 200.0, 1200.0, 5400.0]),
+            not_before=rng.choice([None] * 8 + [time.time() + 3600, time.time() - 10]),
+        ))
+    store.add_many(tasks)
+    assert_claims_match_full_queue(store, policy, 200)
+
+
+# --------------- [Schema and store methods] ---------------
+
+def test_migration_from_version_1_moves_scheduling_fields_to_columns(tmp_path):
+    db_file = tmp_path / "queue.db"
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    for statement in SqliteQueueStore.SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+    now = datetime.now().isoformat()
+    blobs = {
+        "a": {"priority": 0, "client": "bulk", "duration": 3600.0, "attempts": 1},
+        "b": {"priority": 5, "client": "alice", "duration": 30.0, "not_before": 1.0},
+        "c": {"priority": 1, "client": None},
+    }
+    for task_id, data in blobs.items():
+        conn.execute(
+            "INSERT INTO processing_queue (id, filename, status, created_at, updated_at, data) VALUES (?, ?, 'pending', ?, ?, ?)",
+            (task_id, f"{task_id}.mp4", now, now, json.dumps(data)),
+        )
+    conn.execute("PRAGMA user_version = 1")
+    conn.close()
+
+    store = SqliteQueueStore(db_file)
+    conn = store.db.connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+    row = conn.execute("SELECT priority, client, duration, not_before, data FROM processing_queue WHERE id = 'b'").fetchone()
+    assert (row["priority"], row["client"], row["duration"], row["not_before"]) == (5, "alice", 30.0, 1.0)
+    assert json.loads(row["data"]) == {}
+    assert store.get("a")["attempts"] == 1
+    assert {task_id: {k: store.get(task_id).get(k) for k in data} for task_id, data in blobs.items()} == blobs
+
+    # Los candidatos ya se leen de las columnas migradas
+    claimed = store.claim(now, select=SchedulingPolicy({"aging_seconds": 0}).select)
+    assert claimed["id"] == "b"
+
+
+@pytest.mark.parametrize("backend", [JsonQueueStore, SqliteQueueStore])
+def test_claim_without_policy_skips_backoff(tmp_path, backend):
+    store = backend(tmp_path / "queue.store")
+    start = datetime.now() - timedelta(minutes=1)
+    store.add(make_task(1, start, not_before=time.time() + 60))
+    store.add(make_task(2, start + timedelta(seconds=1)))
+    store.add(make_task(3, start + timedelta(seconds=2), not_before=time.time() - 1))
+
+    # La más antigua está esperando un reintento: se toman las siguientes en orden de llegada
+    assert store.claim(datetime.now().isoformat())["id"] == "task-00002"
+    assert store.claim(datetime.now().isoformat())["id"] == "task-00003"
+    assert store.claim(datetime.now().isoformat()) is None
+    assert store.get("task-00001")["status"] == "pending"
+
+
+@pytest.mark.parametrize("backend", [JsonQueueStore, SqliteQueueStore])
+def test_update_compare_and_set(tmp_path, backend):
+    store = backend(tmp_path / "queue.store")
+    store.add(make_task(1, datetime.now()))
+    claimed = store.claim(datetime.now().isoformat(), fields={"lease_owner": "worker-a"})
+
+    assert store.update(claimed["id"], {"progress": {"percent": 10}}, expect={"status": "processing", "lease_owner": "worker-b"}) is None
+    assert "progress" not in store.get(claimed["id"])
+
+    updated = store.update(claimed["id"], {"status": "completed"}, expect={"status": "processing", "lease_owner": "worker-a"})
+    assert updated["status"] == "completed"
+    assert store.get(claimed["id"])["status"] == "completed"
+    # El estado ya no es el esperado: una segunda escritura no debe pisarlo
+    assert store.update(claimed["id"], {"status": "pending"}, expect={"status": "processing"}) is None
+    assert store.counts()["completed"] == 1
+    assert store.update("missing", {"status": "error"}) is None
+
+
+@pytest.mark.parametrize("backend", [JsonQueueStore, SqliteQueueStore])
+def test_reclaim_expired(tmp_path, backend):
+    manager = QueueManager(tmp_path / "queue.json", {"path": {}}, store=backend(tmp_path / "queue.store"))
+    for filename in ("expired.mp4", "exhausted.mp4", "alive.mp4"):
+        manager.add_task(filename)
+
+    expired = manager.claim_task("dead-worker", -1)
+    exhausted = manager.claim_task("dead-worker", -1)
+    manager.store.update(exhausted["id"], {"attempts": 3})
+    alive = manager.claim_task("live-worker", 60)
+
+    reclaimed = manager.reclaim_expired(max_attempts=3)
+    assert sorted(reclaimed) == sorted([expired["id"], exhausted["id"]])
+
+    task = manager.get_task(expired["id"])
+    assert (task["status"], task["lease_owner"], task["attempts"]) == ("pending", None, 1)
+    task = manager.get_task(exhausted["id"])
+    assert task["status"] == "error" and "3 attempts" in task["error"]
+    assert manager.get_task(alive["id"])["status"] == "processing"
+
+    # El trabajador perdido ya no puede cerrar la tarea reclamada
+    assert not manager.finish_task(expired["id"], "dead-worker", "completed")
+    assert manager.reclaim_expired(max_attempts=3) == []
@@ -1,6 +1,17 @@
+import os
+import re
 import json
+import anyio
+import asyncio
+import time
 import subprocess
 from pathlib import Path
+from email.utils import formatdate
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from core.metrics import PROBE_CALLS, PROBE_SECONDS
+
+FFPROBE_COMMAND = ['ffprobe', '-v', 'error', '-show_entries', 'stream:format=duration,bit_rate', '-of', 'json']
 
 def format_size(size: str) -> str:
     """Converts a size in bytes to a readable representation (B, KB, MB, GB, TB)."""
@@ -12,41 +23,162 @@ def format_size(size: str) -> str:
     return f"{size:.2f} TB"
 
 
+def parse_fraction(value: str) -> float:
+    """Convert an ffprobe rational such as '30000/1001' to a float (0 when undefined)."""
+
+    numerator, _, denominator = value.partition("/")
+    denominator = float(denominator or 1)
+    return float(numerator) / denominator if denominator else 0.0
+
+
+def parse_video_info(ffprobe_output: dict) -> dict:
+    """Build the stream summary returned by the API from raw ffprobe JSON."""
+
+    video_info = {"video_streams": [], "audio_streams": []}
+
+    media_format = ffprobe_output.get("format", {})
+    if media_format.get("duration") not in (None, "N/A"):
+        video_info["duration"] = float(media_format["duration"])
+    if media_format.get("bit_rate") not in (None, "N/A"):
+        video_info["bit_rate"] = int(media_format["bit_rate"])
+
+    for stream in ffprobe_output.get("streams", []):
+        if stream["codec_type"] == "video":
+            fps = parse_fraction(stream.get("avg_frame_rate", "0/1"))
+            video_info["video_streams"].append(
+                {
+                    "codec": stream.get("codec_name"),
+                    "resolution": f"{stream.get('width')}x{stream.get('height')}",
+                    "fps": f"{round(fps,2)} fps",
+                }
+            )
+
+        elif stream["codec_type"] == "audio":
+            video_info["audio_streams"].append(
+                {
+                    "codec": stream.get("codec_name"),
+                    "language": stream.get("tags", {}).get("language", "Unknown"),
+                }
+            )
+
+    return video_info
+
+
 def get_video_info(file_path: Path) -> dict:
     """Extract technical information from a video file using ffprobe."""
 
+    start = time.perf_counter()
     try:
         result = subprocess.run(
-            ['ffprobe', '-v', 'error', '-show_entries', 'stream', '-of', 'json', str(file_path)],
+            FFPROBE_COMMAND + [str(file_path)],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
         )
-
-        ffprobe_output = json.loads(result.stdout)
-        video_info = {"video_streams": [], "audio_streams": []}
-
-        for stream in ffprobe_output.get("streams", []):
-            if stream["codec_type"] == "video":
-                fps_fraction = stream.get("avg_frame_rate", "0/1")
-                fps = eval(fps_fraction)
-                video_info["video_streams"].append(
-                    {
-                        "codec": stream.get("codec_name"),
-                        "resolution": f"{stream.get('width')}x{stream.get('height')}",
-                        "fps": f"{round(fps,2)} fps",
-                    }
-                )
-
-            elif stream["codec_type"] == "audio":
-                video_info["audio_streams"].append(
-                    {
-                        "codec": stream.get("codec_name"),
-                        "language": stream.get("tags", {}).get("language", "Unknown"),
-                    }
-                )
-
-        return video_info
+        info = parse_video_info(json.loads(result.stdout))
+        PROBE_CALLS.inc(outcome="ok")
+        return info
 
     except Exception as e:
+        PROBE_CALLS.inc(outcome="error")
         return {"error": f"Failed to retrieve video info: {str(e)}"}
+    finally:
+        PROBE_SECONDS.observe(time.perf_counter() - start, mode="sync")
+
+
+async def get_video_info_async(file_path: Path, timeout: float = 60) -> dict:
+    """Same as get_video_info, but runs ffprobe as an asyncio subprocess so the event loop keeps serving."""
+
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *FFPROBE_COMMAND, str(file_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        info = parse_video_info(json.loads(stdout))
+        PROBE_CALLS.inc(outcome="ok")
+        return info
+
+    except Exception as e:
+        PROBE_CALLS.inc(outcome="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+        return {"error": f"Failed to retrieve video info: {str(e) or type(e).__name__}"}
+    finally:
+        PROBE_SECONDS.observe(time.perf_counter() - start, mode="async")
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that sends only bytes start..end (inclusive) with a 206 status."""
+
+    def __init__(self, path: Path, start: int, end: int, stat_result: os.stat_result, **kwargs):
+        super().__init__(path, status_code=206, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(request: Request, file_path: Path, media_type: str, cache_control: str, accel_redirect: str = None) -> Response:
+    """
+    Serve a file with a strong ETag, conditional requests and single byte ranges.
+
+    When `accel_redirect` is set (an nginx internal location mapped to the same file), the body
+    is handed off with X-Accel-Redirect so nginx sends it with sendfile().
+    """
+
+    stat = os.stat(file_path)
+    etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if accel_redirect:
+        headers["x-accel-redirect"] = accel_redirect
+        return Response(media_type=media_type, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), stat.st_size - 1) if match.group(2) else stat.st_size - 1
+            else:
+                start = max(stat.st_size - int(match.group(2)), 0)
+                end = stat.st_size - 1
+            if start > end or start >= stat.st_size:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat.st_size}"})
+            return RangeFileResponse(file_path, start, end, stat, media_type=media_type, headers=headers)
+
+    return FileResponse(file_path, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,39 @@
+import signal
+import argparse
+import threading
+from services import config, create_daemon, create_watcher
+
+# Worker de procesamiento independiente de la API.
+# Con processing.daemon = "external", los workers de uvicorn solo encolan y este proceso procesa.
+# Se escala lanzando más procesos: el claim con lease en la cola impide que dos cojan la misma tarea.
+
+def main():
+    "Run the processor daemon until SIGTERM or SIGINT."
+
+    parser = argparse.ArgumentParser(description="Vault video processing worker")
+    parser.add_argument(
+        "--workers", type=int, default=config["processing"]["max_workers"],
+        help="Videos processed concurrently by this process (the starting point when tuning.adaptive is set)"
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Also run the uploads watcher when watch.enabled is set (in one worker only)"
+    )
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    processor_daemon = create_daemon(max_workers=args.workers)
+    upload_watcher = create_watcher() if args.watch else None
+    processor_daemon.start()
+    if upload_watcher:
+        upload_watcher.start()
+    stop.wait()
+    if upload_watcher:
+        upload_watcher.stop()
+    processor_daemon.stop()
+
+if __name__ == "__main__":
+    main()
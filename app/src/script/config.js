@@ -2,11 +2,13 @@ const CONFIG = {
     API_URL: 'http://10.1.2.241:8000/api',
     ENDPOINTS: {
         UPLOADS: '/uploads/',
+        UPLOADS_CHUNK: '/uploads/chunk',
         FILES: '/files/',
         PROCESS: {
             ADD: '/process/add/',
-            READY: '/process/ready/',
+            READY: '/process/ready',
             STATUS: '/process/status/',
+            EVENTS: '/process/events/',
         }
     }
 };
\ No newline at end of file
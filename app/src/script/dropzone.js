@@ -1,12 +1,30 @@
 Dropzone.autoDiscover = false;
 let myDropzone = new Dropzone("#dropzone", { 
+    url: CONFIG.API_URL + CONFIG.ENDPOINTS.UPLOADS_CHUNK,
     paramName: 'file_uploads',
     maxFilesize: 18432, // Allow files up to 18 Gib
     acceptedFiles: '.ts, .mp4, .mkv',
     addRemoveLinks: true,
     dictRemoveFile: 'DELETE',
     clickable: "#dropbutton",
-    maxFiles: 6
+    maxFiles: 6,
+    // Subida por chunks: se escriben en paralelo y se reintentan si se corta la conexión
+    chunking: true,
+    forceChunking: true,
+    chunkSize: 8 * 1024 * 1024,
+    parallelChunkUploads: true,
+    retryChunks: true,
+    retryChunksLimit: 5,
+    timeout: 0,
+    chunksUploaded: async function(file, done) {
+        try {
+            const response = await fetch(CONFIG.API_URL + CONFIG.ENDPOINTS.UPLOADS_CHUNK + '/' + file.upload.uuid + '/finalize', {method: 'POST'});
+            if (!response.ok) throw new Error(response.statusText);
+            done();
+        } catch (error) {
+            this._errorProcessing([file], 'Error finalizing upload: ' + error.message);
+        }
+    }
     }
 );
 
@@ -18,4 +36,4 @@ myDropzone.on("success", function(file, response) {
 
 myDropzone.on("error", function(file, errorMessage) {
     alert("File " + file.name + " is too large or failed to upload!");
-});
\ No newline at end of file
+});
@@ -72,65 +72,144 @@ function showMessage(message, type = 'info') {
 }
 
 // API functions.
+// ---- [Listing helpers] ----
+const listings = new WeakMap();
+
+async function fetchListingPage(url, cursor, onFile) {
+    // Lee una página del listado en formato NDJSON y pinta cada fichero según llega.
+    const pageUrl = url + '?format=ndjson' + (cursor ? '&cursor=' + encodeURIComponent(cursor) : '');
+    const response = await fetch(pageUrl, {method: 'GET'});
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let next = null;
+    let count = 0;
+
+    while (true) {
+        const {value, done} = await reader.read();
+        if (value) buffer += decoder.decode(value, {stream: true});
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const record = JSON.parse(line);
+            if ('next_cursor' in record) {
+                next = record.next_cursor;
+            } else {
+                onFile(record);
+                count++;
+            }
+        }
+        if (done) break;
+    }
+    return {count, cursor: next};
+}
+
+function stopListing(list) {
+    const listing = listings.get(list);
+    if (listing) {
+        listing.observer?.disconnect();
+        listing.sentinel.remove();
+        listings.delete(list);
+    }
+}
+
+async function streamListing(url, list, onFile) {
+    // Pinta la primera página y pide las siguientes solo cuando el final de la lista entra en pantalla.
+    stopListing(list);
+    const listing = {sentinel: document.createElement('div'), observer: null, loading: false};
+    listings.set(list, listing);
+    const active = () => listings.get(list) === listing;
+    const paint = file => { if (active()) onFile(file); };
+
+    let {count, cursor} = await fetchListingPage(url, null, paint);
+    if (!cursor || !active()) return count;
+
+    listing.sentinel.className = 'list-sentinel';
+    list.after(listing.sentinel);
+    listing.observer = new IntersectionObserver(async entries => {
+        if (listing.loading || !entries.some(entry => entry.isIntersecting)) return;
+        listing.loading = true;
+        try {
+            ({cursor} = await fetchListingPage(url, cursor, paint));
+        } catch (error) {
+            console.error('Error fetching next page:', error);
+        }
+        listing.loading = false;
+        if (!active()) return;
+        if (!cursor) {
+            stopListing(list);
+        } else {
+            // Volver a observar para que dispare otra vez si el final sigue visible
+            listing.observer.unobserve(listing.sentinel);
+            listing.observer.observe(listing.sentinel);
+        }
+    }, {rootMargin: '200px'});
+    listing.observer.observe(listing.sentinel);
+    return count;
+}
+
+function buildStreamDetails(file) {
+    const detailsList = document.createElement('ul');
+
+    if (file.video_streams?.length > 0) {
+        file.video_streams.forEach((video, index) => {
+            const videoItem = document.createElement('li');
+            videoItem.innerHTML = `Video Stream ${index + 1}: ${video.codec.toUpperCase()}, Resolution: ${video.resolution}, FPS: ${video.fps}`;
+            detailsList.appendChild(videoItem);
+        });
+    }
+
+    if (file.audio_streams?.length > 0) {
+        file.audio_streams.forEach((audio, index) => {
+            const audioItem = document.createElement('li');
+            audioItem.innerHTML = `Audio Stream ${index + 1}: ${audio.codec.toUpperCase()}, Language: ${audio.language.toUpperCase()}`;
+            detailsList.appendChild(audioItem);
+        });
+    }
+
+    return detailsList;
+}
+
 // ---- [Uploaded files functions] ----
 async function fetchUploadedFiles() {
     try {
-        const response = await fetch(CONFIG.API_URL + CONFIG.ENDPOINTS.FILES, {method: 'GET'});;
-        const data = await response.json();
         const fileList = document.getElementById('fileList');
         fileList.innerHTML = '';
- 
-        if (data.files && data.files.length > 0) {
-            data.files.forEach(file => {
-                const listItem = document.createElement('li');
-                listItem.innerHTML = `${file.filename} (${file.size})`;
- 
-                if (file.video_streams || file.audio_streams) {
-                    const detailsList = document.createElement('ul');
-                    
-                    if (file.video_streams?.length > 0) {
-                        file.video_streams.forEach((video, index) => {
-                            const videoItem = document.createElement('li');
-                            videoItem.innerHTML = `Video Stream ${index + 1}: ${video.codec.toUpperCase()}, Resolution: ${video.resolution}, FPS: ${video.fps}`;
-                            detailsList.appendChild(videoItem);
-                        });
-                    }
- 
-                    if (file.audio_streams?.length > 0) {
-                        file.audio_streams.forEach((audio, index) => {
-                            const audioItem = document.createElement('li');
-                            audioItem.innerHTML = `Audio Stream ${index + 1}: ${audio.codec.toUpperCase()}, Language: ${audio.language.toUpperCase()}`;
-                            detailsList.appendChild(audioItem);
-                        });
-                    }
- 
-                    listItem.appendChild(detailsList);
+
+        const count = await streamListing(CONFIG.API_URL + CONFIG.ENDPOINTS.FILES, fileList, file => {
+            const listItem = document.createElement('li');
+            listItem.innerHTML = `${file.filename} (${file.size})`;
+
+            if (file.video_streams || file.audio_streams) {
+                listItem.appendChild(buildStreamDetails(file));
+            }
+
+            const processButton = document.createElement('button');
+            processButton.innerHTML = 'Process';
+            processButton.classList.add('process-button');
+            processButton.onclick = async function() {
+                if (confirm(`Are you sure you want to process ${file.filename}?`)) {
+                    await processVideo(file.filename);
                 }
- 
-                const processButton = document.createElement('button');
-                processButton.innerHTML = 'Process';
-                processButton.classList.add('process-button');
-                processButton.onclick = async function() {
-                    if (confirm(`Are you sure you want to process ${file.filename}?`)) {
-                        await processVideo(file.filename);
-                    }
-                };
- 
-                const deleteButton = document.createElement('button');
-                deleteButton.innerHTML = 'Delete';
-                deleteButton.classList.add('delete-button');
-                deleteButton.onclick = async function() {
-                    if (confirm(`Are you sure you want to delete ${file.filename}?`)) {
-                        await deleteUploadedFile(file.filename);
-                        fetchUploadedFiles();
-                    }
-                };
- 
-                listItem.appendChild(processButton);
-                listItem.appendChild(deleteButton);
-                fileList.appendChild(listItem);
-            });
-        } else {
+            };
+
+            const deleteButton = document.createElement('button');
+            deleteButton.innerHTML = 'Delete';
+            deleteButton.classList.add('delete-button');
+            deleteButton.onclick = async function() {
+                if (confirm(`Are you sure you want to delete ${file.filename}?`)) {
+                    await deleteUploadedFile(file.filename);
+                    fetchUploadedFiles();
+                }
+            };
+
+            listItem.appendChild(processButton);
+            listItem.appendChild(deleteButton);
+            fileList.appendChild(listItem);
+        });
+
+        if (count === 0) {
             const listItem = document.createElement('li');
             listItem.textContent = 'No files uploaded yet';
             fileList.appendChild(listItem);
@@ -156,41 +235,21 @@ async function deleteUploadedFile(filename) {
 // ---- [Processed files functions] ----
 async function fetchProcessedFiles() {
     try {
-        const response = await fetch(CONFIG.API_URL + CONFIG.ENDPOINTS.PROCESS.READY, {method: 'GET'});
-        const data = await response.json();
         const processedList = document.getElementById('processedList');
         processedList.innerHTML = '';
- 
-        if (data.files && data.files.length > 0) {
-            data.files.forEach(file => {
-                const listItem = document.createElement('li');
-                listItem.innerHTML = `${file.filename} (${file.size})`;
- 
-                if (file.video_streams || file.audio_streams) {
-                    const detailsList = document.createElement('ul');
-                    
-                    if (file.video_streams?.length > 0) {
-                        file.video_streams.forEach((video, index) => {
-                            const videoItem = document.createElement('li');
-                            videoItem.innerHTML = `Video Stream ${index + 1}: ${video.codec.toUpperCase()}, Resolution: ${video.resolution}, FPS: ${video.fps}`;
-                            detailsList.appendChild(videoItem);
-                        });
-                    }
- 
-                    if (file.audio_streams?.length > 0) {
-                        file.audio_streams.forEach((audio, index) => {
-                            const audioItem = document.createElement('li');
-                            audioItem.innerHTML = `Audio Stream ${index + 1}: ${audio.codec.toUpperCase()}, Language: ${audio.language.toUpperCase()}`;
-                            detailsList.appendChild(audioItem);
-                        });
-                    }
- 
-                    listItem.appendChild(detailsList);
-                }
- 
-                processedList.appendChild(listItem);
-            });
-        } else {
+
+        const count = await streamListing(CONFIG.API_URL + CONFIG.ENDPOINTS.PROCESS.READY, processedList, file => {
+            const listItem = document.createElement('li');
+            listItem.innerHTML = `${file.filename} (${file.size})`;
+
+            if (file.video_streams || file.audio_streams) {
+                listItem.appendChild(buildStreamDetails(file));
+            }
+
+            processedList.appendChild(listItem);
+        });
+
+        if (count === 0) {
             const listItem = document.createElement('li');
             listItem.textContent = 'No processed files yet';
             processedList.appendChild(listItem);
@@ -222,30 +281,35 @@ async function processVideo(filename) {
     }
  }
 
-async function pollProcessingStatus(taskId) {
-   const pollInterval = setInterval(async () => {
-       try {
-            const response = await fetch(CONFIG.API_URL + CONFIG.ENDPOINTS.PROCESS.STATUS + taskId, {method: 'GET'});
-            if (response.ok) {
-               const data = await response.json();
-               
-               switch(data.status) {
-                   case 'completed':
-                       showMessage(`Processing completed: ${data.filename}`, 'success');
-                       clearInterval(pollInterval);
-                       fetchProcessedFiles(); // Refresh processed files list
-                       break;
-                   case 'error':
-                       showMessage(`Processing error: ${data.error}`, 'error');
-                       clearInterval(pollInterval);
-                       break;
-               }
-           }
-       } catch (error) {
-           console.error('Error checking status:', error);
-           clearInterval(pollInterval);
-       }
-   }, 5000); // Check every 5 seconds
+function pollProcessingStatus(taskId) {
+    // El servidor empuja el estado y el progreso por SSE; no hace falta sondear /status.
+    const events = new EventSource(CONFIG.API_URL + CONFIG.ENDPOINTS.PROCESS.EVENTS + taskId);
+
+    events.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+
+        if (data.status === 'processing' && data.progress) {
+            const eta = data.progress.eta != null ? `, ETA ${data.progress.eta}s` : '';
+            console.log(`Processing ${data.filename}: ${data.progress.percent ?? '?'}% at ${data.progress.speed}x${eta}`);
+        }
+
+        switch(data.status) {
+            case 'completed':
+                showMessage(`Processing completed: ${data.filename}`, 'success');
+                events.close();
+                fetchProcessedFiles(); // Refresh processed files list
+                break;
+            case 'error':
+                showMessage(`Processing error: ${data.error}`, 'error');
+                events.close();
+                break;
+        }
+    };
+
+    events.onerror = (error) => {
+        // EventSource se reconecta solo; si el servidor rechaza la conexión queda cerrado
+        console.error('Error checking status:', error);
+    };
 }
 
 // Inicializar la carga de archivos
@@ -0,0 +1,2 @@
+#!/bin/bash
+cd /var/www/vault/app/api && /var/www/vault/.env/bin/python worker.py "$@"